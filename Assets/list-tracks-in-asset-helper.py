@@ -150,11 +150,7 @@ async def main():
 
     print(f"Creating transform {transform_name}")
     try:
-      await client.transforms.create_or_update(
-        resource_group_name=resource_group,
-        account_name=account_name,
-        transform_name=transform_name,
-        parameters=my_transform)
+      await mymodule.create_or_update_transform(transform_name, my_transform)
       print(f"{transform_name} created (or updated if it existed already). ")
       print()
     except:
@@ -184,6 +180,10 @@ async def main():
         async for track in client.tracks.list(resource_group, account_name, output_asset_name):
             print(f"Track Name: {track.name} \t Track: {track.track}")
 
+  # closing the pooled blob clients
+  print('Closing blob clients')
+  await mymodule.close_blob_clients()
+
   # closing media client
   print('Closing media client')
   await client.close()
@@ -90,11 +90,7 @@ async def main():
 
     print(f"Creating transform {transform_name}")
     try:
-      await client.transforms.create_or_update(
-        resource_group_name=resource_group,
-        account_name=account_name,
-        transform_name=transform_name,
-        parameters=my_transform)
+      await mymodule.create_or_update_transform(transform_name, my_transform)
       print(f"{transform_name} created (or updated if it existed already). ")
       print()
     except:
@@ -123,6 +119,10 @@ async def main():
       await mymodule.download_results(output_asset_name, output_folder)
       print("Downloaded results to local folder. Please review the outputs from the encoding job.")
 
+  # closing the pooled blob clients
+  print('Closing blob clients')
+  await mymodule.close_blob_clients()
+
   # closing media client
   print('Closing media client')
   await client.close()
@@ -0,0 +1,328 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# End-to-end benchmark for the hot paths in Common/encoding_job_helpers.py, run against the local
+# emulator in Emulator/ams_emulator.py so that no Azure subscription is needed.
+#
+# Every scenario is run at each concurrency level (1, 10, 100 and 1000 by default) and reports
+# p50/p99 latency per call, management and storage requests per job, peak RSS and event loop lag.
+# The results are written as JSON so that two runs (e.g. two commits) can be compared:
+#
+#   python Benchmarks/encoding_helpers_benchmark.py --output bench-new.json
+#   python Benchmarks/encoding_helpers_benchmark.py --output bench-new.json --compare bench-old.json
+#
+# The submit_job_paced scenario submits through a client paced by Common/arm_request_scheduler.py
+# (see --arm-rate), and --throttle-rate makes the emulator answer a fraction of requests with 429.
+#
+# Run it from the root of the repo, like the samples.
+
+from datetime import datetime, timezone
+from importlib.machinery import SourceFileLoader
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+from azure.mgmt.media.models import (
+    Transform,
+    TransformOutput,
+    BuiltInStandardEncoderPreset,
+    EncoderNamedPreset,
+    JobInputAsset
+)
+
+emulator_module = SourceFileLoader("ams_emulator", "Emulator/ams_emulator.py").load_module()
+helpers = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+scheduler_module = SourceFileLoader("arm_request_scheduler", "Common/arm_request_scheduler.py").load_module()
+
+resource_group = "benchmark-rg"
+account_name = "benchmarkaccount"
+transform_name = "BenchmarkTransform"
+
+all_scenarios = (
+    "submit_job",
+    "submit_job_paced",
+    "create_input_asset",
+    "wait_for_job_to_finish",
+    "job_watcher",
+    "wait_for_all_jobs_to_finish",
+    "wait_for_all_jobs_to_finish_list",
+    "download_results"
+)
+
+
+# Runs the emulator on its own event loop in a background thread, so that its work doesn't show up
+# as event loop lag in the process under test
+class EmulatorThread:
+    def __init__(self, config):
+        self.emulator = emulator_module.AmsEmulator(config)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return asyncio.run_coroutine_threadsafe(self.emulator.start(), self.loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.emulator.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def request_count(self):
+        return sum(self.emulator.request_counts.copy().values())
+
+
+# Measures how late the event loop wakes up a task that sleeps for interval seconds
+class LoopLagMonitor:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        return self.samples
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def timed(latencies, coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    latencies.append(time.perf_counter() - start)
+    return result
+
+
+class Benchmark:
+    def __init__(self, context, emulator, work_folder, poll_interval, paced_context=None, scheduler=None):
+        self.context = context
+        self.paced_context = paced_context
+        self.scheduler = scheduler
+        self.emulator = emulator
+        self.work_folder = work_folder
+        self.poll_interval = poll_interval
+        self.input_asset_name = "benchmark-input"
+
+    async def setup(self):
+        client = self.context.client
+        transform = Transform(outputs=[TransformOutput(preset=BuiltInStandardEncoderPreset(preset_name=EncoderNamedPreset.CONTENT_AWARE_ENCODING))])
+        await client.transforms.create_or_update(resource_group, account_name, transform_name, transform)
+        await helpers.create_input_asset(self.input_asset_name, "input.mp4", context=self.context)
+
+    async def submit_jobs(self, prefix, count):
+        async def submit(index):
+            output_asset_name = f"{prefix}-output-{index}"
+            await self.context.client.assets.create_or_update(resource_group, account_name, output_asset_name, {})
+            return await helpers.submit_job(transform_name, f"{prefix}-job-{index}", JobInputAsset(asset_name=self.input_asset_name), output_asset_name, context=self.context)
+        return await asyncio.gather(*(submit(index) for index in range(count)))
+
+    async def wait_for_jobs(self, jobs):
+        async with helpers.JobWatcher(min_interval=self.poll_interval, max_interval=self.poll_interval * 4, context=self.context) as watcher:
+            return await watcher.wait_all(transform_name, [job.name for job in jobs])
+
+    # Every scenario does its setup first, then returns the coroutines whose latency is measured
+    async def prepare(self, scenario, prefix, count):
+        if scenario in ("submit_job", "submit_job_paced"):
+            context = self.paced_context if scenario == "submit_job_paced" else self.context
+            for index in range(count):
+                await self.context.client.assets.create_or_update(resource_group, account_name, f"{prefix}-output-{index}", {})
+            return [helpers.submit_job(transform_name, f"{prefix}-job-{index}", JobInputAsset(asset_name=self.input_asset_name), f"{prefix}-output-{index}", context=context)
+                    for index in range(count)]
+
+        if scenario == "create_input_asset":
+            return [helpers.create_input_asset(f"{prefix}-input-{index}", "input.mp4", context=self.context) for index in range(count)]
+
+        if scenario == "download_results":
+            jobs = await self.submit_jobs(prefix, count)
+            await self.wait_for_jobs(jobs)
+            return [helpers.download_results(f"{prefix}-output-{index}", self.work_folder, context=self.context) for index in range(count)]
+
+        jobs = await self.submit_jobs(prefix, count)
+        if scenario == "wait_for_job_to_finish":
+            return [helpers.wait_for_job_to_finish(transform_name, job.name, sleep_interval=self.poll_interval, context=self.context) for job in jobs]
+        if scenario == "job_watcher":
+            return [self.wait_for_jobs(jobs)]
+        if scenario == "wait_for_all_jobs_to_finish":
+            return [helpers.wait_for_all_jobs_to_finish(transform_name, jobs, "benchmark", 1, sleep_interval=self.poll_interval, context=self.context)]
+        if scenario == "wait_for_all_jobs_to_finish_list":
+            return [helpers.wait_for_all_jobs_to_finish(transform_name, jobs, "benchmark", 1, use_list_refresh=True, sleep_interval=self.poll_interval, context=self.context)]
+        raise ValueError(f"Unknown scenario {scenario}")
+
+    async def run(self, scenario, count):
+        prefix = f"{scenario.replace('_', '-')}-{count}-{int(time.time() * 1000)}"
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            coroutines = await self.prepare(scenario, prefix, count)
+
+            requests_before = self.emulator.request_count()
+            throttled_before = sum(self.scheduler.throttled_count.values()) if self.scheduler else 0
+            latencies = []
+            monitor = LoopLagMonitor()
+            monitor.start()
+            start = time.perf_counter()
+            results = await asyncio.gather(*(timed(latencies, coroutine) for coroutine in coroutines), return_exceptions=True)
+            wall_seconds = time.perf_counter() - start
+            lag = await monitor.stop()
+            requests = self.emulator.request_count() - requests_before
+            throttled = sum(self.scheduler.throttled_count.values()) - throttled_before if self.scheduler else 0
+
+        errors = sum(1 for result in results if isinstance(result, Exception))
+        return {
+            "scenario": scenario,
+            "concurrency": count,
+            "calls": len(coroutines),
+            "errors": errors,
+            "wall_seconds": round(wall_seconds, 4),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "requests": requests,
+            "requests_per_job": round(requests / count, 3),
+            "throttled": throttled if scenario == "submit_job_paced" else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+            "loop_lag_p99_ms": round(percentile(lag, 0.99) * 1000, 3) if lag else None,
+            "loop_lag_max_ms": round(max(lag) * 1000, 3) if lag else None
+        }
+
+
+def print_results(results):
+    print(f"{'scenario':34} {'n':>5} {'p50 ms':>10} {'p99 ms':>10} {'req/job':>8} {'rss MB':>8} {'lag p99':>8} {'errors':>6}")
+    for result in results:
+        print(f"{result['scenario']:34} {result['concurrency']:>5} {result['p50_ms'] or 0:>10.1f} {result['p99_ms'] or 0:>10.1f} "
+              f"{result['requests_per_job']:>8.2f} {result['peak_rss_mb'] or 0:>8.1f} {result['loop_lag_p99_ms'] or 0:>8.1f} {result['errors']:>6}")
+
+
+# Prints the change of each metric against a previous results file
+def compare_results(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {(result["scenario"], result["concurrency"]): result for result in baseline["results"]}
+    print()
+    print(f"Compared with {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'scenario':34} {'n':>5} {'p50':>9} {'p99':>9} {'req/job':>9}")
+
+    def change(new, old):
+        if not new or not old:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    for result in results:
+        old = previous.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        print(f"{result['scenario']:34} {result['concurrency']:>5} {change(result['p50_ms'], old['p50_ms']):>9} "
+              f"{change(result['p99_ms'], old['p99_ms']):>9} {change(result['requests_per_job'], old['requests_per_job']):>9}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the encoding job helper hot paths against the local emulator")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--scenarios", nargs="+", choices=all_scenarios, default=list(all_scenarios))
+    parser.add_argument("--latency", type=float, default=0.005, help="Emulator latency per request in seconds")
+    parser.add_argument("--job-duration", type=float, default=1.0, help="Seconds a job spends in Processing")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Job polling interval used by the wait helpers")
+    parser.add_argument("--file-size", type=int, default=256 * 1024, help="Size of the uploaded input file in bytes")
+    parser.add_argument("--output-size", type=int, default=64 * 1024, help="Size of the output blob each job produces in bytes")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of emulator requests that are throttled with 429")
+    parser.add_argument("--arm-rate", type=float, default=200.0, help="Requests per second of each operation class in the submit_job_paced scenario")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="A previous results file to compare against")
+    args = parser.parse_args()
+
+    config = emulator_module.EmulatorConfig(latency=args.latency, job_queue_seconds=0.1, job_duration=args.job_duration,
+                                            output_blob_size=args.output_size, throttle_rate=args.throttle_rate, retry_after=0, seed=1)
+    emulator = EmulatorThread(config)
+    base_url = emulator.start()
+
+    work_folder = tempfile.mkdtemp(prefix="ams-benchmark-")
+    with open(os.path.join(work_folder, "input.mp4"), "wb") as input_file:
+        input_file.write(os.urandom(args.file_size))
+    helpers.media_folder = work_folder + os.sep
+
+    client = emulator_module.create_emulator_client(base_url)
+    context = helpers.AmsContext(client, resource_group, account_name)
+    # The same emulator account, with every ARM request paced by the scheduler
+    scheduler = scheduler_module.ArmRequestScheduler({operation_class: args.arm_rate for operation_class in scheduler_module.OPERATION_CLASSES},
+                                                     global_rate=args.arm_rate)
+    paced_client = emulator_module.create_emulator_client(base_url, per_retry_policies=[scheduler_module.ArmThrottlingPolicy(scheduler)])
+    paced_context = helpers.AmsContext(paced_client, resource_group, account_name)
+    benchmark = Benchmark(context, emulator, work_folder, args.poll_interval, paced_context, scheduler)
+    results = []
+    try:
+        await benchmark.setup()
+        for scenario in args.scenarios:
+            for count in args.concurrency:
+                print(f"Running {scenario} with {count} concurrent jobs...")
+                results.append(await benchmark.run(scenario, count))
+    finally:
+        await helpers.close_blob_clients()
+        await context.close()
+        await paced_context.close()
+        await scheduler.close()
+        emulator.stop()
+
+    print()
+    print_results(results)
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results
+    }
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
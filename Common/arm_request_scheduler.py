@@ -0,0 +1,238 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Paces the requests that the AMS client sends to Azure Resource Manager so that a busy process
+# doesn't run into 429 throttling storms.
+#
+# Every request is put into an operation class (job submission, other writes, reads and lists).
+# Each class has its own token bucket, and all classes also share one global bucket. When the global bucket
+# is the bottleneck, waiting requests are served in priority order, so job submission goes ahead of listing.
+# The rate of a class is cut when ARM answers with 429 (and the class pauses for the Retry-After time),
+# slowed down when the x-ms-ratelimit-remaining-* headers run low, and slowly raised again on success.
+#
+# Usage:
+#   scheduler_module = SourceFileLoader("arm_request_scheduler", "Common/arm_request_scheduler.py").load_module()
+#   client = scheduler_module.create_media_services_client(default_credential, subscription_id)
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import asyncio
+import collections
+import time
+from azure.core.pipeline.policies import AsyncHTTPPolicy
+from azure.mgmt.media.aio import AzureMediaServices
+
+# Operation classes, in priority order
+SUBMIT = "submit"
+WRITE = "write"
+READ = "read"
+LIST = "list"
+OPERATION_CLASSES = (SUBMIT, WRITE, READ, LIST)
+
+# Starting requests per second for each operation class and for the shared global bucket
+default_rates = {
+    SUBMIT: 10.0,
+    WRITE: 5.0,
+    READ: 20.0,
+    LIST: 5.0
+}
+default_global_rate = 25.0
+
+# The last path segment of a GET that lists a collection
+list_collections = {
+    "assets", "transforms", "jobs", "streaminglocators", "streamingpolicies", "contentkeypolicies",
+    "liveevents", "liveoutputs", "streamingendpoints", "assetfilters", "accountfilters", "tracks", "mediaservices"
+}
+
+# Requests left (as reported by ARM) below which the rate of a class is cut
+remaining_low_water_mark = 100
+
+
+# Works out the operation class of an ARM request from its method and URL
+def classify_request(method, url):
+    segments = [segment.lower() for segment in urlparse(url).path.strip("/").split("/")]
+    method = method.upper()
+    if method == "GET":
+        return LIST if segments and segments[-1] in list_collections else READ
+    if method == "PUT" and len(segments) >= 2 and segments[-2] == "jobs":
+        return SUBMIT
+    return WRITE
+
+
+# Returns the number of seconds to wait from the Retry-After (or x-ms-retry-after-ms) header of a response
+def get_retry_after(headers, default=1.0):
+    retry_after_ms = headers.get("x-ms-retry-after-ms") or headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return default
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None, min_rate=0.1, max_rate=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate * 4
+        self.tokens = self.burst
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    # Seconds until a token is available, 0 if one is available now
+    def delay(self, now):
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def throttle(self, now, pause_seconds, factor=0.5):
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.paused_until = max(self.paused_until, now + pause_seconds)
+
+    def slow_down(self, factor=0.8):
+        self.rate = max(self.min_rate, self.rate * factor)
+
+    def recover(self, step=0.1):
+        self.rate = min(self.max_rate, self.rate + step)
+
+
+class ArmRequestScheduler:
+    def __init__(self, rates=None, global_rate=default_global_rate):
+        rates = dict(default_rates, **(rates or {}))
+        self.buckets = {operation_class: TokenBucket(rates[operation_class]) for operation_class in OPERATION_CLASSES}
+        self.global_bucket = TokenBucket(global_rate)
+        self.throttled_count = collections.Counter()
+        self.request_count = collections.Counter()
+        self._waiters = {operation_class: collections.deque() for operation_class in OPERATION_CLASSES}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # Waits until a request of the given operation class may be sent
+    async def acquire(self, operation_class):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[operation_class].append(future)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        await future
+        self.request_count[operation_class] += 1
+
+    # Adjusts the rates from the status code and headers of an ARM response
+    def record_response(self, operation_class, status_code, headers):
+        bucket = self.buckets[operation_class]
+        now = time.monotonic()
+        if status_code == 429:
+            pause = get_retry_after(headers)
+            print(f"ARM throttled a {operation_class} request, pausing for {pause:.1f}s")
+            self.throttled_count[operation_class] += 1
+            bucket.throttle(now, pause)
+            self.global_bucket.throttle(now, pause, factor=0.75)
+            return
+
+        remaining_header = "x-ms-ratelimit-remaining-subscription-reads" if operation_class in (READ, LIST) else "x-ms-ratelimit-remaining-subscription-writes"
+        remaining = headers.get(remaining_header)
+        try:
+            remaining = int(remaining) if remaining is not None else None
+        except ValueError:
+            remaining = None
+        if remaining is not None and remaining < remaining_low_water_mark:
+            bucket.slow_down()
+        elif status_code < 400:
+            bucket.recover()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _dispatch(self):
+        while True:
+            if not any(self._waiters.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            next_delay = None
+            released = False
+            for operation_class in OPERATION_CLASSES:
+                waiters = self._waiters[operation_class]
+                while waiters and waiters[0].done():
+                    # The caller gave up (e.g. it was cancelled)
+                    waiters.popleft()
+                if not waiters:
+                    continue
+
+                class_delay = self.buckets[operation_class].delay(now)
+                global_delay = self.global_bucket.delay(now)
+                if class_delay == 0 and global_delay == 0:
+                    self.buckets[operation_class].take()
+                    self.global_bucket.take()
+                    waiters.popleft().set_result(None)
+                    released = True
+                    break
+
+                delay = max(class_delay, global_delay)
+                next_delay = delay if next_delay is None else min(next_delay, delay)
+                if class_delay == 0:
+                    # Only the shared bucket is empty: keep its next token for this class rather than a lower priority one
+                    break
+
+            if released:
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=next_delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Pipeline policy that sends every request (and every retry) through an ArmRequestScheduler
+class ArmThrottlingPolicy(AsyncHTTPPolicy):
+    def __init__(self, scheduler):
+        super().__init__()
+        self.scheduler = scheduler
+
+    async def send(self, request):
+        operation_class = classify_request(request.http_request.method, request.http_request.url)
+        await self.scheduler.acquire(operation_class)
+        response = await self.next.send(request)
+        self.scheduler.record_response(operation_class, response.http_response.status_code, response.http_response.headers)
+        return response
+
+
+# Creates an AMS client whose requests are paced by the given scheduler (or a new one with the default rates).
+# The policy is added per retry, so the retries that the client makes after a 429 are paced as well.
+def create_media_services_client(credential, subscription_id, scheduler=None, **kwargs):
+    if scheduler is None:
+        scheduler = ArmRequestScheduler()
+    per_retry_policies = list(kwargs.pop("per_retry_policies", [])) + [ArmThrottlingPolicy(scheduler)]
+    return AzureMediaServices(credential, subscription_id, per_retry_policies=per_retry_policies, **kwargs)
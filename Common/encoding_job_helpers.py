@@ -1,11 +1,22 @@
 from datetime import date, datetime, timedelta, timezone
 import asyncio
+import base64
+import contextvars
+import copy
+import hashlib
+import heapq
+import json
 import os
-from urllib.parse import urlparse
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+import aiohttp
+from aiohttp import web
 from warnings import catch_warnings
 from azure.mgmt.media.aio import AzureMediaServices
 from azure.identity.aio import DefaultAzureCredential
-from azure.storage.blob.aio import (BlobServiceClient, BlobClient)
+from azure.storage.blob.aio import (BlobServiceClient, BlobClient, ContainerClient)
+from azure.core.pipeline.transport import AioHttpTransport
 from azure.mgmt.media.models import (
     StreamingLocator,
     Job,
@@ -16,7 +27,7 @@ from azure.mgmt.media.models import (
     ListContainerSasInput,
     AudioTrack
 )
-from azure.core.exceptions import (ResourceNotFoundError)
+from azure.core.exceptions import (ResourceNotFoundError, HttpResponseError)
 
 # Get the environment variables SUBSCRIPTION_ID, RESOURCE_GROUP and ACCOUNT_NAME
 
@@ -71,27 +82,203 @@ def create_azure_media_services(ams_account):
     global client
     client = ams_account
 
+# Holds the AMS client, credential and account coordinates for one Media Services account.
+# Every helper in this module takes an optional context argument; pass an AmsContext to drive several
+# accounts from the same process. When no context is passed, the helpers fall back to the module globals
+# set with set_account_name, set_resource_group, create_azure_media_services and friends.
+# The helpers are also available as methods, e.g. await context.submit_job(...).
+class AmsContext:
+    def __init__(self, client, resource_group, account_name, subscription_id=None, credential=None, remote_sas_url=None):
+        self.client = client
+        self.resource_group = resource_group
+        self.account_name = account_name
+        self.subscription_id = subscription_id
+        self.credential = credential
+        self.remote_sas_url = remote_sas_url
+
+    async def close(self):
+        await self.client.close()
+        if self.credential is not None:
+            await self.credential.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def submit_job(self, *args, **kwargs):
+        return await submit_job(*args, context=self, **kwargs)
+
+    async def submit_job_from_template(self, *args, **kwargs):
+        return await submit_job_from_template(*args, context=self, **kwargs)
+
+    async def submit_job_multi_outputs(self, *args, **kwargs):
+        return await submit_job_multi_outputs(*args, context=self, **kwargs)
+
+    async def submit_job_multi_inputs(self, *args, **kwargs):
+        return await submit_job_multi_inputs(*args, context=self, **kwargs)
+
+    async def submit_job_with_input_sequence(self, *args, **kwargs):
+        return await submit_job_with_input_sequence(*args, context=self, **kwargs)
+
+    async def submit_job_with_track_definitions(self, *args, **kwargs):
+        return await submit_job_with_track_definitions(*args, context=self, **kwargs)
+
+    async def create_or_update_transform(self, *args, **kwargs):
+        return await create_or_update_transform(*args, context=self, **kwargs)
+
+    async def create_job(self, *args, **kwargs):
+        return await create_job(*args, context=self, **kwargs)
+
+    async def update_tracks(self, *args, **kwargs):
+        return await update_tracks(*args, context=self, **kwargs)
+
+    async def get_container_sas_url(self, *args, **kwargs):
+        return await get_container_sas_url(*args, context=self, **kwargs)
+
+    async def upload_file(self, *args, **kwargs):
+        return await upload_file(*args, context=self, **kwargs)
+
+    async def create_input_asset(self, *args, **kwargs):
+        return await create_input_asset(*args, context=self, **kwargs)
+
+    async def create_input_assets(self, *args, **kwargs):
+        return await create_input_assets(*args, context=self, **kwargs)
+
+    async def wait_for_job_to_finish(self, *args, **kwargs):
+        return await wait_for_job_to_finish(*args, context=self, **kwargs)
+
+    def job_watcher(self, **kwargs):
+        return JobWatcher(context=self, **kwargs)
+
+    def job_event_receiver(self, **kwargs):
+        return JobEventReceiver(context=self, **kwargs)
+
+    async def list_jobs_by_name(self, *args, **kwargs):
+        return await list_jobs_by_name(*args, context=self, **kwargs)
+
+    async def wait_for_all_jobs_to_finish(self, *args, **kwargs):
+        return await wait_for_all_jobs_to_finish(*args, context=self, **kwargs)
+
+    def encode_preset_overrides(self, *args, **kwargs):
+        return encode_preset_overrides(*args, context=self, **kwargs)
+
+    async def update_job_input_metadata(self, *args, **kwargs):
+        return await update_job_input_metadata(*args, context=self, **kwargs)
+
+    async def download_results(self, *args, **kwargs):
+        return await download_results(*args, context=self, **kwargs)
+
+    async def get_job_input_type(self, *args, **kwargs):
+        return await get_job_input_type(*args, context=self, **kwargs)
+
+    async def create_streaming_locator(self, *args, **kwargs):
+        return await create_streaming_locator(*args, context=self, **kwargs)
+
+    async def get_streaming_urls(self, *args, **kwargs):
+        return await get_streaming_urls(*args, context=self, **kwargs)
+
+    async def build_manifest_paths(self, *args, **kwargs):
+        return await build_manifest_paths(*args, context=self, **kwargs)
+
+
+# Returns the given context, or one built from the module globals for the samples that use the set_* functions
+def get_context(context=None):
+    if context is not None:
+        return context
+    return AmsContext(client, resource_group, account_name, subscription_id, default_credential, remote_sas_url)
+
 # Since the media folder would have a different relative path, his sets the location of the media files
 # so that it is relative to the helper function script. All that is passed to the helper function is the file name.
 
 media_folder = "C:\\absolute\\path\\to\\Media\\"
 
-async def submit_job(transform_name, job_name, job_input, output_asset_name, preset_override = None):
+# Job states after which a job will not change anymore
+JOB_FINAL_STATES = ('Finished', 'Error', 'Canceled')
+
+async def submit_job(transform_name, job_name, job_input, output_asset_name, preset_override = None, context=None):
+    ctx = get_context(context)
     if output_asset_name is None:
         raise ValueError("OutputAsset Name is not defined. Check creation of the output asset")
 
     job_outputs = [JobOutputAsset(asset_name=output_asset_name, preset_override=preset_override)]
     the_job = Job(input=job_input, outputs=job_outputs)
 
-    return await client.jobs.create(resource_group, account_name, transform_name, job_name, parameters=the_job)
+    return await create_job(transform_name, job_name, the_job, context=ctx)
+
+
+# Serializes the output layout of a job (presets, preset overrides, labels, priority...) once, so that submitting many
+# jobs with the same layout skips building and serializing the Job model graph every time. Each submission only
+# splices the job input and the output asset names into the cached JSON body.
+# job_outputs is a list of JobOutputAsset; their asset names are placeholders and are replaced on every submission.
+class JobTemplate:
+    input_placeholder = "__ams_job_template_input__"
+    output_placeholder = "__ams_job_template_output_{}__"
+
+    def __init__(self, job_outputs, description=None, priority=None, correlation_data=None):
+        # Work on a copy, so that the caller's JobOutputAsset objects keep their asset names
+        job_outputs = copy.deepcopy(job_outputs)
+        for index, job_output in enumerate(job_outputs):
+            job_output.asset_name = self.output_placeholder.format(index)
+        job = Job(input=JobInputAsset(asset_name=self.input_placeholder), outputs=job_outputs,
+                  description=description, priority=priority, correlation_data=correlation_data)
+        body = json.dumps(job.serialize())
+        self.output_count = len(job_outputs)
+
+        # Split the body around the placeholders so that a submission is just a join of the fragments
+        input_json = json.dumps(JobInputAsset(asset_name=self.input_placeholder).serialize())
+        if input_json not in body:
+            raise ValueError("Could not find the job input in the serialized job.")
+        self._fragments = []
+        self._slots = []
+        remaining = body.replace(input_json, json.dumps(self.input_placeholder))
+        placeholders = [(None, json.dumps(self.input_placeholder))] + [(index, json.dumps(self.output_placeholder.format(index))) for index in range(self.output_count)]
+        while True:
+            found = [(remaining.find(text), slot, text) for slot, text in placeholders if remaining.find(text) >= 0]
+            if not found:
+                break
+            position, slot, text = min(found)
+            self._fragments.append(remaining[:position])
+            self._slots.append(slot)
+            remaining = remaining[position + len(text):]
+        self._fragments.append(remaining)
+
+    # Builds the request body for one job. job_input is an input asset name or a JobInput model.
+    def build_body(self, job_input, output_asset_names):
+        if isinstance(output_asset_names, str):
+            output_asset_names = [output_asset_names]
+        if len(output_asset_names) != self.output_count:
+            raise ValueError(f"The job template has {self.output_count} outputs but {len(output_asset_names)} output asset names were given.")
+        if isinstance(job_input, str):
+            input_json = json.dumps({"@odata.type": "#Microsoft.Media.JobInputAsset", "assetName": job_input})
+        else:
+            input_json = json.dumps(job_input.serialize())
+
+        parts = [self._fragments[0]]
+        for slot, fragment in zip(self._slots, self._fragments[1:]):
+            parts.append(input_json if slot is None else json.dumps(output_asset_names[slot]))
+            parts.append(fragment)
+        return "".join(parts).encode("utf-8")
+
+
+# Submits a job from a JobTemplate. The cached body is sent as is, without going through the model serializer.
+async def submit_job_from_template(transform_name, job_name, job_template, job_input, output_asset_names, context=None):
+    ctx = get_context(context)
+    if not output_asset_names:
+        raise ValueError("OutputAsset Name is not defined. Check creation of the output asset")
+    body = job_template.build_body(job_input, output_asset_names)
+    return await create_job(transform_name, job_name, body, content_type="application/json", context=ctx)
 
 
-async def submit_job_multi_outputs(transform_name, job_name, job_input, job_outputs):
+async def submit_job_multi_outputs(transform_name, job_name, job_input, job_outputs, context=None):
+    ctx = get_context(context)
     the_job = Job(input=job_input, outputs=job_outputs)
-    return await client.jobs.create(resource_group, account_name, transform_name, job_name, parameters=the_job)
+    return await create_job(transform_name, job_name, the_job, context=ctx)
 
 
-async def submit_job_multi_inputs(transform_name, job_name, job_inputs, output_asset_name):
+async def submit_job_multi_inputs(transform_name, job_name, job_inputs, output_asset_name, context=None):
+    ctx = get_context(context)
     if output_asset_name is None:
         raise ValueError("OutputAsset Name is not defined. Check creation of the output asset")
 
@@ -99,20 +286,22 @@ async def submit_job_multi_inputs(transform_name, job_name, job_inputs, output_a
     job_outputs = [JobOutputAsset(asset_name=output_asset_name)]
     the_job = Job(input=job_inputs, outputs=job_outputs)
 
-    return await client.jobs.create(resource_group, account_name, transform_name, job_name, parameters=the_job)
+    return await create_job(transform_name, job_name, the_job, context=ctx)
 
 
-async def submit_job_with_input_sequence(transform_name, job_name, input_sequence, output_asset_name):
+async def submit_job_with_input_sequence(transform_name, job_name, input_sequence, output_asset_name, context=None):
+    ctx = get_context(context)
     if output_asset_name is None:
         raise ValueError("OutputAsset Name is not defined. Check creation of the output asset")
 
     job_outputs = [JobOutputAsset(asset_name=output_asset_name)]
     the_job = Job(input=input_sequence, outputs=job_outputs)
 
-    return await client.jobs.create(resource_group, account_name, transform_name, job_name, parameters=the_job)
+    return await create_job(transform_name, job_name, the_job, context=ctx)
 
 
-async def submit_job_with_track_definitions(transform_name, job_name, job_input, output_asset_name, input_definitions):
+async def submit_job_with_track_definitions(transform_name, job_name, job_input, output_asset_name, input_definitions, context=None):
+    ctx = get_context(context)
     if output_asset_name is None:
         raise ValueError("OutputAsset Name is not defined. Check creation of the output asset")
 
@@ -122,34 +311,271 @@ async def submit_job_with_track_definitions(transform_name, job_name, job_input,
     job_outputs = [JobOutputAsset(asset_name=output_asset_name)]
     the_job = Job(input=job_input_with_track_definitions, outputs=job_outputs)
 
-    return await client.jobs.create(resource_group, account_name, transform_name, job_name, parameters=the_job)
+    return await create_job(transform_name, job_name, the_job, context=ctx)
+
+# Transform definitions that were written are remembered by content hash in this file, so a worker that starts
+# with an unchanged definition doesn't need to call the service at all
+transform_cache_path = os.path.join(tempfile.gettempdir(), "ams-transform-cache.json")
+# How long a cached transform hash is trusted before the transform is compared with the service again
+transform_cache_ttl_seconds = 60 * 60
+# The transforms written or checked by create_or_update_transform in this process, so that create_job can put one back
+# if it was deleted from the account while the local cache still has it
+ensured_transforms = {}
+
+# The parts of a Transform that define what it does, as serialized JSON
+def get_transform_definition(transform):
+    serialized = transform.serialize(keep_readonly=False)
+    definition = serialized.get("properties", serialized)
+    return {key: definition[key] for key in ("description", "outputs") if key in definition}
+
+
+# Keeps only the keys of value that are also set in template. The service fills in defaults (onError,
+# relativePriority, ...) that the caller's sparse model leaves out, which would otherwise never compare equal.
+def select_definition_keys(value, template):
+    if isinstance(template, dict) and isinstance(value, dict):
+        return {key: select_definition_keys(value.get(key), sub_template) for key, sub_template in template.items()}
+    if isinstance(template, list) and isinstance(value, list) and len(template) == len(value):
+        return [select_definition_keys(item, sub_template) for item, sub_template in zip(value, template)]
+    return value
+
+
+# Hashes the parts of a Transform that define what it does. With template (a definition from
+# get_transform_definition), only the fields set in the template are hashed.
+def get_transform_hash(transform, template=None):
+    definition = get_transform_definition(transform)
+    if template is not None:
+        definition = select_definition_keys(definition, template)
+    return hashlib.sha256(json.dumps(definition, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_transform_cache():
+    try:
+        with open(transform_cache_path, "r") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Every writer uses a temp file of its own, so processes sharing the cache never replace it with a half-written file
+def save_transform_cache(cache):
+    temp_path = None
+    try:
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(transform_cache_path), prefix="ams-transform-cache-",
+                                         suffix=".tmp", delete=False) as cache_file:
+            temp_path = cache_file.name
+            json.dump(cache, cache_file)
+        os.replace(temp_path, transform_cache_path)
+    except OSError as err:
+        print(f"Could not write the transform cache: {err}")
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+# Creates the transform, or updates it only if its definition differs from the one in the account.
+# The definition is first compared with the locally cached hash (no service call at all), then with the transform
+# returned by a single transforms.get. create_or_update is only called when the definition actually changed.
+# Cached hashes expire after transform_cache_ttl_seconds, and create_job writes the transform again if a job
+# submission finds it missing, so a transform deleted from the account doesn't stay hidden behind the cache.
+# Set verify to True to skip the local cache and always compare with the service.
+# Returns True if the transform was written.
+async def create_or_update_transform(transform_name, transform, verify=False, context=None):
+    ctx = get_context(context)
+    cache_key = f"{ctx.subscription_id}/{ctx.resource_group}/{ctx.account_name}/{transform_name}"
+    transform_hash = get_transform_hash(transform)
+    ensured_transforms[cache_key] = transform
+    cache = load_transform_cache()
+    cached = cache.get(cache_key)
+    if not verify and isinstance(cached, list) and cached[0] == transform_hash and time.time() - cached[1] < transform_cache_ttl_seconds:
+        print(f"Transform {transform_name} is unchanged (cached), skipping the update.")
+        return False
 
-async def update_tracks(asset_name,track_name, parameters):
     try:
-        await client.tracks.begin_create_or_update(resource_group_name=resource_group,account_name=account_name,asset_name=asset_name,track_name=track_name,parameters=parameters)
+        existing = await ctx.client.transforms.get(ctx.resource_group, ctx.account_name, transform_name)
+    except ResourceNotFoundError:
+        existing = None
+
+    if existing is not None and get_transform_hash(existing, template=get_transform_definition(transform)) == transform_hash:
+        print(f"Transform {transform_name} is unchanged, skipping the update.")
+        written = False
+    else:
+        await ctx.client.transforms.create_or_update(ctx.resource_group, ctx.account_name, transform_name, parameters=transform)
+        written = True
+
+    cache[cache_key] = [transform_hash, time.time()]
+    save_transform_cache(cache)
+    return written
+
+
+# Submits a job. If the transform is not found and create_or_update_transform set it up in this process,
+# the transform is written again and the submission retried once.
+async def create_job(transform_name, job_name, parameters, context=None, **kwargs):
+    ctx = get_context(context)
+    try:
+        return await ctx.client.jobs.create(ctx.resource_group, ctx.account_name, transform_name, job_name, parameters=parameters, **kwargs)
+    except ResourceNotFoundError:
+        transform = ensured_transforms.get(f"{ctx.subscription_id}/{ctx.resource_group}/{ctx.account_name}/{transform_name}")
+        if transform is None:
+            raise
+        print(f"Transform {transform_name} was not found, creating it again.")
+        await create_or_update_transform(transform_name, transform, verify=True, context=ctx)
+        return await ctx.client.jobs.create(ctx.resource_group, ctx.account_name, transform_name, job_name, parameters=parameters, **kwargs)
+
+
+async def update_tracks(asset_name,track_name, parameters, context=None):
+    ctx = get_context(context)
+    try:
+        await ctx.client.tracks.begin_create_or_update(resource_group_name=ctx.resource_group,account_name=ctx.account_name,asset_name=asset_name,track_name=track_name,parameters=parameters)
     except Exception as e:
         print(e)
 
-async def upload_file(asset_name,input_file):
-# Set permissions for SAS URL and expiry time (for the sample, we used expiry time to be 1 additional hours from current time)
-    print("Setting permissions for SAS URL and expiry time.")
+# Container SAS URLs are cached per (subscription, resource group, account, asset, permissions) and reused until
+# sas_expiry_margin before they expire. Concurrent requests for the same key share a single list_container_sas call.
+# The entries of an asset are dropped with invalidate_container_sas() when the asset is deleted or recreated.
+sas_expiry_hours = 24
+sas_expiry_margin = timedelta(minutes=5)
+sas_url_cache = {}
+pending_sas_requests = {}
+
+async def get_container_sas_url(asset_name, permissions, context=None):
+    ctx = get_context(context)
+    key = (ctx.subscription_id, ctx.resource_group, ctx.account_name, asset_name, permissions)
+    cached = sas_url_cache.get(key)
+    if cached is not None and datetime.now(timezone.utc) < cached[1] - sas_expiry_margin:
+        return cached[0]
+
+    pending = pending_sas_requests.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(fetch_container_sas_url(key, asset_name, permissions, context=ctx))
+        pending_sas_requests[key] = pending
+        pending.add_done_callback(lambda done: pending_sas_requests.pop(key) if pending_sas_requests.get(key) is done else None)
+
+    sas_url, expiry_time = await asyncio.shield(pending)
+    return sas_url
+
+
+async def fetch_container_sas_url(key, asset_name, permissions, context=None):
+    sas_url, expiry_time = await list_container_sas_url(asset_name, permissions, context=context)
+    # A request that was invalidated while in flight may have listed the SAS of the old container, so it isn't cached
+    if sas_url and pending_sas_requests.get(key) is asyncio.current_task():
+        sas_url_cache[key] = (sas_url, expiry_time)
+    return sas_url, expiry_time
+
+
+async def list_container_sas_url(asset_name, permissions, context=None):
     # Make sure that the expiry time is far enough in the future that you can keep using it until you are done testing.
-    input = ListContainerSasInput(permissions="ReadWrite", expiry_time=datetime.now(timezone.utc)+timedelta(hours=24))
-    print("Listing the container sas.")
-    list_container_sas = await client.assets.list_container_sas(resource_group, account_name, asset_name, parameters=input)
+    ctx = get_context(context)
+    expiry_time = datetime.now(timezone.utc) + timedelta(hours=sas_expiry_hours)
+    input = ListContainerSasInput(permissions=permissions, expiry_time=expiry_time)
+    list_container_sas = await ctx.client.assets.list_container_sas(ctx.resource_group, ctx.account_name, asset_name, parameters=input)
     if list_container_sas.asset_container_sas_urls:
-        upload_sas_url = list_container_sas.asset_container_sas_urls[0]
+        return list_container_sas.asset_container_sas_urls[0], expiry_time
+    return None, expiry_time
+
+
+# Drops the cached and pending SAS URLs for an asset, e.g. after the asset was deleted.
+# When the asset's current container name is given, the entries are only dropped if they point to another container,
+# which is the case when the asset was deleted and created again under the same name.
+def invalidate_container_sas(asset_name, container=None, context=None):
+    ctx = get_context(context)
+    asset_key = (ctx.subscription_id, ctx.resource_group, ctx.account_name, asset_name)
+    for key in [key for key in sas_url_cache if key[:4] == asset_key]:
+        if container is None or urlparse(sas_url_cache[key][0]).path.rstrip("/").split("/")[-1] != container:
+            del sas_url_cache[key]
+    if container is None:
+        for key in [key for key in pending_sas_requests if key[:4] == asset_key]:
+            del pending_sas_requests[key]
+
+
+# Blob clients share one aiohttp session (connection pool) per storage account host, so TLS sessions and
+# keep-alive connections are reused across uploads and downloads. Container clients are cached per container and
+# are closed together with the sessions by close_blob_clients(), which should be called once at shutdown.
+blob_pool_size = 100
+blob_keepalive_seconds = 30
+blob_sessions = {}
+blob_container_clients = {}
+blob_client_closes = set()
+
+def set_blob_pool_options(pool_size, keepalive_seconds):
+    global blob_pool_size, blob_keepalive_seconds
+    blob_pool_size = pool_size
+    blob_keepalive_seconds = keepalive_seconds
+
+
+def get_blob_transport(url):
+    host = urlparse(url).netloc
+    session = blob_sessions.get(host)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=blob_pool_size, keepalive_timeout=blob_keepalive_seconds)
+        session = aiohttp.ClientSession(connector=connector)
+        blob_sessions[host] = session
+    # The transport does not own the session, so closing a single client leaves the pool open for the others
+    return LimitedAioHttpTransport(session=session, session_owner=False)
+
+
+# Blob requests sent while blob_request_limit holds a semaphore (set by create_input_assets around its uploads)
+# each take a slot of it, so the block uploads count against the same request cap as the management-plane calls.
+blob_request_limit = contextvars.ContextVar("blob_request_limit", default=None)
+
+class LimitedAioHttpTransport(AioHttpTransport):
+    async def send(self, request, **config):
+        semaphore = blob_request_limit.get()
+        if semaphore is None:
+            return await super().send(request, **config)
+        async with semaphore:
+            return await super().send(request, **config)
+
+
+# Clients are cached per container and SAS permissions, so Read and ReadWrite SAS URLs for the same container
+# each keep their own client instead of replacing each other.
+def get_container_client(container_sas_url):
+    container_url, _, query = container_sas_url.partition("?")
+    key = (container_url, parse_qs(query).get("sp", [""])[0])
+    cached = blob_container_clients.get(key)
+    if cached is None or cached[0] != container_sas_url:
+        # A new SAS URL with the same permissions (e.g. after the old one expired) replaces the cached client.
+        # The replaced client is closed in the background; it doesn't own the pooled session, so requests it still
+        # has in flight are not affected.
+        if cached is not None:
+            close = asyncio.ensure_future(cached[1].close())
+            blob_client_closes.add(close)
+            close.add_done_callback(blob_client_closes.discard)
+        cached = (container_sas_url, ContainerClient.from_container_url(container_sas_url, transport=get_blob_transport(container_sas_url)))
+        blob_container_clients[key] = cached
+    return cached[1]
+
+
+def get_blob_client_from_url(blob_sas_url):
+    return BlobClient.from_blob_url(blob_sas_url, transport=get_blob_transport(blob_sas_url))
+
+
+async def close_blob_clients():
+    await asyncio.gather(*blob_client_closes)
+    for _, container_client in blob_container_clients.values():
+        await container_client.close()
+    blob_container_clients.clear()
+    for session in blob_sessions.values():
+        await session.close()
+    blob_sessions.clear()
+
+
+# Block size used by the resumable upload mode
+upload_block_size = 8 * 1024 * 1024
+
+# Set resumable to True for large files: the file is uploaded as staged blocks and progress is checkpointed
+# next to the local file, so an interrupted upload only re-sends the blocks that are missing when it is restarted.
+async def upload_file(asset_name,input_file, resumable=False, block_size=upload_block_size, context=None):
+    # The ReadWrite SAS URL comes from the SAS cache, so repeated uploads to the same asset don't list the container SAS again
+    ctx = get_context(context)
+    print("Getting the container sas.")
+    upload_sas_url = await get_container_sas_url(asset_name, "ReadWrite", context=ctx)
+    if upload_sas_url:
         file_name = os.path.basename(input_file)
-        sas_uri = urlparse(upload_sas_url)
-
-        # Get the Blob service client using the Asset's SAS URL
-        blob_service_client = BlobServiceClient(upload_sas_url)
-        # We need to get the container_name here from the SAS URL path to use later when creating the container client
-        # Change the path to the container so that it doesn't make "subdirectories"
-        no_slash = sas_uri.path.replace("/","../")
-        container_name = no_slash
-        # print(f"Container name: ", container_name)
-        container_client = blob_service_client.get_container_client(container_name)
+
+        # Get the pooled container client for the Asset's SAS URL
+        container_client = get_container_client(upload_sas_url)
         # Next, get the block_blob_client needed to use the uploadFile method
         blob_client = container_client.get_blob_client(file_name)
         # print(f"Block blob client: ", blob_client)
@@ -158,104 +584,581 @@ async def upload_file(asset_name,input_file):
         print("Uploading blob...")
         file_path = media_folder + file_name
         print("Video is located in " + file_path)
-        with open(file_path, "rb") as data:
-            await blob_client.upload_blob(data, max_concurrency=5)
+        if resumable:
+            await upload_blocks_resumable(blob_client, file_path, block_size=block_size, max_concurrency=5)
+        else:
+            with open(file_path, "rb") as data:
+                await blob_client.upload_blob(data, max_concurrency=5)
         print(f"File {file_name} successfully uploaded!")
-
-    print("Closing Blob service client")
     print()
-    await blob_service_client.close()
 
 
 
+# The checkpoint file for a resumable upload is stored next to the local file
+def get_upload_checkpoint_path(file_path):
+    return file_path + ".upload-checkpoint.json"
+
+
+# Block IDs are derived from the block index so that they are the same every time the upload is restarted.
+# All block IDs of a blob must have the same length.
+def get_block_id(index):
+    return base64.b64encode(f"block-{index:08d}".encode()).decode()
+
+
+def load_upload_checkpoint(checkpoint_path, blob_url, file_size, file_mtime, block_size):
+    try:
+        with open(checkpoint_path, "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return set()
+    # Only resume if the checkpoint belongs to the same blob and the local file has not changed
+    if (checkpoint.get("blob_url") != blob_url or checkpoint.get("file_size") != file_size
+            or checkpoint.get("file_mtime") != file_mtime or checkpoint.get("block_size") != block_size):
+        print("Ignoring upload checkpoint because the file or the destination blob changed.")
+        return set()
+    return set(checkpoint.get("staged_blocks", []))
+
+
+def save_upload_checkpoint(checkpoint_path, blob_url, file_size, file_mtime, block_size, staged_blocks):
+    checkpoint = {
+        "blob_url": blob_url,
+        "file_size": file_size,
+        "file_mtime": file_mtime,
+        "block_size": block_size,
+        "staged_blocks": sorted(staged_blocks)
+    }
+    # Write to a temporary file first so that an interruption never leaves a half-written checkpoint behind
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temp_path, checkpoint_path)
+
+
+# Uploads a local file as a block blob with stage_block/commit_block_list.
+# Every staged block ID is recorded in a local checkpoint file. When the upload is restarted, blocks that are in the
+# checkpoint and still uncommitted on the service are skipped, and only the missing blocks are staged before the
+# block list is committed. The checkpoint is removed once the blob is committed.
+async def upload_blocks_resumable(blob_client, file_path, block_size=upload_block_size, max_concurrency=5):
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        # There are no blocks to stage or resume, so an empty file is uploaded as is, without a checkpoint
+        await blob_client.upload_blob(b"", overwrite=True)
+        return
+    file_mtime = os.path.getmtime(file_path)
+    # Leave the SAS token out of the checkpoint
+    blob_url = blob_client.url.split("?")[0]
+    checkpoint_path = get_upload_checkpoint_path(file_path)
+
+    block_count = max(1, -(-file_size // block_size))
+    block_ids = [get_block_id(index) for index in range(block_count)]
+
+    staged_blocks = load_upload_checkpoint(checkpoint_path, blob_url, file_size, file_mtime, block_size)
+    if staged_blocks:
+        # Uncommitted blocks are discarded by the service after a week, so only trust blocks it still has
+        try:
+            _, uncommitted_blocks = await blob_client.get_block_list("uncommitted")
+            staged_blocks &= {block.id for block in uncommitted_blocks}
+        except ResourceNotFoundError:
+            staged_blocks = set()
+        print(f"Resuming upload: {len(staged_blocks)} of {block_count} blocks already staged.")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def stage(index, block_id):
+        async with semaphore:
+            with open(file_path, "rb") as data:
+                data.seek(index * block_size)
+                chunk = data.read(block_size)
+            await blob_client.stage_block(block_id, chunk, length=len(chunk))
+            staged_blocks.add(block_id)
+            save_upload_checkpoint(checkpoint_path, blob_url, file_size, file_mtime, block_size, staged_blocks)
+
+    await asyncio.gather(*(stage(index, block_id) for index, block_id in enumerate(block_ids) if block_id not in staged_blocks))
+
+    await blob_client.commit_block_list(block_ids)
+    try:
+        os.remove(checkpoint_path)
+    except OSError:
+        pass
+
+
 # Creates a new Media Services Asset, which is a pointer to a storage container
 # Uses the Storage Blob npm package to upload a local file into the container through the use
 # of the SAS URL obtained from the new Asset object.
 # This demonstrates how to upload local files up to the container without requiring additional storage credential.
-async def create_input_asset(asset_name, input_file):
+async def create_input_asset(asset_name, input_file, context=None):
+    ctx = get_context(context)
     print(f"create_input_asset called for asset_name: ", asset_name, "Input file: ", input_file)
-    upload_sas_url = ""
-    file_name = ""
-    sas_uri=""
-    print ("Creating asset for: ", "resource_group: ", resource_group, "account_name: ", account_name, "asset_name: ", asset_name)
-    asset = await client.assets.create_or_update(resource_group, account_name, asset_name, {})
+    print ("Creating asset for: ", "resource_group: ", ctx.resource_group, "account_name: ", ctx.account_name, "asset_name: ", asset_name)
+    asset = await ctx.client.assets.create_or_update(ctx.resource_group, ctx.account_name, asset_name, {})
     if asset:
         print("Asset created.")
+        invalidate_container_sas(asset_name, container=asset.container, context=ctx)
     else:
         print("There was a problem creating an asset.")
 
-    await upload_file(asset_name=asset_name,input_file=input_file)
+    await upload_file(asset_name=asset_name,input_file=input_file, context=ctx)
 
-    """
-    # Set permissions for SAS URL and expiry time (for the sample, we used expiry time to be 1 additional hours from current time)
-    print("Setting permissions for SAS URL and expiry time.")
-    # Make sure that the expiry time is far enough in the future that you can keep using it until you are done testing.
-    input = ListContainerSasInput(permissions="ReadWrite", expiry_time=datetime.now(timezone.utc)+timedelta(hours=24))
-    print("Listing the container sas.")
-    list_container_sas = await client.assets.list_container_sas(resource_group, account_name, asset_name, parameters=input)
-    if list_container_sas.asset_container_sas_urls:
-        upload_sas_url = list_container_sas.asset_container_sas_urls[0]
-        file_name = os.path.basename(input_file)
-        sas_uri = urlparse(upload_sas_url)
-
-        # Get the Blob service client using the Asset's SAS URL
-        blob_service_client = BlobServiceClient(upload_sas_url)
-        # We need to get the container_name here from the SAS URL path to use later when creating the container client
-        # Change the path to the container so that it doesn't make "subdirectories"
-        no_slash = sas_uri.path.replace("/","../")
-        container_name = no_slash
-        # print(f"Container name: ", container_name)
-        container_client = blob_service_client.get_container_client(container_name)
-        # Next, get the block_blob_client needed to use the uploadFile method
-        blob_client = container_client.get_blob_client(file_name)
-        # print(f"Block blob client: ", blob_client)
-
-        print(f"Uploading file named {file_name} to blob in the Asset's container...")
-        print("Uploading blob...")
-        file_path = media_folder + file_name
-        print("Video is located in " + file_path)
-        with open(file_path, "rb") as data:
-            await blob_client.upload_blob(data, max_concurrency=5)
-        print(f"File {file_name} successfully uploaded!")
+    return asset
 
-    print("Closing Blob service client")
-    print()
-    await blob_service_client.close()
-    """
 
-    return asset
+# Limits the total number of bytes that are being uploaded at the same time.
+# A single file larger than the limit is still allowed through once nothing else is uploading.
+class ByteBudget:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.max_bytes)
+            self.in_flight += size
+
+    async def release(self, size):
+        async with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+
+# The request and byte limits of create_input_assets are shared by all the calls for the same account, so running
+# several batches at the same time doesn't multiply them. Change them with set_upload_limits before the first upload.
+upload_max_concurrent_requests = 16
+upload_max_inflight_bytes = 1024 * 1024 * 1024
+upload_limits = {}
+
+def set_upload_limits(max_concurrent_requests, max_inflight_bytes):
+    global upload_max_concurrent_requests, upload_max_inflight_bytes
+    upload_max_concurrent_requests = max_concurrent_requests
+    upload_max_inflight_bytes = max_inflight_bytes
+    upload_limits.clear()
+
+
+def get_upload_limits(context=None):
+    ctx = get_context(context)
+    key = (ctx.subscription_id, ctx.resource_group, ctx.account_name)
+    limits = upload_limits.get(key)
+    if limits is None:
+        limits = (asyncio.Semaphore(upload_max_concurrent_requests), ByteBudget(upload_max_inflight_bytes))
+        upload_limits[key] = limits
+    return limits
+
+
+# Creates and uploads many input assets at once. input_files is a list of (asset_name, input_file) pairs.
+# Every pair runs through asset creation, SAS retrieval and upload as its own pipeline, so the stages of different
+# files overlap. The requests in flight (management-plane calls and blob block uploads) and the total size of the
+# files being uploaded at the same time are capped per account, see set_upload_limits. Passing max_concurrent_requests
+# or max_inflight_bytes gives this call limits of its own instead.
+# Returns the created assets in the same order as input_files.
+async def create_input_assets(input_files, max_concurrent_requests=None, max_inflight_bytes=None, resumable=False, context=None):
+    ctx = get_context(context)
+    request_semaphore, byte_budget = get_upload_limits(ctx)
+    if max_concurrent_requests is not None:
+        request_semaphore = asyncio.Semaphore(max_concurrent_requests)
+    if max_inflight_bytes is not None:
+        byte_budget = ByteBudget(max_inflight_bytes)
+
+    async def ingest(asset_name, input_file):
+        async with request_semaphore:
+            asset = await ctx.client.assets.create_or_update(ctx.resource_group, ctx.account_name, asset_name, {})
+            invalidate_container_sas(asset_name, container=asset.container, context=ctx)
+            # Warm the SAS cache so that upload_file doesn't need another management call
+            await get_container_sas_url(asset_name, "ReadWrite", context=ctx)
+
+        size = os.path.getsize(media_folder + os.path.basename(input_file))
+        await byte_budget.acquire(size)
+        # The block uploads run in tasks started from here, which inherit the limit
+        token = blob_request_limit.set(request_semaphore)
+        try:
+            await upload_file(asset_name=asset_name, input_file=input_file, resumable=resumable, context=ctx)
+        finally:
+            blob_request_limit.reset(token)
+            await byte_budget.release(size)
+        return asset
 
+    print(f"Creating {len(input_files)} input assets...")
+    return await asyncio.gather(*(ingest(asset_name, input_file) for asset_name, input_file in input_files))
 
 
-async def wait_for_job_to_finish(transform_name, job_name):
+async def wait_for_job_to_finish(transform_name, job_name, sleep_interval=10, timeout_seconds=60 * 10, context=None):
+    ctx = get_context(context)
     timeout = datetime.now(timezone.utc)
-    # Timer values
-    timeout_seconds = 60 * 10
-    sleep_interval = 10
-
     timeout += timedelta(seconds=timeout_seconds)
 
-    async def poll_for_job_status():
-        job = await client.jobs.get(resource_group, account_name, transform_name, job_name)
+    while True:
+        job = await ctx.client.jobs.get(ctx.resource_group, ctx.account_name, transform_name, job_name)
 
         # Note that you can report the progress for each Job Output if you have more than one. In this case, we only have one output in the Transform
         # that we defined in this sample, so we can check that with the job.outputs[0].progress parameter.
         if job.outputs != None:
             # print(f"Job.outputs[0] is: {job.outputs[0]}")
             print(f"Job State is: {job.state}, \tProgress: {job.outputs[0].progress}%")
-        if job.state == 'Finished' or job.state == 'Error' or job.state == 'Canceled':
+        if job.state in JOB_FINAL_STATES:
             return job
         elif datetime.now(timezone.utc) > timeout:
             return job
+        await asyncio.sleep(sleep_interval)
+
+
+# A single polling loop that waits on many jobs at once.
+# Register (transform, job) pairs with watch() and await the returned futures; each future resolves with the Job
+# once it reaches Finished, Error or Canceled (or with the last polled Job when the timeout passes).
+# Every job gets its own poll interval: it starts at min_interval, grows by backoff_factor each time the job
+# has made no progress, and drops back to min_interval as soon as the state or progress changes.
+# At most max_concurrent_requests GETs are in flight at any time, no matter how many jobs are registered.
+class JobWatcher:
+    def __init__(self, min_interval=5, max_interval=60, backoff_factor=1.5, timeout_seconds=60 * 10, max_concurrent_requests=16, context=None):
+        self.context = context
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.timeout_seconds = timeout_seconds
+        self.max_concurrent_requests = max_concurrent_requests
+        self._jobs = {}
+        self._schedule = []
+        self._sequence = 0
+        self._polls = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # The first poll happens right away, or after delay seconds
+    def watch(self, transform_name, job_name, delay=0):
+        key = (transform_name, job_name)
+        entry = self._jobs.get(key)
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            entry = {
+                'future': loop.create_future(),
+                'interval': self.min_interval,
+                'deadline': loop.time() + self.timeout_seconds if self.timeout_seconds is not None else None,
+                'state': None,
+                'progress': None,
+                'sequence': None
+            }
+            self._jobs[key] = entry
+            self._push(key, loop.time() + delay)
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._run())
+        return entry['future']
+
+    def watch_all(self, transform_name, job_names):
+        return [self.watch(transform_name, job_name) for job_name in job_names]
+
+    async def wait_all(self, transform_name, job_names):
+        return await asyncio.gather(*self.watch_all(transform_name, job_names))
+
+    # Stops polling a job; its future is cancelled if it has not resolved yet
+    def unwatch(self, transform_name, job_name):
+        entry = self._jobs.pop((transform_name, job_name), None)
+        if entry is not None and not entry['future'].done():
+            entry['future'].cancel()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._polls):
+            task.cancel()
+        for entry in self._jobs.values():
+            if not entry['future'].done():
+                entry['future'].cancel()
+        self._jobs.clear()
+        self._schedule.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # The entry remembers the sequence number of its latest heap item; older items of the same job (left behind by
+    # unwatch() or by watching the job again) no longer match it and are skipped when they come up
+    def _push(self, key, due):
+        self._sequence += 1
+        self._jobs[key]['sequence'] = self._sequence
+        heapq.heappush(self._schedule, (due, self._sequence, key))
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        while self._jobs:
+            now = loop.time()
+            if self._schedule and self._schedule[0][0] <= now:
+                _, sequence, key = heapq.heappop(self._schedule)
+                entry = self._jobs.get(key)
+                if entry is None or entry['sequence'] != sequence:
+                    continue
+                # Every poll runs as a task of its own once a request slot is free, so a slow GET doesn't hold up
+                # the jobs that come due after it
+                await semaphore.acquire()
+                task = asyncio.create_task(self._poll(key, entry))
+                self._polls.add(task)
+                task.add_done_callback(lambda done: self._finish_poll(done, semaphore))
+                continue
+
+            self._wakeup.clear()
+            delay = self._schedule[0][0] - now if self._schedule else self.max_interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _finish_poll(self, task, semaphore):
+        self._polls.discard(task)
+        semaphore.release()
+
+    async def _poll(self, key, entry):
+        if self._jobs.get(key) is not entry:
+            return
+        if entry['future'].done():
+            # The caller cancelled the future
+            self._jobs.pop(key)
+            return
+        transform_name, job_name = key
+        loop = asyncio.get_running_loop()
+        ctx = get_context(self.context)
+        try:
+            job = await ctx.client.jobs.get(ctx.resource_group, ctx.account_name, transform_name, job_name)
+        except ResourceNotFoundError as err:
+            if self._jobs.get(key) is entry:
+                self._jobs.pop(key)
+                if not entry['future'].done():
+                    entry['future'].set_exception(err)
+            return
+        except Exception as err:
+            if self._jobs.get(key) is not entry:
+                return
+            # Transient failures just push the next poll out, they never fail the future
+            print(f"Error polling job {job_name}: {err}")
+            entry['interval'] = min(entry['interval'] * self.backoff_factor, self.max_interval)
+            self._push(key, loop.time() + entry['interval'])
+            return
+
+        # The job was unwatched while the GET was in flight
+        if self._jobs.get(key) is not entry:
+            return
+        progress = job.outputs[0].progress if job.outputs else None
+        if job.state != entry['state']:
+            print(f"Job {job_name} State is: {job.state}, \tProgress: {progress}%")
+
+        if job.state in JOB_FINAL_STATES or (entry['deadline'] is not None and loop.time() > entry['deadline']):
+            self._jobs.pop(key)
+            if not entry['future'].done():
+                entry['future'].set_result(job)
+            return
+
+        if job.state != entry['state'] or progress != entry['progress']:
+            entry['interval'] = self.min_interval
         else:
-            await asyncio.sleep(sleep_interval)
-            return await poll_for_job_status()
+            entry['interval'] = min(entry['interval'] * self.backoff_factor, self.max_interval)
+        entry['state'] = job.state
+        entry['progress'] = progress
+        self._push(key, loop.time() + entry['interval'])
+
+
+# A local webhook endpoint for the Event Grid subscription of a Media Services account, so that jobs complete
+# as soon as Event Grid reports them instead of on the next poll.
+# Create the Event Grid subscription with a WebHook endpoint that points at http(s)://<public host>/<path> (e.g. through
+# a tunnel or a reverse proxy) and filter it on the Microsoft.Media.JobStateChange and Microsoft.Media.JobOutputProgress
+# event types. If a secret is set, add it to the endpoint URL as ?code=<secret>; requests without it are rejected.
+# The receiver listens on 127.0.0.1 by default, for a tunnel or reverse proxy on the same machine. Listening on any
+# other host requires a secret, as anyone who can reach the port could otherwise post job events.
+# Both the Event Grid and the CloudEvents schemas are accepted, and the subscription validation handshake is answered.
+#
+# watch() returns a future that resolves with the Job (one GET once the final state has arrived). Every watched job
+# is also registered with a JobWatcher polling every fallback_interval seconds, as a safety net for lost events.
+# Events for jobs that aren't watched are ignored, and what was recorded for a job is dropped once its future is
+# resolved or the job is unwatched, so a long-running receiver doesn't accumulate every job of the account.
+class JobEventReceiver:
+    def __init__(self, host="127.0.0.1", port=7071, path="/api/events", secret=None, fallback_interval=120, timeout_seconds=60 * 10, context=None):
+        if secret is None and host not in ("127.0.0.1", "::1", "localhost"):
+            raise ValueError(f"A secret is required to receive job events on {host}; only loopback hosts can listen without one.")
+        self.context = context
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.progress = {}
+        self._futures = {}
+        self._final_states = {}
+        self._tasks = set()
+        self._runner = None
+        self.fallback_interval = fallback_interval
+        self._watcher = JobWatcher(min_interval=fallback_interval, max_interval=fallback_interval, timeout_seconds=timeout_seconds, context=context)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_request)
+        app.router.add_options(self.path, self.handle_options)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        print(f"Listening for Event Grid job events on http://{self.host}:{self.port}{self.path}")
+        return self
+
+    def watch(self, transform_name, job_name):
+        key = (transform_name, job_name)
+        future = self._futures.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+            fallback = self._watcher.watch(transform_name, job_name, delay=self.fallback_interval)
+            fallback.add_done_callback(lambda done: self._resolve(key, done))
+        return future
+
+    # Stops waiting for a job; its future is cancelled
+    def unwatch(self, transform_name, job_name):
+        future = self._futures.get((transform_name, job_name))
+        if future is not None and not future.done():
+            future.cancel()
+
+    def watch_all(self, transform_name, job_names):
+        return [self.watch(transform_name, job_name) for job_name in job_names]
+
+    async def wait_all(self, transform_name, job_names):
+        return await asyncio.gather(*self.watch_all(transform_name, job_names))
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+        await self._watcher.close()
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+        self._futures.clear()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Answers the CloudEvents webhook abuse protection handshake
+    async def handle_options(self, request):
+        if not self._is_authorized(request):
+            return web.Response(status=401)
+        return web.Response(headers={"WebHook-Allowed-Origin": request.headers.get("WebHook-Request-Origin", "*")})
+
+    async def handle_request(self, request):
+        if not self._is_authorized(request):
+            return web.Response(status=401)
+        try:
+            events = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if isinstance(events, dict):
+            events = [events]
+
+        for event in events:
+            event_type = event.get('eventType') or event.get('type')
+            if event_type == "Microsoft.EventGrid.SubscriptionValidationEvent":
+                print("Answering the Event Grid subscription validation request")
+                return web.json_response({"validationResponse": event['data']['validationCode']})
+            self.handle_event(event_type, event.get('subject', ''), event.get('data') or {})
+        return web.Response()
+
+    # Dispatches one Media Services event. The subject of job events is transforms/<transform name>/jobs/<job name>
+    def handle_event(self, event_type, subject, data):
+        parts = subject.strip("/").split("/")
+        if len(parts) < 4 or parts[-4] != "transforms" or parts[-2] != "jobs":
+            return
+        key = (parts[-3], parts[-1])
+        if key not in self._futures:
+            return
+
+        if event_type == "Microsoft.Media.JobOutputProgress":
+            self.progress[key] = data.get('progress')
+            print(f"Job {key[1]} Progress: {data.get('progress')}%")
+        elif event_type == "Microsoft.Media.JobStateChange" or event_type in ("Microsoft.Media.JobFinished", "Microsoft.Media.JobCanceled", "Microsoft.Media.JobErrored"):
+            state = data.get('state')
+            print(f"Job {key[1]} State is: {state}")
+            if state in JOB_FINAL_STATES and key not in self._final_states:
+                self._final_states[key] = state
+                self._fetch_job(key)
+
+    def _is_authorized(self, request):
+        return self.secret is None or request.query.get("code") == self.secret
+
+    def _fetch_job(self, key):
+        # Stop polling right away; the GET below is the only request made for this job from now on
+        self._watcher.unwatch(*key)
+        task = asyncio.ensure_future(self._get_job(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _get_job(self, key):
+        future = self._futures.get(key)
+        if future is None or future.done():
+            return
+        ctx = get_context(self.context)
+        try:
+            job = await ctx.client.jobs.get(ctx.resource_group, ctx.account_name, key[0], key[1])
+        except Exception as err:
+            if not future.done():
+                future.set_exception(err)
+            return
+        if not future.done():
+            future.set_result(job)
+
+    def _forget(self, key, future):
+        if self._futures.get(key) is future:
+            del self._futures[key]
+        self.progress.pop(key, None)
+        self._final_states.pop(key, None)
+        self._watcher.unwatch(*key)
+
+    def _resolve(self, key, fallback):
+        future = self._futures.get(key)
+        if future is None or future.done() or fallback.cancelled():
+            return
+        if fallback.exception() is not None:
+            future.set_exception(fallback.exception())
+        else:
+            print(f"Job {key[1]} completed without an Event Grid event, picked up by polling")
+            future.set_result(fallback.result())
+
+
+# Builds an OData filter that matches any of the given job names, e.g. "name eq 'job-1' or name eq 'job-2'"
+def build_job_name_filter(job_names):
+    return " or ".join("name eq '{}'".format(name.replace("'", "''")) for name in job_names)
+
+
+# Refreshes the status of a batch of jobs on the same transform with paged client.jobs.list calls instead of one GET per job.
+# Job names are sent in chunks of list_filter_size names per OData filter so that the request URL stays short.
+# Any job that the list call does not return (or every job, if the list call fails) is fetched with client.jobs.get as a fallback.
+# Returns a dict of job name -> Job.
+async def list_jobs_by_name(transform_name, job_names, list_filter_size=20, context=None):
+    ctx = get_context(context)
+    jobs = {}
+    job_names = list(job_names)
+    for i in range(0, len(job_names), list_filter_size):
+        chunk = job_names[i:i + list_filter_size]
+        try:
+            async for job in ctx.client.jobs.list(ctx.resource_group, ctx.account_name, transform_name, filter=build_job_name_filter(chunk)):
+                jobs[job.name] = job
+        except HttpResponseError as err:
+            print(f"Listing jobs with a name filter failed, falling back to getting each job: {err}")
 
-    return await poll_for_job_status()
+    for job_name in job_names:
+        if job_name not in jobs:
+            jobs[job_name] = await ctx.client.jobs.get(ctx.resource_group, ctx.account_name, transform_name, job_name)
+    return jobs
 
 
-async def wait_for_all_jobs_to_finish(transform_name, job_queue, current_container, batch_counter):
-    sleep_interval = 10
+# Set use_list_refresh to True to refresh the whole batch with one paged client.jobs.list call per chunk of jobs
+# (see list_jobs_by_name) instead of calling client.jobs.get for every job on every tick.
+async def wait_for_all_jobs_to_finish(transform_name, job_queue, current_container, batch_counter, use_list_refresh=False, list_filter_size=20, sleep_interval=10, context=None):
+    ctx = get_context(context)
     batch_processing = True
     while batch_processing:
         error_count = 0
@@ -263,9 +1166,16 @@ async def wait_for_all_jobs_to_finish(transform_name, job_queue, current_contain
         processing_count = 0
         output_rows = []
 
+        if use_list_refresh:
+            job_names = [job_item.name for job_item in job_queue if job_item is not None]
+            refreshed_jobs = await list_jobs_by_name(transform_name, job_names, list_filter_size, context=ctx)
+
         for job_item in job_queue:
             if job_item is not None:
-                job = await client.jobs.get(resource_group, account_name, transform_name, job_item.name)
+                if use_list_refresh:
+                    job = refreshed_jobs[job_item.name]
+                else:
+                    job = await ctx.client.jobs.get(ctx.resource_group, ctx.account_name, transform_name, job_item.name)
 
                 if job.outputs is not None:
                     output_rows.append({
@@ -278,18 +1188,18 @@ async def wait_for_all_jobs_to_finish(transform_name, job_queue, current_contain
 
                 if job.state == 'Error' or job.state == 'Canceled':
                     if job.input:
-                        update_job_input_metadata(job.input, { "ams_encoded": "false", "ams_status": job.state })
+                        await update_job_input_metadata(job.input, { "ams_encoded": "false", "ams_status": job.state }, context=ctx)
                     error_count+=1
                 elif job.state == 'Finished':
                     # Update the source blob metadata to note that we encoded it already, the date it was encoded, and the transform name used
                     if job.input:
-                        update_job_input_metadata(job.input,
+                        await update_job_input_metadata(job.input,
                                                {
                                                    "ams_encoded": "true",
                                                    "ams_status": job.state,
                                                    "ams_encoded_date": datetime.now(timezone.utc).strftime("%m/%d/%Y"),
                                                    "ams_transform": transform_name
-                                               })
+                                               }, context=ctx)
                     finished_count+=1
 
                 elif job.state == 'Processing' or job.state == 'Scheduled':
@@ -308,31 +1218,65 @@ async def wait_for_all_jobs_to_finish(transform_name, job_queue, current_contain
         await asyncio.sleep(sleep_interval)
 
 
-async def update_job_input_metadata(job_input, metadata):
-    if job_input is not None:
-        if job_input.files:
-            # This sample assumes that the input files URL [0] is a SAS URL
-            blob_client = BlobClient(remote_sas_url)
-
-            try:
-                await blob_client.set_blob_metadata(metadata)
-            except:
-                print("Error updating the metadata on the JobInput. Please check to make sure that the source SAS URL allows writes to update metadata.")
-
-
-async def download_results(asset_name, results_folder):
-    input = ListContainerSasInput(permissions="Read", expiry_time=datetime.now(timezone.utc)+timedelta(hours=24))
-    list_container_sas = await client.assets.list_container_sas(resource_group, account_name, asset_name, parameters=input)
+# Encodes one input with several preset overrides at the same time, e.g. the variants of a per-title ladder.
+# preset_overrides is a list of (job_name, output_asset_name, preset) tuples. All output assets are created
+# concurrently, then all jobs are submitted concurrently, and a single JobWatcher waits on them together.
+# This is an async generator that yields (job, output_asset_name) as each job completes:
+#   async for job, output_asset_name in encode_preset_overrides(transform_name, job_input, preset_overrides):
+async def encode_preset_overrides(transform_name, job_input, preset_overrides, min_interval=5, max_interval=60, context=None):
+    ctx = get_context(context)
+
+    print(f"Creating {len(preset_overrides)} output assets...")
+    await asyncio.gather(*(ctx.client.assets.create_or_update(ctx.resource_group, ctx.account_name, output_asset_name, {})
+                           for _, output_asset_name, _ in preset_overrides))
+
+    print(f"Submitting {len(preset_overrides)} preset override jobs to the {transform_name} job queue...")
+    await asyncio.gather(*(submit_job(transform_name, job_name, job_input, output_asset_name, preset, context=ctx)
+                           for job_name, output_asset_name, preset in preset_overrides))
+
+    async with JobWatcher(min_interval=min_interval, max_interval=max_interval, context=ctx) as watcher:
+        async def wait(job_name, output_asset_name):
+            return await watcher.watch(transform_name, job_name), output_asset_name
+
+        for completed in asyncio.as_completed([wait(job_name, output_asset_name) for job_name, output_asset_name, _ in preset_overrides]):
+            yield await completed
+
+
+# Sets metadata on the source blob of a JobInputHttp. The blob URL is the job input's base_uri plus files[0]
+# (or files[0] alone when it is an absolute URL); inputs without a blob URL, such as asset inputs, are skipped.
+async def update_job_input_metadata(job_input, metadata, context=None):
+    if job_input is None or not job_input.files:
+        return
+    # This sample assumes that the input files URL [0] is a SAS URL
+    blob_url = job_input.files[0]
+    if not urlparse(blob_url).scheme:
+        base_uri = getattr(job_input, "base_uri", None)
+        if not base_uri:
+            return
+        # A SAS token on the base URI stays at the end of the blob URL
+        base = urlparse(base_uri)
+        blob_url = base._replace(path=base.path.rstrip("/") + "/" + blob_url.lstrip("/")).geturl()
+
+    blob_client = None
+    try:
+        blob_client = get_blob_client_from_url(blob_url)
+        await blob_client.set_blob_metadata(metadata)
+    except Exception:
+        print("Error updating the metadata on the JobInput. Please check to make sure that the source SAS URL allows writes to update metadata.")
+    finally:
+        if blob_client is not None:
+            await blob_client.close()
 
 
-    if list_container_sas.asset_container_sas_urls:
-        container_sas_url = list_container_sas.asset_container_sas_urls[0]
-        sas_uri = urlparse(container_sas_url)
+# Downloads every blob in the asset container to results_folder/asset_name.
+# max_concurrent_blobs limits how many blobs are downloaded at the same time, and max_concurrency_per_blob
+# limits how many chunks of a single blob are in flight.
+async def download_results(asset_name, results_folder, max_concurrent_blobs=4, max_concurrency_per_blob=4, context=None):
+    ctx = get_context(context)
+    container_sas_url = await get_container_sas_url(asset_name, "Read", context=ctx)
 
-        # Get the Blob service client using the Asset's SAS URL
-        blob_service_client = BlobServiceClient(container_sas_url)
-        # We need to get the containerName here from the SAS URL path to use later when creating the container client
-        container_name = sas_uri.path.replace("/", "../")
+    if container_sas_url:
+        container_name = urlparse(container_sas_url).path.lstrip("/")
 
         """
         print(f"Container_name is: {container_name}")
@@ -343,9 +1287,8 @@ async def download_results(asset_name, results_folder):
         directory = os.path.join(results_folder, asset_name) + '/'
         print(f"Downloading output into {directory}")
 
-        # Get the blob container client using the container name on the SAS URL path
-        # to access the block_blob_client needed to use the upload_file method
-        container_client = blob_service_client.get_container_client(container_name)
+        # Get the pooled blob container client for the Asset's SAS URL
+        container_client = get_container_client(container_sas_url)
 
         try:
             os.makedirs(directory, exist_ok=True)
@@ -355,50 +1298,59 @@ async def download_results(asset_name, results_folder):
         print(f"Listing blobs in container {container_name}")
         print("Downloading blobs to local directory in background...")
 
-        i = 1
-        try:
-            async for blob in container_client.list_blobs():
-                print(f"Blob {i}: {blob.name}")
+        # Each blob is streamed to disk chunk by chunk with readinto(), so memory use is bounded by
+        # max_concurrent_blobs * max_concurrency_per_blob chunks no matter how large the output files are.
+        blob_semaphore = asyncio.Semaphore(max_concurrent_blobs)
 
-                blob_client = container_client.get_blob_client(blob.name)
-                download_file_path = directory + os.path.basename(blob.name)
+        async def download_blob_to_file(i, blob_name):
+            async with blob_semaphore:
+                print(f"Blob {i}: {blob_name}")
+                blob_client = container_client.get_blob_client(blob_name)
+                download_file_path = directory + os.path.basename(blob_name)
                 # print(f"The download file path is: {download_file_path}")
                 try:
+                    downloader = await blob_client.download_blob(max_concurrency=max_concurrency_per_blob)
                     with open(download_file_path, 'wb') as file:
-                        files = await blob_client.download_blob()
-                        file.write(await files.readall())
-
-                    # await block_blob_client.download_blob()
+                        await downloader.readinto(file)
                 except ResourceNotFoundError:
                     print("No blob found.")
+
+        try:
+            downloads = []
+            i = 1
+            async for blob in container_client.list_blobs():
+                downloads.append(asyncio.create_task(download_blob_to_file(i, blob.name)))
+                i += 1
+            await asyncio.gather(*downloads)
             print("Downloading results complete! Exiting the program now...")
             print()
 
         except:
+            for download in downloads:
+                download.cancel()
             print("There was an error listing and/or downloading the blobs.")
 
-    print("Closing blob service client")
-    await blob_service_client.close()
-
 
 # Selects the JobInput type to use based on the value of input_file or input_url.
 # Set input_file to null to create a job input that sources from an HTTP URL path
 # Creates a new input Asset and uploads the local file to it before returning a JobInput object.
 # Returns a JobInputHttp object if input_file is set to null, and the input_url is set to a valid URL
-async def get_job_input_type(input_file, input_url, name_prefix, uniqueness):
+async def get_job_input_type(input_file, input_url, name_prefix, uniqueness, context=None):
+    ctx = get_context(context)
     if input_file is not None:
         asset_name = name_prefix + "-input-" + uniqueness
-        await create_input_asset(asset_name, input_file)
+        await create_input_asset(asset_name, input_file, context=ctx)
         return JobInputAsset(asset_name=asset_name)
     else:
         return JobInputHttp(files=[input_url])
 
 
-async def create_streaming_locator(asset_name, locator_name):
+async def create_streaming_locator(asset_name, locator_name, context=None):
+    ctx = get_context(context)
     streaming_locator = StreamingLocator(asset_name=asset_name, streaming_policy_name="Predefined_ClearStreamingOnly")
-    locator = await client.streaming_locators.create(
-        resource_group_name = resource_group,
-        account_name = account_name,
+    locator = await ctx.client.streaming_locators.create(
+        resource_group_name = ctx.resource_group,
+        account_name = ctx.account_name,
         streaming_locator_name= locator_name,
         parameters = streaming_locator
     )
@@ -406,15 +1358,16 @@ async def create_streaming_locator(asset_name, locator_name):
     return locator
 
 
-async def get_streaming_urls(locator_name):
-    streaming_endpoint = await client.streaming_endpoints.get(
-      resource_group_name = resource_group,
-      account_name = account_name,
+async def get_streaming_urls(locator_name, context=None):
+    ctx = get_context(context)
+    streaming_endpoint = await ctx.client.streaming_endpoints.get(
+      resource_group_name = ctx.resource_group,
+      account_name = ctx.account_name,
       streaming_endpoint_name = "default"
     )
-    paths = await client.streaming_locators.list_paths(
-      resource_group_name = resource_group,
-      account_name = account_name,
+    paths = await ctx.client.streaming_locators.list_paths(
+      resource_group_name = ctx.resource_group,
+      account_name = ctx.account_name,
       streaming_locator_name = locator_name
     )
     if paths.streaming_paths:
@@ -431,22 +1384,25 @@ async def get_streaming_urls(locator_name):
 
 # This method builds the manifest URL from the static values used during creation of the Live Output.
 # This allows you to have a deterministic manifest path. <streaming endpoint hostname>/<streaming locator ID>/manifestName.ism/manifest(<format string>)
-async def build_manifest_paths(streaming_locator_id, manifest_name, filter_name, streaming_endpoint_name):
+# Returns the HLS and DASH manifest URLs.
+async def build_manifest_paths(streaming_locator_id, manifest_name, filter_name, streaming_endpoint_name, context=None):
+    ctx = get_context(context)
     hls_format = "format=m3u8-cmaf"
     dash_format = "format=mpd-time-cmaf"
 
     # Get the default streaming endpoint on the account
-    streaming_endpoint = await client.streaming_endpoints.get(
-      resource_group_name = resource_group,
-      account_name = account_name,
+    streaming_endpoint = await ctx.client.streaming_endpoints.get(
+      resource_group_name = ctx.resource_group,
+      account_name = ctx.account_name,
       streaming_endpoint_name = streaming_endpoint_name
     )
 
     if streaming_endpoint.resource_state != "Running":
       print(f"Streaming endpoint is stopped. Starting endpoint named {streaming_endpoint_name}")
-      client.streaming_endpoints.begin_start(resource_group, account_name, streaming_endpoint_name)
+      poller = await ctx.client.streaming_endpoints.begin_start(ctx.resource_group, ctx.account_name, streaming_endpoint_name)
+      await poller.result()
 
-    manifest_base = f"https://{streaming_endpoint.host_name}/{streaming_locator_id}/{manifest_name}.ism/mainfest"
+    manifest_base = f"https://{streaming_endpoint.host_name}/{streaming_locator_id}/{manifest_name}.ism/manifest"
 
     hls_manifest = ""
     if filter_name is None:
@@ -469,3 +1425,5 @@ async def build_manifest_paths(streaming_locator_id, manifest_name, filter_name,
     print("Open the following URL to playback the live stream from the LiveOutput in the Azure Media Player")
     print(f"https://ampdemo.azureedge.net/?url={dash_manifest}&heuristicprofile=lowlatency")
     print()
+
+    return hls_manifest, dash_manifest
@@ -0,0 +1,460 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Helpers for the Event Hub that a Media Services Event Grid subscription delivers its events to.
+#
+# LiveEventTelemetryConsumer reads the live event diagnostics (LiveEventIngestHeartbeat,
+# LiveEventTrackDiscontinuityDetected, LiveEventIncomingStreamsOutOfSync, ...) from every partition at the same time,
+# decodes them a batch at a time and keeps per live event, per track bitrate and discontinuity metrics in memory.
+# Read positions are checkpointed to a local SQLite file (in the temp directory unless checkpoint_path is given),
+# so a restarted consumer carries on where it stopped.
+#
+# BatchingEventPublisher publishes many small events with few round trips by packing them into full batches.
+#
+# Usage:
+#   eventhub_module = SourceFileLoader("event_hub_helpers", "Common/event_hub_helpers.py").load_module()
+#   consumer = eventhub_module.LiveEventTelemetryConsumer(eventhub_connection_string, eventhub_name, consumer_group)
+#   consumer.start()
+#   ...
+#   await consumer.close()
+#   consumer.telemetry.print_summary()
+
+import asyncio
+import collections
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from azure.eventhub.aio import EventHubConsumerClient, CheckpointStore
+
+# Live event types that count as ingest problems
+LIVE_EVENT_WARNING_TYPES = (
+    "Microsoft.Media.LiveEventIncomingStreamsOutOfSync",
+    "Microsoft.Media.LiveEventIncomingVideoStreamsOutOfSync",
+    "Microsoft.Media.LiveEventIncomingDataChunkDropped",
+    "Microsoft.Media.LiveEventTrackDiscontinuityDetected",
+    "Microsoft.Media.LiveEventEncoderDisconnected",
+    "Microsoft.Media.LiveEventConnectionRejected"
+)
+
+default_checkpoint_path = os.path.join(tempfile.gettempdir(), "eventhub_checkpoints.db")
+
+
+# Checkpoint store that keeps partition ownership and checkpoints in a local SQLite file.
+# It is meant for consumers running on one machine; use the Blob Storage checkpoint store to spread partitions over machines.
+class SqliteCheckpointStore(CheckpointStore):
+    def __init__(self, path=None):
+        self.path = path or default_checkpoint_path
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS ownership (fully_qualified_namespace TEXT, eventhub_name TEXT, consumer_group TEXT, partition_id TEXT,"
+            " owner_id TEXT, etag TEXT, last_modified_time REAL,"
+            " PRIMARY KEY (fully_qualified_namespace, eventhub_name, consumer_group, partition_id))")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint (fully_qualified_namespace TEXT, eventhub_name TEXT, consumer_group TEXT, partition_id TEXT,"
+            " offset TEXT, sequence_number INTEGER,"
+            " PRIMARY KEY (fully_qualified_namespace, eventhub_name, consumer_group, partition_id))")
+        self._connection.commit()
+
+    async def list_ownership(self, fully_qualified_namespace, eventhub_name, consumer_group, **kwargs):
+        rows = self._connection.execute(
+            "SELECT partition_id, owner_id, etag, last_modified_time FROM ownership"
+            " WHERE fully_qualified_namespace = ? AND eventhub_name = ? AND consumer_group = ?",
+            (fully_qualified_namespace, eventhub_name, consumer_group)).fetchall()
+        return [{
+            'fully_qualified_namespace': fully_qualified_namespace,
+            'eventhub_name': eventhub_name,
+            'consumer_group': consumer_group,
+            'partition_id': partition_id,
+            'owner_id': owner_id,
+            'etag': etag,
+            'last_modified_time': last_modified_time
+        } for partition_id, owner_id, etag, last_modified_time in rows]
+
+    # An ownership is only claimed if nobody changed it since it was listed (its etag still matches)
+    async def claim_ownership(self, ownership_list, **kwargs):
+        claimed = []
+        for ownership in ownership_list:
+            key = (ownership['fully_qualified_namespace'], ownership['eventhub_name'], ownership['consumer_group'], ownership['partition_id'])
+            new_etag = str(uuid.uuid4())
+            now = time.time()
+            if ownership.get('etag') is None:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO ownership VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    key + (ownership['owner_id'], new_etag, now))
+            else:
+                cursor = self._connection.execute(
+                    "UPDATE ownership SET owner_id = ?, etag = ?, last_modified_time = ?"
+                    " WHERE fully_qualified_namespace = ? AND eventhub_name = ? AND consumer_group = ? AND partition_id = ? AND etag = ?",
+                    (ownership['owner_id'], new_etag, now) + key + (ownership['etag'],))
+            if cursor.rowcount == 1:
+                claimed.append(dict(ownership, etag=new_etag, last_modified_time=now))
+        self._connection.commit()
+        return claimed
+
+    async def update_checkpoint(self, checkpoint, **kwargs):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO checkpoint VALUES (?, ?, ?, ?, ?, ?)",
+            (checkpoint['fully_qualified_namespace'], checkpoint['eventhub_name'], checkpoint['consumer_group'],
+             checkpoint['partition_id'], checkpoint.get('offset'), checkpoint.get('sequence_number')))
+        self._connection.commit()
+
+    async def list_checkpoints(self, fully_qualified_namespace, eventhub_name, consumer_group, **kwargs):
+        rows = self._connection.execute(
+            "SELECT partition_id, offset, sequence_number FROM checkpoint"
+            " WHERE fully_qualified_namespace = ? AND eventhub_name = ? AND consumer_group = ?",
+            (fully_qualified_namespace, eventhub_name, consumer_group)).fetchall()
+        return [{
+            'fully_qualified_namespace': fully_qualified_namespace,
+            'eventhub_name': eventhub_name,
+            'consumer_group': consumer_group,
+            'partition_id': partition_id,
+            'offset': offset,
+            'sequence_number': sequence_number
+        } for partition_id, offset, sequence_number in rows]
+
+    def close(self):
+        self._connection.close()
+
+
+# Metrics for one track of one live event, built from its heartbeat and discontinuity events
+class TrackMetrics:
+    def __init__(self):
+        self.heartbeats = 0
+        self.last_incoming_bitrate = None
+        self.min_incoming_bitrate = None
+        self.max_incoming_bitrate = None
+        self.total_incoming_bitrate = 0
+        self.expected_bitrate = None
+        self.discontinuity_count = 0
+        self.overlap_count = 0
+        self.nonincreasing_count = 0
+        self.unexpected_bitrate_count = 0
+        self.unhealthy_count = 0
+        self.discontinuity_gaps = 0
+        self.state = None
+
+    @property
+    def average_incoming_bitrate(self):
+        return self.total_incoming_bitrate / self.heartbeats if self.heartbeats else None
+
+    def add_heartbeat(self, data):
+        self.heartbeats += 1
+        incoming_bitrate = int(data.get('incomingBitrate') or 0)
+        self.last_incoming_bitrate = incoming_bitrate
+        self.min_incoming_bitrate = incoming_bitrate if self.min_incoming_bitrate is None else min(self.min_incoming_bitrate, incoming_bitrate)
+        self.max_incoming_bitrate = incoming_bitrate if self.max_incoming_bitrate is None else max(self.max_incoming_bitrate, incoming_bitrate)
+        self.total_incoming_bitrate += incoming_bitrate
+        self.expected_bitrate = data.get('bitrate', self.expected_bitrate)
+        # The counters of a heartbeat cover the time since the previous heartbeat, so they add up
+        self.discontinuity_count += int(data.get('discontinuityCount') or 0)
+        self.overlap_count += int(data.get('overlapCount') or 0)
+        self.nonincreasing_count += int(data.get('nonincreasingCount') or 0)
+        if str(data.get('unexpectedBitrate')).lower() == "true":
+            self.unexpected_bitrate_count += 1
+        if str(data.get('healthy')).lower() == "false":
+            self.unhealthy_count += 1
+        self.state = data.get('state', self.state)
+
+    def add_discontinuity(self):
+        self.discontinuity_gaps += 1
+
+
+# In-memory aggregation of live event telemetry, keyed by live event name and track name
+class LiveEventTelemetry:
+    def __init__(self):
+        self.tracks = collections.defaultdict(TrackMetrics)
+        self.event_counts = collections.defaultdict(collections.Counter)
+        self.events_processed = 0
+        self.decode_errors = 0
+
+    # Adds the Event Grid events decoded from one Event Hub message body (one event or a list of events)
+    def add_events(self, events):
+        if isinstance(events, dict):
+            events = [events]
+        for event in events:
+            event_type = event.get('eventType') or event.get('type') or ""
+            subject = event.get('subject') or ""
+            if not event_type.startswith("Microsoft.Media.LiveEvent"):
+                continue
+            # The subject of live event events is liveEvent/<live event name>
+            live_event_name = subject.rsplit("/", 1)[-1]
+            data = event.get('data') or {}
+            self.events_processed += 1
+            self.event_counts[live_event_name][event_type] += 1
+            if event_type == "Microsoft.Media.LiveEventIngestHeartbeat":
+                self.tracks[(live_event_name, data.get('trackName'))].add_heartbeat(data)
+            elif event_type == "Microsoft.Media.LiveEventTrackDiscontinuityDetected":
+                self.tracks[(live_event_name, data.get('trackName'))].add_discontinuity()
+
+    def add_event_data_batch(self, event_data_batch):
+        for event_data in event_data_batch:
+            try:
+                self.add_events(json.loads(b"".join(event_data.body)))
+            except (ValueError, TypeError):
+                self.decode_errors += 1
+
+    def live_event_names(self):
+        return sorted(self.event_counts)
+
+    def print_summary(self):
+        print(f"Processed {self.events_processed} live event events ({self.decode_errors} could not be decoded)")
+        for live_event_name in self.live_event_names():
+            warnings = sum(count for event_type, count in self.event_counts[live_event_name].items()
+                           if event_type in LIVE_EVENT_WARNING_TYPES)
+            print(f"Live event {live_event_name}: {sum(self.event_counts[live_event_name].values())} events, {warnings} warnings")
+            for (name, track_name), track in sorted(self.tracks.items(), key=lambda item: str(item[0])):
+                if name != live_event_name:
+                    continue
+                average = track.average_incoming_bitrate
+                print(f"  Track {track_name}: {track.heartbeats} heartbeats, incoming bitrate avg {average or 0:.0f}"
+                      f" (min {track.min_incoming_bitrate}, max {track.max_incoming_bitrate}, expected {track.expected_bitrate}),"
+                      f" discontinuities {track.discontinuity_count + track.discontinuity_gaps}, overlaps {track.overlap_count},"
+                      f" unhealthy heartbeats {track.unhealthy_count}")
+
+
+# Reads the live event telemetry from all partitions of an Event Hub concurrently (the consumer client runs one
+# receiver per partition) and hands each received batch of up to max_batch_size events to a LiveEventTelemetry.
+# The position of a partition is checkpointed at most every checkpoint_interval seconds, and once more when the
+# partition is closed, so that checkpointing doesn't slow down reading.
+class LiveEventTelemetryConsumer:
+    def __init__(self, connection_string, eventhub_name, consumer_group="$Default", checkpoint_path=None,
+                 max_batch_size=300, max_wait_time=5, checkpoint_interval=10, telemetry=None, starting_position="-1", **client_kwargs):
+        self.telemetry = telemetry if telemetry is not None else LiveEventTelemetry()
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self.checkpoint_interval = checkpoint_interval
+        self.starting_position = starting_position
+        self.checkpoint_store = SqliteCheckpointStore(checkpoint_path)
+        self.consumer_client = EventHubConsumerClient.from_connection_string(
+            connection_string, consumer_group, eventhub_name=eventhub_name, checkpoint_store=self.checkpoint_store, **client_kwargs)
+        self.batches_received = 0
+        self._last_checkpoint = {}
+        self._pending_checkpoint = {}
+        self._task = None
+
+    # Receives in the background until close() is called
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self
+
+    # Receives until close() is called
+    async def run(self):
+        print("Receiving live event telemetry from all Event Hub partitions...")
+        await self.consumer_client.receive_batch(
+            on_event_batch=self.on_event_batch,
+            on_partition_close=self.on_partition_close,
+            on_error=self.on_error,
+            max_batch_size=self.max_batch_size,
+            max_wait_time=self.max_wait_time,
+            starting_position=self.starting_position)
+
+    async def on_event_batch(self, partition_context, events):
+        if not events:
+            return
+        self.batches_received += 1
+        self.telemetry.add_event_data_batch(events)
+
+        partition_id = partition_context.partition_id
+        now = time.monotonic()
+        if now - self._last_checkpoint.get(partition_id, 0) >= self.checkpoint_interval:
+            await partition_context.update_checkpoint(events[-1])
+            self._last_checkpoint[partition_id] = now
+            self._pending_checkpoint.pop(partition_id, None)
+        else:
+            self._pending_checkpoint[partition_id] = events[-1]
+
+    async def on_partition_close(self, partition_context, reason):
+        event = self._pending_checkpoint.pop(partition_context.partition_id, None)
+        if event is not None:
+            await partition_context.update_checkpoint(event)
+
+    async def on_error(self, partition_context, error):
+        partition_id = partition_context.partition_id if partition_context is not None else None
+        print(f"Error receiving live event telemetry from partition {partition_id}: {error}")
+
+    async def close(self):
+        await self.consumer_client.close()
+        if self._task is not None:
+            # receive_batch returns once the client is closed, unless it is still trying to connect
+            done, _ = await asyncio.wait([self._task], timeout=5)
+            if not done:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.checkpoint_store.close()
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+# Packs events into batches of up to max_size_in_bytes (the largest message the Event Hub accepts when not set)
+# and sends a batch when it is full or when its oldest event has waited max_wait_time seconds.
+# Events without a partition key fill one partition's batch at a time, moving on to the next partition when it is full,
+# so batches stay full and the load is spread over all partitions. Events with a partition key are batched per key.
+# Batches for different partitions are sent concurrently (at most max_concurrent_sends at a time), while the batches
+# of the same partition are sent in order. The producer client is not closed by the publisher.
+# A failed send is retried up to max_send_attempts times in all, waiting retry_delay seconds (doubled each time)
+# in between. A batch that still fails after that is dropped: its events are lost, and counted in events_dropped.
+#
+#   async with BatchingEventPublisher(producer_client) as publisher:
+#       await publisher.add(EventData(json.dumps(event)))
+#   publisher.print_summary()
+class BatchingEventPublisher:
+    def __init__(self, producer_client, max_size_in_bytes=None, max_wait_time=1.0, partition_ids=None, max_concurrent_sends=8,
+                 max_send_attempts=3, retry_delay=1.0):
+        self.producer_client = producer_client
+        self.max_size_in_bytes = max_size_in_bytes
+        self.max_wait_time = max_wait_time
+        self.max_send_attempts = max_send_attempts
+        self.retry_delay = retry_delay
+        self.partition_ids = list(partition_ids) if partition_ids is not None else None
+        self.batches_sent = 0
+        self.events_sent = 0
+        self.send_errors = 0
+        self.events_dropped = 0
+        self.fill_ratios = []
+        self.send_latencies = []
+        self._send_semaphore = asyncio.Semaphore(max_concurrent_sends)
+        self._batches = {}
+        self._batch_started = {}
+        self._sends = {}
+        self._next_partition = 0
+        self._wakeup = asyncio.Event()
+        self._timer_task = None
+
+    async def add(self, event_data, partition_key=None):
+        if self.partition_ids is None:
+            self.partition_ids = await self.producer_client.get_partition_ids()
+        if self._timer_task is None or self._timer_task.done():
+            self._timer_task = asyncio.create_task(self._flush_expired())
+
+        target = ('key', partition_key) if partition_key is not None else ('partition', self.partition_ids[self._next_partition])
+        batch = await self._get_batch(target)
+        try:
+            batch.add(event_data)
+            return
+        except ValueError:
+            # The batch is full: send it and start a new one
+            pass
+
+        await self._send(target)
+        if partition_key is None:
+            self._next_partition = (self._next_partition + 1) % len(self.partition_ids)
+            target = ('partition', self.partition_ids[self._next_partition])
+        batch = await self._get_batch(target)
+        # Raises ValueError if the event is larger than an empty batch can hold
+        batch.add(event_data)
+
+    # Sends every batch that is being filled and waits until all sends have completed
+    async def flush(self):
+        for target in list(self._batches):
+            await self._send(target)
+        if self._sends:
+            await asyncio.gather(*self._sends.values(), return_exceptions=True)
+
+    async def close(self):
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            try:
+                await self._timer_task
+            except asyncio.CancelledError:
+                pass
+            self._timer_task = None
+        await self.flush()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def print_summary(self):
+        if not self.batches_sent:
+            print(f"No Event Hub batches were sent ({self.send_errors} failed sends, {self.events_dropped} events dropped)")
+            return
+        latencies = sorted(self.send_latencies)
+        print(f"Sent {self.events_sent} events in {self.batches_sent} batches ({self.send_errors} failed sends,"
+              f" {self.events_dropped} events dropped),"
+              f" {self.events_sent / self.batches_sent:.1f} events per batch,"
+              f" average batch fill {100 * sum(self.fill_ratios) / len(self.fill_ratios):.1f}%")
+        print(f"Send latency: p50 {1000 * latencies[len(latencies) // 2]:.1f}ms,"
+              f" p95 {1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.1f}ms,"
+              f" max {1000 * latencies[-1]:.1f}ms")
+
+    async def _get_batch(self, target):
+        batch = self._batches.get(target)
+        if batch is None:
+            kind, value = target
+            if kind == 'key':
+                batch = await self.producer_client.create_batch(partition_key=value, max_size_in_bytes=self.max_size_in_bytes)
+            else:
+                batch = await self.producer_client.create_batch(partition_id=value, max_size_in_bytes=self.max_size_in_bytes)
+            self._batches[target] = batch
+            self._batch_started[target] = asyncio.get_running_loop().time()
+            self._wakeup.set()
+        return batch
+
+    # Takes the batch of a target off the buffer and sends it after the previous batch of the same target
+    async def _send(self, target):
+        batch = self._batches.pop(target, None)
+        self._batch_started.pop(target, None)
+        if batch is None or len(batch) == 0:
+            return
+        previous = self._sends.get(target)
+        if previous is not None and not previous.done():
+            # At most one batch per target is in flight, which keeps the order and holds back a producer that is too fast
+            await asyncio.gather(previous, return_exceptions=True)
+        task = asyncio.create_task(self._send_batch(batch))
+        self._sends[target] = task
+
+    async def _send_batch(self, batch):
+        delay = self.retry_delay
+        for attempt in range(1, self.max_send_attempts + 1):
+            async with self._send_semaphore:
+                start = time.perf_counter()
+                try:
+                    await self.producer_client.send_batch(batch)
+                    self.send_latencies.append(time.perf_counter() - start)
+                    break
+                except Exception as err:
+                    self.send_errors += 1
+                    error = err
+            if attempt == self.max_send_attempts:
+                self.events_dropped += len(batch)
+                print(f"Dropping a batch of {len(batch)} events after {attempt} failed sends to Event Hub: {error}")
+                return
+            print(f"Error sending a batch of {len(batch)} events to Event Hub, retrying in {delay:.1f}s: {error}")
+            # The semaphore is released while waiting, so the other partitions keep sending
+            await asyncio.sleep(delay)
+            delay *= 2
+        self.batches_sent += 1
+        self.events_sent += len(batch)
+        self.fill_ratios.append(batch.size_in_bytes / batch.max_size_in_bytes)
+
+    async def _flush_expired(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            for target, started in list(self._batch_started.items()):
+                if now - started >= self.max_wait_time:
+                    await self._send(target)
+            self._wakeup.clear()
+            if self._batch_started:
+                delay = min(self._batch_started.values()) + self.max_wait_time - loop.time()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._wakeup.wait()
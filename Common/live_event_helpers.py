@@ -0,0 +1,882 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Helpers for the live event samples.
+#
+# Like the encoding job helpers, every helper takes an optional context (an AmsContext from encoding_job_helpers).
+# Without one they use the account set on the encoding_job_helpers module with set_account_name, set_resource_group
+# and create_azure_media_services, so load that module and set it up first:
+#   mymodule = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+#   live_module = SourceFileLoader("live_event_helpers", "Common/live_event_helpers.py").load_module()
+
+from datetime import datetime, timedelta, timezone
+import asyncio
+import collections
+import copy
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import uuid
+from importlib.machinery import SourceFileLoader
+from azure.core.exceptions import ResourceNotFoundError
+from azure.mgmt.media.models import (
+    AttributeFilter,
+    CopyAudio,
+    CopyVideo,
+    FromAllInputFile,
+    JobInputAsset,
+    LiveEventActionInput,
+    Mp4Format,
+    OnErrorType,
+    Priority,
+    SelectVideoTrackByAttribute,
+    StandardEncoderPreset,
+    TrackAttribute,
+    Transform,
+    TransformOutput,
+    UtcClipTime
+)
+
+# Use the helpers module that the sample has loaded already, so that the account it set up is the one used here
+encoding_job_helpers = sys.modules.get("encoding_job_helpers") or SourceFileLoader(
+    "encoding_job_helpers", os.path.join(os.path.dirname(os.path.abspath(__file__)), "encoding_job_helpers.py")).load_module()
+
+
+# Records when each step of a pipeline started and finished, relative to when the timeline was created
+class StepTimeline:
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.steps = []
+
+    # Awaits the given awaitable as a named step and returns its result
+    async def run(self, name, awaitable):
+        start = time.perf_counter() - self.start_time
+        try:
+            result = await awaitable
+        except BaseException:
+            end = time.perf_counter() - self.start_time
+            self.steps.append((name + " (failed)", start, end))
+            print(f"{name} failed after {end:.2f}s")
+            raise
+        end = time.perf_counter() - self.start_time
+        self.steps.append((name, start, end))
+        print(f"{name} done after {end:.2f}s")
+        return result
+
+    # Runs a step once the tasks it depends on have finished, so that its time on the timeline is its own.
+    # function is called without arguments and returns the awaitable of the step.
+    async def run_after(self, name, function, *dependencies):
+        if dependencies:
+            await asyncio.gather(*dependencies)
+        return await self.run(name, function())
+
+    # Returns (name, start, end) for the named step, or None if it didn't finish
+    def get_step(self, name):
+        for step in self.steps:
+            if step[0] == name:
+                return step
+        return None
+
+    @property
+    def total_seconds(self):
+        return max((end for _, _, end in self.steps), default=0.0)
+
+    def print_timeline(self, width=40):
+        total = self.total_seconds or 1.0
+        name_width = max((len(name) for name, _, _ in self.steps), default=0)
+        for name, start, end in sorted(self.steps, key=lambda step: step[1]):
+            offset = int(width * start / total)
+            length = max(1, int(width * end / total) - offset)
+            print(f"{name:<{name_width}} |{' ' * offset}{'#' * length}{' ' * (width - offset - length)}| {start:6.2f}s - {end:6.2f}s")
+        print(f"{'Total':<{name_width}}  {total:.2f}s")
+
+
+# Waits for the tasks of a pipeline. If one of them fails, the others are cancelled and the error is raised.
+async def gather_steps(tasks):
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+# Everything provision_live_event created, plus the timeline of the steps
+class ProvisionedLiveEvent:
+    def __init__(self, live_event, asset, live_output, streaming_locator, streaming_endpoint, timeline):
+        self.live_event = live_event
+        self.asset = asset
+        self.live_output = live_output
+        self.streaming_locator = streaming_locator
+        self.streaming_endpoint = streaming_endpoint
+        self.timeline = timeline
+
+    @property
+    def ingest_url(self):
+        return self.live_event.input.endpoints[0].url if self.live_event.input and self.live_event.input.endpoints else None
+
+    @property
+    def preview_url(self):
+        return self.live_event.preview.endpoints[0].url if self.live_event.preview and self.live_event.preview.endpoints else None
+
+
+# Creates a live event with its archive asset, live output and streaming locator, and makes sure the streaming endpoint
+# is running. Steps that don't depend on each other run at the same time:
+#   live event (long running operation) ----------------\
+#   archive asset ---------+---------------------------- live output
+#                          \--- streaming locator
+#   streaming endpoint (started if it is stopped)
+# so the ingest URL is ready as soon as the live event is created, instead of after every step before it.
+# Pass streaming_locator=None to skip the locator. If any step fails, the other steps are cancelled and the error is raised;
+# resources that were already created are left in place.
+async def provision_live_event(live_event_name, live_event, asset_name, asset, live_output_name, live_output,
+                               streaming_locator_name=None, streaming_locator=None, streaming_endpoint_name="default",
+                               auto_start=False, context=None):
+    ctx = encoding_job_helpers.get_context(context)
+    timeline = StepTimeline()
+
+    async def create_live_event():
+        poller = await ctx.client.live_events.begin_create(ctx.resource_group, ctx.account_name, live_event_name, live_event, auto_start=auto_start)
+        await poller.result()
+        # Read the live event back for its ingest and preview endpoints
+        return await ctx.client.live_events.get(ctx.resource_group, ctx.account_name, live_event_name)
+
+    async def create_asset():
+        return await ctx.client.assets.create_or_update(ctx.resource_group, ctx.account_name, asset_name, asset)
+
+    async def create_live_output():
+        poller = await ctx.client.live_outputs.begin_create(ctx.resource_group, ctx.account_name, live_event_name, live_output_name, live_output)
+        return await poller.result()
+
+    async def create_streaming_locator():
+        return await ctx.client.streaming_locators.create(ctx.resource_group, ctx.account_name, streaming_locator_name, streaming_locator)
+
+    async def start_streaming_endpoint():
+        streaming_endpoint = await ctx.client.streaming_endpoints.get(ctx.resource_group, ctx.account_name, streaming_endpoint_name)
+        if streaming_endpoint.resource_state != "Running":
+            print(f"Streaming endpoint is stopped. Starting the endpoint named {streaming_endpoint_name}...")
+            poller = await ctx.client.streaming_endpoints.begin_start(ctx.resource_group, ctx.account_name, streaming_endpoint_name)
+            await poller.result()
+            streaming_endpoint = await ctx.client.streaming_endpoints.get(ctx.resource_group, ctx.account_name, streaming_endpoint_name)
+        return streaming_endpoint
+
+    print(f"Provisioning live event {live_event_name}...")
+    live_event_task = asyncio.ensure_future(timeline.run_after("Create live event", create_live_event))
+    asset_task = asyncio.ensure_future(timeline.run_after("Create archive asset", create_asset))
+    live_output_task = asyncio.ensure_future(timeline.run_after("Create live output", create_live_output, live_event_task, asset_task))
+    endpoint_task = asyncio.ensure_future(timeline.run_after("Start streaming endpoint", start_streaming_endpoint))
+    tasks = [live_event_task, asset_task, live_output_task, endpoint_task]
+    locator_task = None
+    if streaming_locator is not None:
+        locator_task = asyncio.ensure_future(timeline.run_after("Create streaming locator", create_streaming_locator, asset_task))
+        tasks.append(locator_task)
+
+    await gather_steps(tasks)
+
+    return ProvisionedLiveEvent(
+        live_event=live_event_task.result(),
+        asset=asset_task.result(),
+        live_output=live_output_task.result(),
+        streaming_locator=locator_task.result() if locator_task is not None else None,
+        streaming_endpoint=endpoint_task.result(),
+        timeline=timeline)
+
+
+# Short names of the encoding types, used in the names of pooled live events (live event names are limited to 32 characters)
+encoding_type_short_names = {
+    "PassthroughBasic": "pb",
+    "PassthroughStandard": "ps",
+    "None": "ps",
+    "Standard": "s720",
+    "Premium1080p": "p1080"
+}
+
+
+# Returns the plain string of a LiveEventEncodingType value (or the string itself)
+def get_encoding_type_name(encoding_type):
+    return getattr(encoding_type, "value", encoding_type)
+
+
+# Tags that mark a live event as a member of a warm pool
+WARM_POOL_TAG = "warm-pool"
+ENCODING_TYPE_TAG = "encoding-type"
+
+
+# Keeps a number of allocated but stopped (StandBy) live events per encoding type, so that a channel can be handed out
+# and started in seconds instead of created and started in minutes.
+# templates maps an encoding type (e.g. "PassthroughStandard", "Standard", "Premium1080p") to the LiveEvent to create for it,
+# and pool_sizes maps the same types to the number of live events to keep allocated.
+# Pool members are tagged with the pool name, so start() adopts the StandBy members that a previous run left behind.
+# A live event in StandBy is billed at the standby rate: pass standby_hourly_costs (per encoding type, in your currency)
+# to have the pool report what it has cost so far.
+#
+#   async with LiveEventPool(templates, {"PassthroughStandard": 2}) as pool:
+#       live_event = await pool.acquire("PassthroughStandard")
+class LiveEventPool:
+    def __init__(self, templates, pool_sizes, pool_name="warmpool", max_concurrent_operations=4, refill_interval=60,
+                 standby_hourly_costs=None, context=None):
+        # Encoding types can be given as LiveEventEncodingType values or as plain strings
+        self.templates = {get_encoding_type_name(encoding_type): template for encoding_type, template in templates.items()}
+        self.pool_sizes = {get_encoding_type_name(encoding_type): size for encoding_type, size in pool_sizes.items()}
+        self.pool_name = pool_name
+        self.refill_interval = refill_interval
+        self.standby_hourly_costs = {get_encoding_type_name(encoding_type): cost for encoding_type, cost in (standby_hourly_costs or {}).items()}
+        self.context = context
+        self.handed_out = collections.Counter()
+        self.cold_starts = collections.Counter()
+        self.standby_seconds_handed_out = collections.Counter()
+        self._members = {encoding_type: collections.deque() for encoding_type in self.templates}
+        self._pending = collections.Counter()
+        self._semaphore = asyncio.Semaphore(max_concurrent_operations)
+        self._tasks = set()
+        self._discards = set()
+        self._refill_task = None
+
+    async def start(self):
+        ctx = encoding_job_helpers.get_context(self.context)
+        async for live_event in ctx.client.live_events.list(ctx.resource_group, ctx.account_name):
+            tags = live_event.tags or {}
+            encoding_type = tags.get(ENCODING_TYPE_TAG)
+            if tags.get(WARM_POOL_TAG) == self.pool_name and encoding_type in self._members and live_event.resource_state == "StandBy":
+                allocated_at = live_event.last_modified.timestamp() if live_event.last_modified else time.time()
+                self._members[encoding_type].append((live_event.name, allocated_at))
+        for encoding_type, members in self._members.items():
+            if members:
+                print(f"Adopted {len(members)} {encoding_type} live events already in the warm pool")
+        self.refill()
+        self._refill_task = asyncio.create_task(self._refill_periodically())
+        return self
+
+    # Hands out a pooled live event of the given encoding type (oldest first) and starts it unless start is False.
+    # When the pool is empty, a live event is created and started from scratch. The pool is refilled in the background.
+    # If creating or starting the live event fails (or acquire is cancelled), the live event is stopped and deleted in the
+    # background, as it has left the pool and would otherwise keep billing, and the error is raised.
+    async def acquire(self, encoding_type, start=True):
+        ctx = encoding_job_helpers.get_context(self.context)
+        encoding_type = get_encoding_type_name(encoding_type)
+        members = self._members[encoding_type]
+        if members:
+            live_event_name, allocated_at = members.popleft()
+            self.handed_out[encoding_type] += 1
+            self.standby_seconds_handed_out[encoding_type] += time.time() - allocated_at
+            print(f"Handing out {encoding_type} live event {live_event_name} from the warm pool")
+            create = False
+        else:
+            print(f"The {encoding_type} warm pool is empty, creating a live event from scratch")
+            self.cold_starts[encoding_type] += 1
+            live_event_name = self._new_name(encoding_type)
+            create = True
+        self.refill(encoding_type)
+
+        try:
+            if create:
+                poller = await ctx.client.live_events.begin_create(ctx.resource_group, ctx.account_name, live_event_name, self._template(encoding_type, pooled=False))
+                await poller.result()
+            if start:
+                poller = await ctx.client.live_events.begin_start(ctx.resource_group, ctx.account_name, live_event_name)
+                await poller.result()
+            return await ctx.client.live_events.get(ctx.resource_group, ctx.account_name, live_event_name)
+        except BaseException:
+            print(f"Could not hand out {encoding_type} live event {live_event_name}, deleting it")
+            task = asyncio.ensure_future(self._discard_member(live_event_name))
+            self._discards.add(task)
+            task.add_done_callback(self._discards.discard)
+            raise
+
+    # Starts creating live events for every encoding type (or just the given one) that is below its pool size
+    def refill(self, encoding_type=None):
+        for pool_type in ([get_encoding_type_name(encoding_type)] if encoding_type is not None else list(self._members)):
+            missing = self.pool_sizes.get(pool_type, 0) - len(self._members[pool_type]) - self._pending[pool_type]
+            for _ in range(max(0, missing)):
+                self._pending[pool_type] += 1
+                task = asyncio.create_task(self._add_member(pool_type))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    # Waits until every pool is full (or its pending creations failed)
+    async def wait_until_full(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def get_stats(self):
+        now = time.time()
+        stats = {}
+        for encoding_type, members in self._members.items():
+            ages = [now - allocated_at for _, allocated_at in members]
+            standby_seconds = sum(ages) + self.standby_seconds_handed_out[encoding_type]
+            stats[encoding_type] = {
+                'ready': len(members),
+                'pending': self._pending[encoding_type],
+                'handed_out': self.handed_out[encoding_type],
+                'cold_starts': self.cold_starts[encoding_type],
+                'oldest_age_seconds': max(ages, default=0.0),
+                'average_age_seconds': sum(ages) / len(ages) if ages else 0.0,
+                'standby_hours': standby_seconds / 3600,
+                'standby_cost': standby_seconds / 3600 * self.standby_hourly_costs.get(encoding_type, 0.0)
+            }
+        return stats
+
+    def print_stats(self):
+        for encoding_type, stats in self.get_stats().items():
+            print(f"{encoding_type}: {stats['ready']} ready, {stats['pending']} allocating, {stats['handed_out']} handed out,"
+                  f" {stats['cold_starts']} cold starts, oldest {stats['oldest_age_seconds'] / 60:.1f} min,"
+                  f" average age {stats['average_age_seconds'] / 60:.1f} min, {stats['standby_hours']:.2f} standby hours"
+                  f" costing {stats['standby_cost']:.2f}")
+
+    # Stops the background refill. With delete_members=True, the live events still in the pool are stopped and deleted.
+    async def close(self, delete_members=False):
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            try:
+                await self._refill_task
+            except asyncio.CancelledError:
+                pass
+            self._refill_task = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        if delete_members:
+            await asyncio.gather(*(self._delete_member(name) for members in self._members.values() for name, _ in members))
+            for members in self._members.values():
+                members.clear()
+        # Live events that failed to be handed out are deleted even when the pool is closed
+        await asyncio.gather(*list(self._discards), return_exceptions=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # Live event names are at most 32 characters; a long pool name is shortened so that the unique suffix is kept
+    def _new_name(self, encoding_type):
+        suffix = f"-{encoding_type_short_names.get(encoding_type, encoding_type.lower())}-{uuid.uuid4().hex[:8]}"
+        return self.pool_name[:max(1, 32 - len(suffix))] + suffix
+
+    def _template(self, encoding_type, pooled=True):
+        live_event = copy.deepcopy(self.templates[encoding_type])
+        if pooled:
+            live_event.tags = dict(live_event.tags or {}, **{WARM_POOL_TAG: self.pool_name, ENCODING_TYPE_TAG: encoding_type})
+        return live_event
+
+    async def _add_member(self, encoding_type):
+        ctx = encoding_job_helpers.get_context(self.context)
+        live_event_name = self._new_name(encoding_type)
+        try:
+            async with self._semaphore:
+                poller = await ctx.client.live_events.begin_create(ctx.resource_group, ctx.account_name, live_event_name, self._template(encoding_type))
+                await poller.result()
+                poller = await ctx.client.live_events.begin_allocate(ctx.resource_group, ctx.account_name, live_event_name)
+                await poller.result()
+            self._members[encoding_type].append((live_event_name, time.time()))
+            print(f"Allocated {encoding_type} live event {live_event_name} for the warm pool")
+        except Exception as err:
+            # The periodic refill tries again later
+            print(f"Error allocating a {encoding_type} live event for the warm pool: {err}")
+        finally:
+            self._pending[encoding_type] -= 1
+
+    async def _delete_member(self, live_event_name):
+        ctx = encoding_job_helpers.get_context(self.context)
+        async with self._semaphore:
+            poller = await ctx.client.live_events.begin_stop(ctx.resource_group, ctx.account_name, live_event_name, LiveEventActionInput(remove_outputs_on_stop=True))
+            await poller.result()
+            poller = await ctx.client.live_events.begin_delete(ctx.resource_group, ctx.account_name, live_event_name)
+            await poller.result()
+        print(f"Deleted warm pool live event {live_event_name}")
+
+    async def _discard_member(self, live_event_name):
+        try:
+            await self._delete_member(live_event_name)
+        except ResourceNotFoundError:
+            pass
+        except Exception as err:
+            print(f"Error deleting live event {live_event_name}: {err}")
+
+    async def _refill_periodically(self):
+        while True:
+            await asyncio.sleep(self.refill_interval)
+            self.refill()
+
+
+# Name of the copy codec transform that cuts MP4 files out of live archives, as in VideoEncoding/EncodingLiveArchiveMP4
+COPY_TO_MP4_TRANSFORM_NAME = "CopyLiveArchiveToMP4"
+
+
+# Returns the copy codec transform: the audio and video of the input are copied into an MP4 file without re-encoding
+def create_copy_to_mp4_transform():
+    transform = Transform()
+    transform.description = "Built in preset using the Saas Copy Codec preset. This copies the source audio and video to an MP4 file"
+    transform.outputs = [TransformOutput(
+        preset=StandardEncoderPreset(
+            codecs=[CopyAudio(), CopyVideo()],
+            filters={},
+            formats=[Mp4Format(filename_pattern="Video-{Basename}-{Label}-{Bitrate}{Extension}")]
+        ),
+        on_error=OnErrorType.STOP_PROCESSING_JOB,
+        relative_priority=Priority.NORMAL
+    )]
+    return transform
+
+
+# Returns the job input for the top bitrate video (and the audio) of a live archive asset.
+# start and end are UTC datetimes on the timeline of the live event; leave them out to copy the whole archive.
+def create_archive_clip_input(archive_asset_name, start=None, end=None):
+    return JobInputAsset(
+        asset_name=archive_asset_name,
+        start=UtcClipTime(time=start) if start is not None else None,
+        end=UtcClipTime(time=end) if end is not None else None,
+        input_definitions=[FromAllInputFile(included_tracks=[
+            SelectVideoTrackByAttribute(attribute=TrackAttribute.BITRATE, filter=AttributeFilter.TOP)
+        ])]
+    )
+
+
+def format_utc_time(value):
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_utc_time(value):
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+# Exports a live archive to MP4 files while the live event is still running.
+# The timeline from start_time on is cut into windows of window_minutes. Once a window has ended (plus settle_seconds,
+# so that the last fragments have been written to the archive), a copy codec job clips it out of the archive asset
+# into an MP4 asset of its own. Windows are exported oldest first, at most max_concurrent_jobs at a time, so an exporter
+# that starts late or falls behind catches up.
+# The state of every window is saved to state_path (in the temp directory by default) as it changes. An exporter
+# started again with the same state file skips the windows that were exported already, waits for the jobs that were
+# still running, and retries the windows whose job failed (up to max_attempts times in total).
+#
+#   exporter = RollingArchiveExporter(archive_asset_name, window_minutes=10, start_time=live_output.created)
+#   await exporter.start()
+#   ...
+#   await exporter.close(export_remaining=True)    # when the live event stops
+class RollingArchiveExporter:
+    def __init__(self, archive_asset_name, window_minutes=10, start_time=None, name_prefix=None, transform_name=COPY_TO_MP4_TRANSFORM_NAME,
+                 settle_seconds=60, max_concurrent_jobs=2, max_attempts=3, state_path=None, context=None):
+        self.archive_asset_name = archive_asset_name
+        self.window_length = timedelta(minutes=window_minutes)
+        self.start_time = start_time
+        self.name_prefix = name_prefix or archive_asset_name
+        self.transform_name = transform_name
+        self.settle_seconds = settle_seconds
+        self.max_attempts = max_attempts
+        self.state_path = state_path or os.path.join(tempfile.gettempdir(), f"{self.name_prefix}-export-state.json")
+        self.context = context
+        # Window index -> {"start", "end", "job", "asset", "state", "attempts", "submitted", "completed"}
+        self.windows = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent_jobs)
+        self._watcher = encoding_job_helpers.JobWatcher(min_interval=10, max_interval=60, timeout_seconds=None, context=context)
+        self._exports = {}
+        self._task = None
+
+    async def start(self):
+        self._load_state()
+        if self.start_time is None:
+            self.start_time = datetime.now(timezone.utc)
+        elif self.start_time.tzinfo is None:
+            self.start_time = self.start_time.replace(tzinfo=timezone.utc)
+        # Window boundaries are saved with whole seconds
+        self.start_time = self.start_time.replace(microsecond=0)
+        ctx = encoding_job_helpers.get_context(self.context)
+        await encoding_job_helpers.create_or_update_transform(self.transform_name, create_copy_to_mp4_transform(), context=ctx)
+        print(f"Exporting {self.archive_asset_name} in windows of {self.window_length} from {format_utc_time(self.start_time)}")
+        # Jobs submitted by a previous run are still running in the service, and windows that were queued when it
+        # stopped may or may not have had their job submitted
+        for index, window in self.windows.items():
+            if window["state"] in ("Queued", "Submitted"):
+                self._track(index, self._resume_export(index))
+        self._task = asyncio.create_task(self._export_periodically())
+        return self
+
+    # Submits the export of every window that has ended and isn't exported, being exported or out of attempts
+    def export_ready_windows(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        settled = now - timedelta(seconds=self.settle_seconds)
+        for index in range(math.floor((settled - self.start_time) / self.window_length)):
+            if self._can_export(index):
+                window_start = self.start_time + index * self.window_length
+                self._track(index, self._export(index, window_start, window_start + self.window_length))
+
+    # Waits for the exports in progress. With export_remaining=True, the part of the archive after the last full window
+    # (up to end_time, or now) is exported as a shorter last window first, for when the live event has stopped.
+    async def close(self, export_remaining=False, end_time=None):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if export_remaining:
+            end_time = end_time or datetime.now(timezone.utc)
+            self.export_ready_windows(end_time + timedelta(seconds=self.settle_seconds))
+            index = math.floor((end_time - self.start_time) / self.window_length)
+            window_start = self.start_time + index * self.window_length
+            if end_time > window_start and self._can_export(index):
+                self._track(index, self._export(index, window_start, end_time))
+        await asyncio.gather(*list(self._exports.values()), return_exceptions=True)
+        await self._watcher.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # VOD latency is the time from the end of a window until its MP4 asset was ready
+    def print_summary(self):
+        states = collections.Counter(window["state"] for window in self.windows.values())
+        print(f"Windows of {self.archive_asset_name}: " + ", ".join(f"{count} {state}" for state, count in sorted(states.items())))
+        latencies = [window["completed"] - parse_utc_time(window["end"]).timestamp()
+                     for window in self.windows.values() if window["state"] == "Finished" and window.get("completed")]
+        if latencies:
+            print(f"VOD latency after the end of a window: average {sum(latencies) / len(latencies) / 60:.1f} min, max {max(latencies) / 60:.1f} min")
+        for index in sorted(self.windows):
+            window = self.windows[index]
+            print(f"  {index:5d} {window['start']} - {window['end']} {window['state']:<9} {window['asset']}")
+
+    def _can_export(self, index):
+        window = self.windows.get(index)
+        if index in self._exports:
+            return False
+        return window is None or (window["state"] == "Error" and window["attempts"] < self.max_attempts)
+
+    def _track(self, index, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._exports[index] = task
+        task.add_done_callback(lambda _: self._exports.pop(index, None))
+
+    async def _export(self, index, window_start, window_end):
+        window = self.windows.get(index) or {"attempts": 0}
+        attempt = window["attempts"] + 1
+        # Every attempt gets a new job and asset, as job names can't be reused
+        suffix = f"{index:05d}" if attempt == 1 else f"{index:05d}-{attempt}"
+        window.update({
+            "start": format_utc_time(window_start),
+            "end": format_utc_time(window_end),
+            "job": f"{self.name_prefix}-job-{suffix}",
+            "asset": f"{self.name_prefix}-mp4-{suffix}",
+            "state": "Queued",
+            "attempts": attempt
+        })
+        self.windows[index] = window
+        await self._submit_export(index, window_start, window_end)
+
+    async def _submit_export(self, index, window_start, window_end):
+        ctx = encoding_job_helpers.get_context(self.context)
+        window = self.windows[index]
+        async with self._semaphore:
+            try:
+                await ctx.client.assets.create_or_update(ctx.resource_group, ctx.account_name, window["asset"], {})
+                job_input = create_archive_clip_input(self.archive_asset_name, window_start, window_end)
+                await encoding_job_helpers.submit_job(self.transform_name, window["job"], job_input, window["asset"], context=ctx)
+            except Exception as err:
+                print(f"Error submitting the export of window {index} ({window['start']} - {window['end']}): {err}")
+                window["state"] = "Error"
+                self._save_state()
+                return
+            window["state"] = "Submitted"
+            window["submitted"] = time.time()
+            self._save_state()
+            print(f"Exporting window {index} ({window['start']} - {window['end']}) with job {window['job']}")
+            await self._wait_for_export(index)
+
+    # Picks up a window that a previous run left Queued or Submitted: watches its job if the service has it,
+    # and submits it under the same job and asset names otherwise
+    async def _resume_export(self, index):
+        ctx = encoding_job_helpers.get_context(self.context)
+        window = self.windows[index]
+        try:
+            await ctx.client.jobs.get(ctx.resource_group, ctx.account_name, self.transform_name, window["job"])
+        except ResourceNotFoundError:
+            await self._submit_export(index, parse_utc_time(window["start"]), parse_utc_time(window["end"]))
+            return
+        except Exception as err:
+            print(f"Error looking up job {window['job']} of window {index}: {err}")
+            window["state"] = "Error"
+            self._save_state()
+            return
+        if window["state"] == "Queued":
+            window["state"] = "Submitted"
+            window["submitted"] = time.time()
+            self._save_state()
+        await self._wait_for_export(index)
+
+    async def _wait_for_export(self, index):
+        window = self.windows[index]
+        try:
+            job = await self._watcher.watch(self.transform_name, window["job"])
+        except Exception as err:
+            print(f"Error waiting for job {window['job']} of window {index}: {err}")
+            window["state"] = "Error"
+            window["completed"] = time.time()
+            self._save_state()
+            return
+        window["state"] = "Finished" if job.state == "Finished" else "Error"
+        window["completed"] = time.time()
+        self._save_state()
+        print(f"Window {index} ({window['start']} - {window['end']}): job {window['job']} {job.state}")
+
+    async def _export_periodically(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            self.export_ready_windows(now)
+            # Wake up when the next window has settled
+            settled_index = math.floor((now - timedelta(seconds=self.settle_seconds) - self.start_time) / self.window_length)
+            next_due = self.start_time + (settled_index + 1) * self.window_length + timedelta(seconds=self.settle_seconds)
+            await asyncio.sleep(max(1.0, (next_due - now).total_seconds()))
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return
+        if state.get("archive_asset_name") != self.archive_asset_name:
+            return
+        # The windows were cut from the start time of the first run, so keep using it
+        self.start_time = parse_utc_time(state["start_time"])
+        self.windows = {int(index): window for index, window in state["windows"].items()}
+        print(f"Loaded the state of {len(self.windows)} windows from {self.state_path}")
+
+    def _save_state(self):
+        state = {
+            "archive_asset_name": self.archive_asset_name,
+            "start_time": format_utc_time(self.start_time),
+            "windows": {str(index): window for index, window in sorted(self.windows.items())}
+        }
+        temp_path = self.state_path + ".tmp"
+        try:
+            with open(temp_path, "w") as state_file:
+                json.dump(state, state_file, indent=2)
+            os.replace(temp_path, self.state_path)
+        except OSError as err:
+            print(f"Could not write the export state: {err}")
+
+
+# What stop_and_export_live_event did, plus the timeline of the steps
+class LiveEventExport:
+    def __init__(self, archive_asset_name, mp4_asset_name, job, streaming_locator, timeline):
+        self.archive_asset_name = archive_asset_name
+        self.mp4_asset_name = mp4_asset_name
+        self.job = job
+        self.streaming_locator = streaming_locator
+        self.timeline = timeline
+
+
+# Ends a live event and turns its archive into a streamable MP4 asset, as one pipeline:
+#   delete live output ------+--- stop live event
+#   create transform --------+--- submit copy job --- wait for the job ---+--- print streaming URLs
+#   create MP4 asset --------+--- create streaming locator ----------------/
+# The live output is deleted first, which keeps its archive asset and closes the archive, so the CopyLiveArchiveToMP4 job
+# (top bitrate video, see create_archive_clip_input) starts while the live event is still stopping.
+# The streaming locator is created on the MP4 asset right away; it serves the MP4 once the job has finished.
+# If any step fails, the other steps are cancelled and the error is raised.
+async def stop_and_export_live_event(live_event_name, live_output_name, mp4_asset_name=None, job_name=None, streaming_locator_name=None,
+                                     transform_name=COPY_TO_MP4_TRANSFORM_NAME, job_timeout_seconds=60 * 60, context=None):
+    ctx = encoding_job_helpers.get_context(context)
+    timeline = StepTimeline()
+    uniqueness = uuid.uuid4().hex[:8]
+    mp4_asset_name = mp4_asset_name or f"{live_event_name}-mp4-{uniqueness}"
+    job_name = job_name or f"{live_event_name}-copy-{uniqueness}"
+    streaming_locator_name = streaming_locator_name or f"{live_event_name}-mp4-locator-{uniqueness}"
+
+    async def delete_live_output():
+        live_output = await ctx.client.live_outputs.get(ctx.resource_group, ctx.account_name, live_event_name, live_output_name)
+        poller = await ctx.client.live_outputs.begin_delete(ctx.resource_group, ctx.account_name, live_event_name, live_output_name)
+        await poller.result()
+        return live_output.asset_name
+
+    async def stop_live_event():
+        poller = await ctx.client.live_events.begin_stop(ctx.resource_group, ctx.account_name, live_event_name,
+                                                         LiveEventActionInput(remove_outputs_on_stop=False))
+        await poller.result()
+
+    async def create_transform():
+        await encoding_job_helpers.create_or_update_transform(transform_name, create_copy_to_mp4_transform(), context=ctx)
+
+    async def create_mp4_asset():
+        return await ctx.client.assets.create_or_update(ctx.resource_group, ctx.account_name, mp4_asset_name, {})
+
+    async def submit_copy_job():
+        job_input = create_archive_clip_input(live_output_task.result())
+        return await encoding_job_helpers.submit_job(transform_name, job_name, job_input, mp4_asset_name, context=ctx)
+
+    async def wait_for_copy_job():
+        job = await encoding_job_helpers.wait_for_job_to_finish(transform_name, job_name, timeout_seconds=job_timeout_seconds, context=ctx)
+        if job.state != "Finished":
+            raise Exception(f"Copy job {job_name} ended in state {job.state}")
+        return job
+
+    async def create_streaming_locator():
+        return await encoding_job_helpers.create_streaming_locator(mp4_asset_name, streaming_locator_name, context=ctx)
+
+    async def print_streaming_urls():
+        await encoding_job_helpers.get_streaming_urls(streaming_locator_name, context=ctx)
+
+    print(f"Stopping live event {live_event_name} and exporting its archive to {mp4_asset_name}...")
+    live_output_task = asyncio.ensure_future(timeline.run_after("Delete live output", delete_live_output))
+    transform_task = asyncio.ensure_future(timeline.run_after("Create transform", create_transform))
+    asset_task = asyncio.ensure_future(timeline.run_after("Create MP4 asset", create_mp4_asset))
+    stop_task = asyncio.ensure_future(timeline.run_after("Stop live event", stop_live_event, live_output_task))
+    submit_task = asyncio.ensure_future(timeline.run_after("Submit copy job", submit_copy_job, live_output_task, transform_task, asset_task))
+    job_task = asyncio.ensure_future(timeline.run_after("Copy job", wait_for_copy_job, submit_task))
+    locator_task = asyncio.ensure_future(timeline.run_after("Create streaming locator", create_streaming_locator, asset_task))
+    urls_task = asyncio.ensure_future(timeline.run_after("Get streaming URLs", print_streaming_urls, job_task, locator_task))
+    await gather_steps([live_output_task, transform_task, asset_task, stop_task, submit_task, job_task, locator_task, urls_task])
+
+    return LiveEventExport(
+        archive_asset_name=live_output_task.result(),
+        mp4_asset_name=mp4_asset_name,
+        job=job_task.result(),
+        streaming_locator=locator_task.result(),
+        timeline=timeline)
+
+
+# Pseudo state of a live event that is no longer listed
+LIVE_EVENT_DELETED = "Deleted"
+
+
+# A change of resource state of one live event between two polls of LiveEventHealthMonitor.
+# old_state is None for a live event that wasn't there at the previous poll.
+class LiveEventTransition:
+    def __init__(self, live_event_name, old_state, new_state, unexpected=False):
+        self.live_event_name = live_event_name
+        self.old_state = old_state
+        self.new_state = new_state
+        self.unexpected = unexpected
+        self.time = datetime.now(timezone.utc)
+
+    def __str__(self):
+        flag = " (unexpected)" if self.unexpected else ""
+        return f"{format_utc_time(self.time)} {self.live_event_name}: {self.old_state or 'new'} -> {self.new_state}{flag}"
+
+
+# Watches the resource state of every live event in the account with a single polling loop.
+# Each poll is one paged live_events.list call, so its cost grows with the number of pages (100 live events per page),
+# not with the number of live events. The result is compared with the previous poll and only the changes are reported,
+# to on_transition (a function or coroutine function taking a LiveEventTransition) and in self.transitions.
+# A live event that leaves Running or StandBy for anything but Running or Starting (stopped, deallocated, deleted...)
+# is flagged as unexpected, unless expect() was called for it beforehand, e.g. right before stopping it on purpose.
+# An expectation is used up by the first change it matches, and is dropped after expect_timeout seconds if none happens.
+#
+#   async with LiveEventHealthMonitor(interval=30, on_transition=print) as monitor:
+#       ...
+class LiveEventHealthMonitor:
+    def __init__(self, interval=30, on_transition=None, expect_timeout=900, context=None):
+        self.interval = interval
+        self.expect_timeout = expect_timeout
+        self.on_transition = on_transition
+        self.context = context
+        # Live event name -> resource state at the last poll
+        self.snapshot = None
+        self.transitions = []
+        self.polls = 0
+        self.pages = 0
+        self.errors = 0
+        # Live event name -> (expected states, monotonic deadline)
+        self._expected = {}
+        self._task = None
+
+    # Marks the next change of the live event to one of the given states as planned.
+    # timeout overrides expect_timeout for this expectation.
+    def expect(self, live_event_name, *states, timeout=None):
+        timeout = self.expect_timeout if timeout is None else timeout
+        self._expected[live_event_name] = (states, time.monotonic() + timeout)
+
+    # Lists the live events once and returns the transitions since the previous poll.
+    # The first poll only records the states, unless report_new is True.
+    async def poll(self, report_new=False):
+        ctx = encoding_job_helpers.get_context(self.context)
+        snapshot = {}
+        async for page in ctx.client.live_events.list(ctx.resource_group, ctx.account_name).by_page():
+            self.pages += 1
+            async for live_event in page:
+                snapshot[live_event.name] = getattr(live_event.resource_state, "value", live_event.resource_state)
+        self.polls += 1
+        self._expire_expectations()
+
+        previous = self.snapshot
+        self.snapshot = snapshot
+        if previous is None:
+            previous = {}
+            if not report_new:
+                return []
+
+        transitions = []
+        for name, state in snapshot.items():
+            if previous.get(name) != state:
+                transitions.append(self._transition(name, previous.get(name), state))
+        for name, state in previous.items():
+            if name not in snapshot:
+                transitions.append(self._transition(name, state, LIVE_EVENT_DELETED))
+
+        for transition in transitions:
+            self.transitions.append(transition)
+            if self.on_transition is not None:
+                result = self.on_transition(transition)
+                if asyncio.iscoroutine(result):
+                    await result
+        return transitions
+
+    async def run(self):
+        # A monitor that has polled already waits for the interval before polling again
+        if self.snapshot is not None:
+            await asyncio.sleep(self.interval)
+        while True:
+            try:
+                await self.poll()
+            except Exception as err:
+                # A failed poll is retried at the next interval; the snapshot stays as it was
+                self.errors += 1
+                print(f"Error listing the live events: {err}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self.run())
+        return self
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def print_summary(self):
+        states = collections.Counter((self.snapshot or {}).values())
+        print(f"{len(self.snapshot or {})} live events" + "".join(f", {count} {state}" for state, count in sorted(states.items())))
+        unexpected = sum(1 for transition in self.transitions if transition.unexpected)
+        print(f"{self.polls} polls using {self.pages} list requests, {self.errors} failed;"
+              f" {len(self.transitions)} transitions, {unexpected} unexpected")
+
+    def _expire_expectations(self):
+        now = time.monotonic()
+        for name, (states, deadline) in list(self._expected.items()):
+            if deadline <= now:
+                print(f"Live event {name} did not reach {' or '.join(states)} in time, no longer expecting it")
+                del self._expected[name]
+
+    def _transition(self, name, old_state, new_state):
+        expected = self._expected.get(name)
+        if expected is not None and new_state in expected[0]:
+            del self._expected[name]
+            unexpected = False
+        else:
+            unexpected = old_state in ("Running", "StandBy") and new_state not in ("Running", "Starting")
+        return LiveEventTransition(name, old_state, new_state, unexpected)
@@ -0,0 +1,323 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Detects when a live stream goes live by polling its manifests, instead of refreshing a player by hand.
+# Each URL (the live event preview URL, or the HLS/DASH URLs of a live output) is polled with exponential backoff
+# until the manifest lists its first segment. After that the probe keeps polling at half the segment duration
+# until a few more segments have appeared, and reports:
+#   - how long it took until the manifest was served at all, and until the first segment appeared
+#   - the segment duration declared in the manifest and the cadence at which new segments were observed
+#   - the manifest latency: the round trip time of the manifest requests, and for manifests that carry wall clock
+#     times (HLS EXT-X-PROGRAM-DATE-TIME, DASH availabilityStartTime) how far the live edge is behind now
+# Smooth (the default preview format), HLS (m3u8) and DASH (mpd) manifests are understood.
+# The emulator in Emulator/ams_emulator.py serves simulated live manifests, so the prober can be tried offline.
+#
+# Usage:
+#   probe_module = SourceFileLoader("manifest_probe", "Common/manifest_probe.py").load_module()
+#   prober = probe_module.ManifestProber({"preview": preview_url, "HLS": hls_manifest, "DASH": dash_manifest})
+#   await prober.run()
+#   prober.print_report()
+
+from datetime import datetime, timezone
+from urllib.parse import urljoin
+from xml.etree import ElementTree
+import asyncio
+import re
+import statistics
+import time
+import aiohttp
+
+HLS = "HLS"
+DASH = "DASH"
+SMOOTH = "Smooth"
+
+# Manifests whose live edge is further than this from now don't carry wall clock times (for example encoder timestamps)
+MAX_PLAUSIBLE_EDGE_DELAY = 24 * 3600
+
+
+def get_manifest_protocol(url):
+    lower = url.lower()
+    if "m3u8" in lower:
+        return HLS
+    if "mpd" in lower:
+        return DASH
+    return SMOOTH
+
+
+def parse_iso_time(value):
+    value = value.strip().replace("Z", "+00:00")
+    # fromisoformat only accepts up to six fractional digits
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+# What a manifest says about its segments. keys identify the segments (HLS media sequence numbers, DASH and Smooth
+# start times), so that segments which show up between two polls can be told apart from ones already seen.
+# live_edge is the wall clock time (seconds since the epoch) at which the last segment ends, if the manifest has one.
+class ManifestSnapshot:
+    def __init__(self, protocol, keys=None, durations=None, live_edge=None, variant_url=None):
+        self.protocol = protocol
+        self.keys = keys or []
+        self.durations = durations or []
+        self.live_edge = live_edge
+        self.variant_url = variant_url
+
+    @property
+    def segment_count(self):
+        return len(self.keys)
+
+
+# Parses an HLS playlist. A multivariant (master) playlist only gives the URL of its first variant.
+def parse_hls_playlist(text, url):
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines or lines[0] != "#EXTM3U":
+        raise ValueError("Not an HLS playlist")
+
+    for index, line in enumerate(lines):
+        if line.startswith("#EXT-X-STREAM-INF"):
+            uri = next((candidate for candidate in lines[index + 1:] if not candidate.startswith("#")), None)
+            if uri is not None:
+                return ManifestSnapshot(HLS, variant_url=urljoin(url, uri))
+
+    sequence = 0
+    keys, durations = [], []
+    program_date_time = None
+    live_edge = None
+    pending_duration = None
+    for line in lines:
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+            program_date_time = parse_iso_time(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            pending_duration = float(line.split(":", 1)[1].split(",")[0])
+        elif not line.startswith("#") and pending_duration is not None:
+            keys.append(sequence + len(keys))
+            durations.append(pending_duration)
+            # The date applies to the segment that follows it and carries over to the segments after that
+            if program_date_time is not None:
+                program_date_time += pending_duration
+                live_edge = program_date_time
+            pending_duration = None
+    return ManifestSnapshot(HLS, keys, durations, live_edge)
+
+
+def local_name(element):
+    return element.tag.rsplit("}", 1)[-1]
+
+
+# Expands the S elements of a DASH SegmentTimeline or the c elements of a Smooth StreamIndex into (start, duration)
+def expand_timeline(elements):
+    segments = []
+    next_start = 0
+    for element in elements:
+        start = int(element.get("t", next_start))
+        duration = int(element.get("d", 0))
+        for _ in range(int(element.get("r", 0)) + 1):
+            segments.append((start, duration))
+            start += duration
+        next_start = start
+    return segments
+
+
+def parse_dash_manifest(text):
+    root = ElementTree.fromstring(text)
+    if local_name(root) != "MPD":
+        raise ValueError("Not a DASH manifest")
+
+    adaptation_sets = [element for element in root.iter() if local_name(element) == "AdaptationSet"]
+    video_sets = [element for element in adaptation_sets
+                  if element.get("contentType") == "video" or (element.get("mimeType") or "").startswith("video")]
+    for adaptation_set in video_sets + adaptation_sets:
+        template = next((element for element in adaptation_set.iter() if local_name(element) == "SegmentTemplate"), None)
+        if template is None:
+            continue
+        timeline = next((element for element in template if local_name(element) == "SegmentTimeline"), None)
+        if timeline is None:
+            continue
+        timescale = int(template.get("timescale", 1))
+        offset = int(template.get("presentationTimeOffset", 0))
+        segments = expand_timeline(element for element in timeline if local_name(element) == "S")
+        live_edge = None
+        if segments and root.get("availabilityStartTime"):
+            start, duration = segments[-1]
+            live_edge = parse_iso_time(root.get("availabilityStartTime")) + (start + duration - offset) / timescale
+        return ManifestSnapshot(DASH, [start for start, _ in segments], [duration / timescale for _, duration in segments], live_edge)
+    return ManifestSnapshot(DASH)
+
+
+def parse_smooth_manifest(text):
+    root = ElementTree.fromstring(text)
+    if local_name(root) != "SmoothStreamingMedia":
+        raise ValueError("Not a Smooth Streaming manifest")
+
+    timescale = int(root.get("TimeScale", 10000000))
+    stream_indexes = [element for element in root if local_name(element) == "StreamIndex"]
+    stream_indexes.sort(key=lambda element: element.get("Type") != "video")
+    if not stream_indexes:
+        return ManifestSnapshot(SMOOTH)
+    segments = expand_timeline(element for element in stream_indexes[0] if local_name(element) == "c")
+    # Smooth manifests carry encoder timestamps only, so there is no live edge to compare with the wall clock
+    return ManifestSnapshot(SMOOTH, [start for start, _ in segments], [duration / timescale for _, duration in segments])
+
+
+def parse_manifest(protocol, text, url):
+    if protocol == HLS:
+        return parse_hls_playlist(text, url)
+    if protocol == DASH:
+        return parse_dash_manifest(text)
+    return parse_smooth_manifest(text)
+
+
+# Polls one manifest URL until it has gone live. The results are kept on the probe.
+class ManifestProbe:
+    def __init__(self, name, url, protocol=None, went_live=None):
+        self.name = name
+        self.url = url
+        self.protocol = protocol or get_manifest_protocol(url)
+        # An optional asyncio.Event that is set when the first segment appears
+        self.went_live = went_live
+        self.status = "waiting"
+        self.polls = 0
+        self.last_error = None
+        # Seconds since the probe started
+        self.first_response_seconds = None
+        self.first_segment_seconds = None
+        self.segment_duration = None
+        self.observed_cadence = None
+        self.fetch_latencies = []
+        self.edge_delays = []
+        self._start = None
+        self._seen_keys = set()
+        self._appearances = []
+
+    @property
+    def is_live(self):
+        return self.first_segment_seconds is not None
+
+    async def run(self, session, timeout_seconds=600, min_interval=1, max_interval=5, backoff_factor=1.5, observe_segments=3):
+        self._start = time.perf_counter()
+        interval = min_interval
+        while True:
+            snapshot = await self._poll(session)
+            elapsed = time.perf_counter() - self._start
+            if snapshot is not None and snapshot.segment_count > 0:
+                if self.first_segment_seconds is None:
+                    self.first_segment_seconds = elapsed
+                    self.status = "live"
+                    print(f"{self.name}: first segment after {elapsed:.1f}s ({self.url})")
+                    if self.went_live is not None:
+                        self.went_live.set()
+                self._record(snapshot)
+                # Segments that appear after the first poll show the cadence at which the packager publishes them
+                if len(self._appearances) > observe_segments:
+                    break
+                interval = max(min_interval, self.segment_duration / 2)
+            else:
+                interval = min(interval * backoff_factor, max_interval)
+            if elapsed + interval > timeout_seconds:
+                if not self.is_live:
+                    self.status = "timed out"
+                break
+            await asyncio.sleep(interval)
+        self._compute_cadence()
+        return self
+
+    # Fetches the manifest (and for an HLS multivariant playlist its first variant) and parses it.
+    # Returns None while the manifest isn't available yet.
+    async def _poll(self, session):
+        self.polls += 1
+        url = self.url
+        try:
+            for _ in range(2):
+                request_start = time.perf_counter()
+                async with session.get(url) as response:
+                    text = await response.text()
+                self.fetch_latencies.append(time.perf_counter() - request_start)
+                if response.status != 200:
+                    self.last_error = f"HTTP {response.status}"
+                    return None
+                if self.first_response_seconds is None:
+                    self.first_response_seconds = time.perf_counter() - self._start
+                snapshot = parse_manifest(self.protocol, text, url)
+                if snapshot.variant_url is None:
+                    return snapshot
+                url = snapshot.variant_url
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, ElementTree.ParseError) as err:
+            self.last_error = f"{type(err).__name__}: {err}"
+            return None
+
+    def _record(self, snapshot):
+        now = time.perf_counter()
+        new_keys = [key for key in snapshot.keys if key not in self._seen_keys]
+        if self._seen_keys:
+            self._appearances.extend(now for _ in new_keys)
+        self._seen_keys.update(new_keys)
+        self.segment_duration = statistics.mean(snapshot.durations)
+        if snapshot.live_edge is not None:
+            edge_delay = time.time() - snapshot.live_edge
+            if abs(edge_delay) < MAX_PLAUSIBLE_EDGE_DELAY:
+                self.edge_delays.append(edge_delay)
+
+    def _compute_cadence(self):
+        if len(self._appearances) >= 2:
+            self.observed_cadence = (self._appearances[-1] - self._appearances[0]) / (len(self._appearances) - 1)
+
+    def summary(self):
+        parts = [f"{self.name} [{self.protocol}] {self.status}"]
+        if self.first_response_seconds is not None:
+            parts.append(f"manifest after {self.first_response_seconds:.1f}s")
+        if self.first_segment_seconds is not None:
+            parts.append(f"first segment after {self.first_segment_seconds:.1f}s")
+        if self.segment_duration is not None:
+            parts.append(f"segments {self.segment_duration:.2f}s")
+        if self.observed_cadence is not None:
+            parts.append(f"observed cadence {self.observed_cadence:.2f}s")
+        if self.fetch_latencies:
+            latencies = sorted(self.fetch_latencies)
+            parts.append(f"fetch p50 {latencies[len(latencies) // 2] * 1000:.0f}ms max {latencies[-1] * 1000:.0f}ms")
+        if self.edge_delays:
+            parts.append(f"live edge {statistics.mean(self.edge_delays):.1f}s behind")
+        if not self.is_live and self.last_error:
+            parts.append(f"last error {self.last_error}")
+        return ", ".join(parts) + f" ({self.polls} polls)"
+
+
+# Probes several manifest URLs at the same time. urls maps a display name to a manifest URL.
+class ManifestProber:
+    def __init__(self, urls, timeout_seconds=600, min_interval=1, max_interval=5, backoff_factor=1.5, observe_segments=3,
+                 request_timeout=10):
+        # Set as soon as any of the manifests lists a segment
+        self.went_live = asyncio.Event()
+        self.probes = [ManifestProbe(name, url, went_live=self.went_live) for name, url in urls.items()]
+        self.timeout_seconds = timeout_seconds
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.observe_segments = observe_segments
+        self.request_timeout = request_timeout
+
+    # Polls every URL until it has gone live or timed out and returns the probes
+    async def run(self):
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await asyncio.gather(*(probe.run(session, self.timeout_seconds, self.min_interval, self.max_interval, self.backoff_factor,
+                                             self.observe_segments) for probe in self.probes))
+        return self.probes
+
+    # Seconds from the start of the probe until the first segment showed up on any URL
+    @property
+    def time_to_first_segment(self):
+        return min((probe.first_segment_seconds for probe in self.probes if probe.is_live), default=None)
+
+    def print_report(self):
+        if self.time_to_first_segment is None:
+            print(f"No segments appeared within {self.timeout_seconds}s")
+        else:
+            print(f"Live after {self.time_to_first_segment:.1f}s")
+        for probe in self.probes:
+            print(f"  {probe.summary()}")
@@ -0,0 +1,240 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Finds and tears down resources that samples and test runs leaked: live events, live outputs, streaming locators,
+# jobs and assets. Resources are matched against ReaperRules (name prefix, minimum age, tags) and removed in
+# dependency order, so nothing is deleted while something else still uses it:
+#   1. live outputs, then live events (stopped first if they are running or in StandBy)
+#   2. streaming locators (including the locators of assets that are reaped)
+#   3. jobs (cancelled first if they are still running, and deleted once the cancellation has completed)
+#   4. assets (except the archive asset of a live output that is kept)
+# Within a phase, stops and deletes run in parallel with bounded concurrency.
+# The reaper runs as a dry run unless dry_run=False is passed; a dry run only prints what would be removed.
+#
+# Usage:
+#   reaper_module = SourceFileLoader("resource_reaper", "Common/resource_reaper.py").load_module()
+#   reaper = reaper_module.ResourceReaper([reaper_module.ReaperRule(prefix="stan-pass", older_than=timedelta(hours=6))])
+#   await reaper.run()
+
+from datetime import datetime, timezone
+import asyncio
+import os
+import sys
+from importlib.machinery import SourceFileLoader
+from azure.core.exceptions import ResourceNotFoundError
+from azure.mgmt.media.models import LiveEventActionInput
+
+# Use the helpers module that the sample has loaded already, so that the account it set up is the one used here
+encoding_job_helpers = sys.modules.get("encoding_job_helpers") or SourceFileLoader(
+    "encoding_job_helpers", os.path.join(os.path.dirname(os.path.abspath(__file__)), "encoding_job_helpers.py")).load_module()
+
+LIVE_EVENT = "LiveEvent"
+LIVE_OUTPUT = "LiveOutput"
+STREAMING_LOCATOR = "StreamingLocator"
+JOB = "Job"
+ASSET = "Asset"
+RESOURCE_TYPES = (LIVE_EVENT, LIVE_OUTPUT, STREAMING_LOCATOR, JOB, ASSET)
+
+# Live event states that have to be stopped before the live event can be deleted
+LIVE_EVENT_STOP_STATES = ("Running", "StandBy", "Starting", "Allocating")
+
+
+# A resource matches a rule when it matches every criterion the rule sets:
+# its name starts with prefix, it was created more than older_than (a timedelta) ago, and it has all the given tags.
+# Only live events carry tags, so a rule with tags never matches other resource types.
+# resource_types limits the rule to some of LIVE_EVENT, LIVE_OUTPUT, STREAMING_LOCATOR, JOB and ASSET.
+class ReaperRule:
+    def __init__(self, prefix=None, older_than=None, tags=None, resource_types=None):
+        self.prefix = prefix
+        self.older_than = older_than
+        self.tags = tags
+        self.resource_types = resource_types
+
+    def matches(self, resource_type, resource, now):
+        if self.resource_types is not None and resource_type not in self.resource_types:
+            return False
+        if self.prefix is not None and not resource.name.startswith(self.prefix):
+            return False
+        if self.older_than is not None:
+            created = get_created_time(resource)
+            if created is None or now - created < self.older_than:
+                return False
+        if self.tags is not None:
+            tags = getattr(resource, "tags", None) or {}
+            if any(tags.get(name) != value for name, value in self.tags.items()):
+                return False
+        return True
+
+    def __str__(self):
+        criteria = []
+        if self.prefix is not None:
+            criteria.append(f"prefix '{self.prefix}'")
+        if self.older_than is not None:
+            criteria.append(f"older than {self.older_than}")
+        if self.tags is not None:
+            criteria.append(f"tags {self.tags}")
+        return ", ".join(criteria) or "everything"
+
+
+def get_created_time(resource):
+    created = getattr(resource, "created", None)
+    if created is None and getattr(resource, "system_data", None) is not None:
+        created = resource.system_data.created_at
+    if created is not None and created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created
+
+
+# One resource to remove. parent is the live event of a live output or the transform of a job.
+class ReaperAction:
+    def __init__(self, resource_type, name, parent=None, reason="", stop_first=False):
+        self.resource_type = resource_type
+        self.name = name
+        self.parent = parent
+        self.reason = reason
+        self.stop_first = stop_first
+        self.status = "planned"
+
+    @property
+    def description(self):
+        verb = {LIVE_EVENT: "stop and delete", JOB: "cancel and delete"}[self.resource_type] if self.stop_first else "delete"
+        target = f"{self.parent}/{self.name}" if self.parent else self.name
+        return f"{verb} {self.resource_type} {target}"
+
+
+class ResourceReaper:
+    def __init__(self, rules, dry_run=True, max_concurrency=8, cancel_timeout_seconds=300, context=None):
+        self.rules = rules
+        self.dry_run = dry_run
+        self.max_concurrency = max_concurrency
+        self.cancel_timeout_seconds = cancel_timeout_seconds
+        self.context = context
+        self.actions = []
+
+    # Lists everything in the account and works out what to remove, grouped by phase in teardown order
+    async def plan(self):
+        ctx = encoding_job_helpers.get_context(self.context)
+        now = datetime.now(timezone.utc)
+
+        async def collect(pager):
+            return [item async for item in pager]
+
+        live_events, assets, locators, transforms = await asyncio.gather(
+            collect(ctx.client.live_events.list(ctx.resource_group, ctx.account_name)),
+            collect(ctx.client.assets.list(ctx.resource_group, ctx.account_name)),
+            collect(ctx.client.streaming_locators.list(ctx.resource_group, ctx.account_name)),
+            collect(ctx.client.transforms.list(ctx.resource_group, ctx.account_name)))
+        live_outputs_per_event = await asyncio.gather(*(
+            collect(ctx.client.live_outputs.list(ctx.resource_group, ctx.account_name, live_event.name)) for live_event in live_events))
+        jobs_per_transform = await asyncio.gather(*(
+            collect(ctx.client.jobs.list(ctx.resource_group, ctx.account_name, transform.name)) for transform in transforms))
+
+        live_event_actions = []
+        live_output_actions = []
+        kept_archive_assets = set()
+        for live_event, live_outputs in zip(live_events, live_outputs_per_event):
+            rule = self._match(LIVE_EVENT, live_event, now)
+            if rule is not None:
+                live_event_actions.append(ReaperAction(LIVE_EVENT, live_event.name, reason=str(rule),
+                                                       stop_first=live_event.resource_state in LIVE_EVENT_STOP_STATES))
+            for live_output in live_outputs:
+                output_rule = self._match(LIVE_OUTPUT, live_output, now)
+                if output_rule is not None:
+                    live_output_actions.append(ReaperAction(LIVE_OUTPUT, live_output.name, parent=live_event.name, reason=str(output_rule)))
+                elif rule is None:
+                    # The live output keeps recording into its asset, so that asset must stay
+                    kept_archive_assets.add(live_output.asset_name)
+                # Live outputs of a reaped live event are removed when the live event is stopped
+
+        asset_actions = []
+        reaped_assets = set()
+        for asset in assets:
+            rule = self._match(ASSET, asset, now)
+            if rule is None:
+                continue
+            if asset.name in kept_archive_assets:
+                print(f"Keeping asset {asset.name}: a live output that is not reaped is recording into it")
+                continue
+            asset_actions.append(ReaperAction(ASSET, asset.name, reason=str(rule)))
+            reaped_assets.add(asset.name)
+
+        locator_actions = []
+        for locator in locators:
+            rule = self._match(STREAMING_LOCATOR, locator, now)
+            if rule is not None:
+                locator_actions.append(ReaperAction(STREAMING_LOCATOR, locator.name, reason=str(rule)))
+            elif locator.asset_name in reaped_assets:
+                locator_actions.append(ReaperAction(STREAMING_LOCATOR, locator.name, reason=f"asset {locator.asset_name} is reaped"))
+
+        job_actions = []
+        for transform, jobs in zip(transforms, jobs_per_transform):
+            for job in jobs:
+                rule = self._match(JOB, job, now)
+                if rule is not None:
+                    job_actions.append(ReaperAction(JOB, job.name, parent=transform.name, reason=str(rule),
+                                                    stop_first=job.state not in encoding_job_helpers.JOB_FINAL_STATES))
+
+        self.actions = live_output_actions + live_event_actions + locator_actions + job_actions + asset_actions
+        return [live_output_actions, live_event_actions, locator_actions, job_actions, asset_actions]
+
+    # Plans and, unless this is a dry run, removes the matching resources. Returns the list of ReaperActions.
+    async def run(self):
+        phases = await self.plan()
+        if self.dry_run:
+            print(f"Dry run: {len(self.actions)} resources would be removed")
+            self.print_report()
+            return self.actions
+
+        ctx = encoding_job_helpers.get_context(self.context)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        for phase in phases:
+            await asyncio.gather(*(self._execute(ctx, action, semaphore) for action in phase))
+        self.print_report()
+        return self.actions
+
+    def print_report(self):
+        for action in self.actions:
+            print(f"[{action.status}] {action.description} ({action.reason})")
+        if not self.dry_run:
+            failed = sum(1 for action in self.actions if action.status.startswith("failed"))
+            print(f"Removed {len(self.actions) - failed} resources, {failed} failed")
+
+    def _match(self, resource_type, resource, now):
+        for rule in self.rules:
+            if rule.matches(resource_type, resource, now):
+                return rule
+        return None
+
+    async def _execute(self, ctx, action, semaphore):
+        async with semaphore:
+            try:
+                if action.resource_type == LIVE_OUTPUT:
+                    poller = await ctx.client.live_outputs.begin_delete(ctx.resource_group, ctx.account_name, action.parent, action.name)
+                    await poller.result()
+                elif action.resource_type == LIVE_EVENT:
+                    if action.stop_first:
+                        poller = await ctx.client.live_events.begin_stop(ctx.resource_group, ctx.account_name, action.name,
+                                                                         LiveEventActionInput(remove_outputs_on_stop=True))
+                        await poller.result()
+                    poller = await ctx.client.live_events.begin_delete(ctx.resource_group, ctx.account_name, action.name)
+                    await poller.result()
+                elif action.resource_type == STREAMING_LOCATOR:
+                    await ctx.client.streaming_locators.delete(ctx.resource_group, ctx.account_name, action.name)
+                elif action.resource_type == JOB:
+                    if action.stop_first:
+                        await ctx.client.jobs.cancel_job(ctx.resource_group, ctx.account_name, action.parent, action.name)
+                        # A job can't be deleted while it is still Canceling
+                        job = await encoding_job_helpers.wait_for_job_to_finish(action.parent, action.name, sleep_interval=5,
+                                                                                timeout_seconds=self.cancel_timeout_seconds, context=ctx)
+                        if job.state not in encoding_job_helpers.JOB_FINAL_STATES:
+                            action.status = f"failed: job still {job.state} after {self.cancel_timeout_seconds} seconds"
+                            return
+                    await ctx.client.jobs.delete(ctx.resource_group, ctx.account_name, action.parent, action.name)
+                elif action.resource_type == ASSET:
+                    await ctx.client.assets.delete(ctx.resource_group, ctx.account_name, action.name)
+                    encoding_job_helpers.invalidate_container_sas(action.name, context=ctx)
+                action.status = "removed"
+            except ResourceNotFoundError:
+                action.status = "already gone"
+            except Exception as err:
+                action.status = f"failed: {err}"
@@ -0,0 +1,217 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Scales a streaming endpoint with begin_scale so that its capacity follows the audience.
+# A metrics source reports the observed egress (Mbps) or the number of concurrent viewers, which is turned into egress
+# with viewer_bitrate_mbps. Every streaming unit serves capacity_per_unit_mbps. The autoscaler looks at the peak demand
+# of the last window_samples samples and, with hysteresis so that it doesn't flap around a threshold:
+#   - scales up when the demand is above scale_up_threshold of the current capacity
+#   - scales down when the demand is below scale_down_threshold of the current capacity
+# both to the number of units that runs at target_utilization, within min_units and max_units.
+# At most one scale operation runs at a time, and two operations are at least min_seconds_between_scales apart.
+#
+# Metrics sources are objects with an async read() method that returns the next MetricSample, or None when they
+# have no more samples. ReplayMetricsSource replays a CSV file, for trying out settings offline;
+# FunctionMetricsSource wraps a function that reads the current egress or viewers from a monitoring system.
+#
+# Usage:
+#   autoscaler_module = SourceFileLoader("streaming_endpoint_autoscaler", "Common/streaming_endpoint_autoscaler.py").load_module()
+#   source = autoscaler_module.ReplayMetricsSource("metrics.csv")
+#   autoscaler = autoscaler_module.StreamingEndpointAutoscaler("default", source, max_units=10, dry_run=True)
+#   await autoscaler.run()
+
+import asyncio
+import collections
+import csv
+import math
+import os
+import sys
+import time
+from importlib.machinery import SourceFileLoader
+from azure.mgmt.media.models import StreamingEntityScaleUnit
+
+# Use the helpers module that the sample has loaded already, so that the account it set up is the one used here
+encoding_job_helpers = sys.modules.get("encoding_job_helpers") or SourceFileLoader(
+    "encoding_job_helpers", os.path.join(os.path.dirname(os.path.abspath(__file__)), "encoding_job_helpers.py")).load_module()
+
+
+# One observation of the audience. time is in seconds (time.time() for live sources).
+class MetricSample:
+    def __init__(self, time, egress_mbps=None, viewers=None):
+        self.time = time
+        self.egress_mbps = egress_mbps
+        self.viewers = viewers
+
+
+# Replays samples from a CSV file with the columns seconds, egress_mbps and viewers (either of the last two can be empty).
+# seconds is the offset of the sample from the start of the recording. The samples are returned as fast as they are
+# read, so a day of metrics replays in moments; the autoscaler uses the sample times for its timing.
+class ReplayMetricsSource:
+    def __init__(self, path, start_time=0.0):
+        self.samples = collections.deque()
+        with open(path, newline="") as metrics_file:
+            for row in csv.DictReader(metrics_file):
+                egress = row.get("egress_mbps")
+                viewers = row.get("viewers")
+                self.samples.append(MetricSample(
+                    start_time + float(row["seconds"]),
+                    egress_mbps=float(egress) if egress else None,
+                    viewers=int(viewers) if viewers else None))
+
+    async def read(self):
+        return self.samples.popleft() if self.samples else None
+
+
+# Reads samples from a function (or coroutine function) that returns the current egress in Mbps and number of viewers,
+# either of which can be None. Waits interval seconds between two reads, except before the first one.
+class FunctionMetricsSource:
+    def __init__(self, function, interval=60):
+        self.function = function
+        self.interval = interval
+        self._read_before = False
+
+    async def read(self):
+        if self._read_before:
+            await asyncio.sleep(self.interval)
+        self._read_before = True
+        result = self.function()
+        if asyncio.iscoroutine(result):
+            result = await result
+        egress_mbps, viewers = result
+        return MetricSample(time.time(), egress_mbps=egress_mbps, viewers=viewers)
+
+
+# What the autoscaler decided for one sample. action is "scale up", "scale down", "hold" or why it held
+class ScaleDecision:
+    def __init__(self, time, demand_mbps, current_units, target_units, action):
+        self.time = time
+        self.demand_mbps = demand_mbps
+        self.current_units = current_units
+        self.target_units = target_units
+        self.action = action
+
+    def __str__(self):
+        return f"t={self.time:.0f}s demand {self.demand_mbps:.0f} Mbps, {self.current_units} units -> {self.target_units}: {self.action}"
+
+
+class StreamingEndpointAutoscaler:
+    def __init__(self, streaming_endpoint_name, metrics_source, min_units=1, max_units=10, capacity_per_unit_mbps=200,
+                 viewer_bitrate_mbps=3.0, target_utilization=0.7, scale_up_threshold=0.8, scale_down_threshold=0.5,
+                 min_seconds_between_scales=600, window_samples=3, dry_run=False, context=None):
+        if not scale_down_threshold < target_utilization < scale_up_threshold:
+            raise ValueError("scale_down_threshold < target_utilization < scale_up_threshold is required for hysteresis")
+        self.streaming_endpoint_name = streaming_endpoint_name
+        self.metrics_source = metrics_source
+        self.min_units = min_units
+        self.max_units = max_units
+        self.capacity_per_unit_mbps = capacity_per_unit_mbps
+        self.viewer_bitrate_mbps = viewer_bitrate_mbps
+        self.target_utilization = target_utilization
+        self.scale_up_threshold = scale_up_threshold
+        self.scale_down_threshold = scale_down_threshold
+        self.min_seconds_between_scales = min_seconds_between_scales
+        self.dry_run = dry_run
+        self.context = context
+        self.current_units = None
+        self.decisions = []
+        self.scale_operations = 0
+        self._window = collections.deque(maxlen=window_samples)
+        self._last_scale_time = None
+        self._scale_task = None
+        # For the summary: (time, units, demand) of every sample
+        self._history = []
+
+    # Reads the current scale units of the streaming endpoint
+    async def start(self):
+        ctx = encoding_job_helpers.get_context(self.context)
+        streaming_endpoint = await ctx.client.streaming_endpoints.get(ctx.resource_group, ctx.account_name, self.streaming_endpoint_name)
+        self.current_units = streaming_endpoint.scale_units or 0
+        print(f"Streaming endpoint {self.streaming_endpoint_name} has {self.current_units} scale units")
+        return self
+
+    # Reads and acts on samples until the metrics source runs out
+    async def run(self):
+        if self.current_units is None:
+            await self.start()
+        while True:
+            sample = await self.metrics_source.read()
+            if sample is None:
+                break
+            decision = self.handle_sample(sample)
+            if decision.action in ("scale up", "scale down"):
+                print(decision)
+                # A replayed source has its next sample ready right away, so finish the operation before reading on
+                await self.close()
+        await self.close()
+        return self.decisions
+
+    # Decides what to do about one sample and starts the scale operation if there is one
+    def handle_sample(self, sample):
+        demand = sample.egress_mbps if sample.egress_mbps is not None else (sample.viewers or 0) * self.viewer_bitrate_mbps
+        self._window.append(demand)
+        self._history.append((sample.time, self.current_units, demand))
+        peak = max(self._window)
+        capacity = self.current_units * self.capacity_per_unit_mbps
+        target = min(self.max_units, max(self.min_units, math.ceil(peak / (self.capacity_per_unit_mbps * self.target_utilization))))
+
+        if peak > capacity * self.scale_up_threshold and target > self.current_units:
+            action = "scale up"
+        elif peak < capacity * self.scale_down_threshold and target < self.current_units:
+            action = "scale down"
+        elif self.current_units < self.min_units or self.current_units > self.max_units:
+            action = "scale up" if self.current_units < self.min_units else "scale down"
+        else:
+            action = "hold"
+            target = self.current_units
+
+        if action != "hold":
+            if self._scale_task is not None and not self._scale_task.done():
+                action = "hold (scale operation in progress)"
+            elif self._last_scale_time is not None and sample.time - self._last_scale_time < self.min_seconds_between_scales:
+                action = "hold (too soon after the last scale operation)"
+
+        decision = ScaleDecision(sample.time, peak, self.current_units, target, action)
+        self.decisions.append(decision)
+        if action in ("scale up", "scale down"):
+            self._last_scale_time = sample.time
+            self.scale_operations += 1
+            self.current_units = target
+            self._scale_task = asyncio.ensure_future(self._scale(target))
+        return decision
+
+    # Waits for the scale operation in progress, if there is one
+    async def close(self):
+        if self._scale_task is not None:
+            await asyncio.gather(self._scale_task, return_exceptions=True)
+
+    # Compares the unit hours the autoscaler provisioned with a fixed number of units large enough for the peak
+    def print_summary(self):
+        if len(self._history) < 2:
+            print("Not enough samples for a summary")
+            return
+        unit_seconds = 0.0
+        overloaded_seconds = 0.0
+        for (start, units, demand), (end, _, _) in zip(self._history, self._history[1:]):
+            unit_seconds += units * (end - start)
+            if demand > units * self.capacity_per_unit_mbps:
+                overloaded_seconds += end - start
+        duration = self._history[-1][0] - self._history[0][0]
+        peak_units = min(self.max_units, math.ceil(max(demand for _, _, demand in self._history) / (self.capacity_per_unit_mbps * self.target_utilization)))
+        print(f"{len(self._history)} samples over {duration / 3600:.1f} hours, {self.scale_operations} scale operations")
+        print(f"Provisioned {unit_seconds / 3600:.1f} unit hours, against {peak_units * duration / 3600:.1f} for a fixed {peak_units} units")
+        print(f"Demand was above capacity for {overloaded_seconds / 60:.0f} minutes")
+
+    async def _scale(self, scale_units):
+        ctx = encoding_job_helpers.get_context(self.context)
+        if self.dry_run:
+            return
+        try:
+            poller = await ctx.client.streaming_endpoints.begin_scale(ctx.resource_group, ctx.account_name, self.streaming_endpoint_name,
+                                                                      StreamingEntityScaleUnit(scale_unit=scale_units))
+            await poller.result()
+            print(f"Streaming endpoint {self.streaming_endpoint_name} scaled to {scale_units} units")
+        except Exception as err:
+            # Read the units back, so that the next decision starts from what the endpoint really has
+            print(f"Error scaling streaming endpoint {self.streaming_endpoint_name} to {scale_units} units: {err}")
+            streaming_endpoint = await ctx.client.streaming_endpoints.get(ctx.resource_group, ctx.account_name, self.streaming_endpoint_name)
+            self.current_units = streaming_endpoint.scale_units or 0
@@ -0,0 +1,773 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# A local stand-in for the parts of Azure Media Services and Azure Blob Storage that the samples use,
+# so that the helpers in Common/ can be run and benchmarked without an Azure subscription.
+#
+# Management plane (ARM) routes under
+#   /subscriptions/{id}/resourceGroups/{group}/providers/Microsoft.Media/mediaServices/{account}/...
+# cover assets, transforms, jobs (with simulated progress), streaming locators, streaming endpoints,
+# live events, live outputs and content key policies.
+# Data plane routes under /blob/{container}/{blob} cover the block blob operations used by upload_file
+# and download_results: put blob, stage block, commit/get block list, ranged get, metadata and list blobs.
+# Live manifests are served for the preview URL of a running live event (/preview/{live event}/preview.ism/manifest)
+# and for the streaming locators of live output assets (/{locator id}/{manifest name}.ism/manifest(format=...)),
+# in Smooth, HLS (m3u8) and DASH (mpd) formats. An encoder is assumed to connect as soon as a live event starts.
+#
+# Latency and failures can be injected on every request, and /_emulator/stats returns per-route request counts.
+#
+# Run it from the root of the repo:
+#   python Emulator/ams_emulator.py --port 8080 --latency 0.02 --failure-rate 0.01 --job-duration 20
+# and point a client at it:
+#   emulator = SourceFileLoader("ams_emulator", "Emulator/ams_emulator.py").load_module()
+#   client = emulator.create_emulator_client("http://127.0.0.1:8080")
+
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib.parse import quote
+from xml.etree import ElementTree
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import math
+import random
+import re
+import time
+import uuid
+from aiohttp import web
+
+ARM_PREFIX = "/subscriptions/{subscription_id}/resourceGroups/{resource_group}/providers/Microsoft.Media/mediaServices/{account_name}"
+STORAGE_VERSION = "2021-08-06"
+
+# ARM resource type for each collection
+resource_types = {
+    "assets": "Microsoft.Media/mediaservices/assets",
+    "transforms": "Microsoft.Media/mediaservices/transforms",
+    "jobs": "Microsoft.Media/mediaservices/transforms/jobs",
+    "streaminglocators": "Microsoft.Media/mediaservices/streamingLocators",
+    "streamingpolicies": "Microsoft.Media/mediaservices/streamingPolicies",
+    "streamingendpoints": "Microsoft.Media/mediaservices/streamingEndpoints",
+    "liveevents": "Microsoft.Media/mediaservices/liveEvents",
+    "liveoutputs": "Microsoft.Media/mediaservices/liveEvents/liveOutputs",
+    "contentkeypolicies": "Microsoft.Media/mediaservices/contentKeyPolicies",
+    "assetfilters": "Microsoft.Media/mediaservices/assets/assetFilters",
+    "tracks": "Microsoft.Media/mediaservices/assets/tracks"
+}
+
+
+class EmulatorConfig:
+    def __init__(self, latency=0.0, latency_jitter=0.0, failure_rate=0.0, throttle_rate=0.0, retry_after=1,
+                 job_queue_seconds=1.0, job_duration=10.0, job_error_rate=0.0, output_blob_size=1024 * 1024,
+                 page_size=100, live_first_fragment_delay=5.0, live_segment_duration=2.0, live_window_segments=30, seed=None):
+        # Seconds added to every request, plus a uniformly random extra of up to latency_jitter seconds
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        # Fraction of requests that fail with 503, and fraction that are throttled with 429 and Retry-After
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        # Simulated job timeline: Queued, then Scheduled for job_queue_seconds, then Processing for job_duration
+        self.job_queue_seconds = job_queue_seconds
+        self.job_duration = job_duration
+        self.job_error_rate = job_error_rate
+        # Size of the fake MP4 that a finished job writes into its output asset
+        self.output_blob_size = output_blob_size
+        # Number of items per page for ARM list calls
+        self.page_size = page_size
+        # Simulated live stream: the first fragment is written live_first_fragment_delay seconds after a live event starts,
+        # then one every live_segment_duration seconds. Manifests list the last live_window_segments fragments.
+        self.live_first_fragment_delay = live_first_fragment_delay
+        self.live_segment_duration = live_segment_duration
+        self.live_window_segments = live_window_segments
+        self.seed = seed
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def format_arm_time(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def arm_error(status, code, message, headers=None):
+    return web.json_response({"error": {"code": code, "message": message}}, status=status, headers=headers)
+
+
+class AmsEmulator:
+    def __init__(self, config=None):
+        self.config = config or EmulatorConfig()
+        self.random = random.Random(self.config.seed)
+        # ARM resources keyed by (account, lower-cased path segments)
+        self.resources = {}
+        # Blob containers: container name -> {blob name -> blob dict}
+        self.containers = collections.defaultdict(dict)
+        self.request_counts = collections.Counter()
+        self.app = self._create_app()
+        self.runner = None
+        self.base_url = None
+
+    def _create_app(self):
+        app = web.Application(middlewares=[self._middleware], client_max_size=1024 ** 3)
+        app.router.add_get("/_emulator/stats", self.handle_stats)
+        app.router.add_post("/_emulator/reset", self.handle_reset)
+        # The SDK uses both "mediaServices" and "mediaservices" in its URLs
+        for prefix in (ARM_PREFIX, ARM_PREFIX.replace("mediaServices", "mediaservices")):
+            app.router.add_route("*", prefix, self.handle_account)
+            app.router.add_route("*", prefix + "/{tail:.*}", self.handle_arm)
+        app.router.add_route("*", "/blob/{container}", self.handle_container)
+        app.router.add_route("*", "/blob/{container}/{blob:.*}", self.handle_blob)
+        app.router.add_get("/preview/{live_event}/preview.ism/{manifest:.*}", self.handle_preview)
+        app.router.add_get("/{locator_id}/{manifest_name:[^/]+}.ism/{manifest:.*}", self.handle_origin)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if request.path.startswith("/_emulator"):
+            return await handler(request)
+
+        self.request_counts[self._route_name(request)] += 1
+        delay = self.config.latency + self.random.uniform(0, self.config.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        roll = self.random.random()
+        if roll < self.config.throttle_rate:
+            return arm_error(429, "TooManyRequests", "Injected throttling.", headers={"Retry-After": str(self.config.retry_after)})
+        if roll < self.config.throttle_rate + self.config.failure_rate:
+            return arm_error(503, "ServiceUnavailable", "Injected failure.")
+        return await handler(request)
+
+    # Groups requests by method and resource type, e.g. "GET transforms/jobs" or "PUT blob?comp=block"
+    def _route_name(self, request):
+        if request.path.startswith("/blob/"):
+            comp = request.query.get("comp")
+            return f"{request.method} blob" + (f"?comp={comp}" if comp else "")
+        if "manifest" in request.match_info:
+            return f"{request.method} {'preview' if 'live_event' in request.match_info else 'origin'}"
+        tail = request.match_info.get("tail", "")
+        segments = [segment for segment in tail.split("/") if segment]
+        kinds = [segment for index, segment in enumerate(segments) if index % 2 == 0]
+        return f"{request.method} {'/'.join(kinds) or 'mediaServices'}"
+
+    async def handle_stats(self, request):
+        return web.json_response({
+            "requests": dict(self.request_counts),
+            "total_requests": sum(self.request_counts.values()),
+            "resources": len(self.resources),
+            "blobs": sum(len(blobs) for blobs in self.containers.values())
+        })
+
+    async def handle_reset(self, request):
+        self.resources.clear()
+        self.containers.clear()
+        self.request_counts.clear()
+        return web.json_response({})
+
+    def account_id(self, request):
+        info = request.match_info
+        return ARM_PREFIX.format(subscription_id=info["subscription_id"], resource_group=info["resource_group"], account_name=info["account_name"])
+
+    async def handle_account(self, request):
+        if request.method != "GET":
+            return arm_error(405, "MethodNotAllowed", "Only GET is supported on the account.")
+        return web.json_response({
+            "id": self.account_id(request),
+            "name": request.match_info["account_name"],
+            "type": "Microsoft.Media/mediaservices",
+            "location": "westus2",
+            "properties": {"provisioningState": "Succeeded"}
+        })
+
+    # ---- ARM resources ----
+
+    async def handle_arm(self, request):
+        account = self.account_id(request)
+        segments = [segment for segment in request.match_info["tail"].split("/") if segment]
+        keys = [segment.lower() if index % 2 == 0 else segment for index, segment in enumerate(segments)]
+
+        if len(keys) % 2 == 1 and keys[-1].lower() in resource_types:
+            if request.method != "GET":
+                return arm_error(405, "MethodNotAllowed", f"{request.method} is not supported on a collection.")
+            return self.list_resources(request, account, keys)
+
+        if len(keys) % 2 == 1:
+            if request.method != "POST":
+                return arm_error(405, "MethodNotAllowed", "Actions must be POSTed.")
+            return await self.handle_action(request, account, keys[:-1], segments[-1].lower())
+
+        if request.method == "GET":
+            resource = self.get_resource(account, keys)
+            if resource is None:
+                return arm_error(404, "ResourceNotFound", f"{'/'.join(segments)} was not found.")
+            return web.json_response(self.public(resource))
+        if request.method in ("PUT", "PATCH"):
+            body = await request.json() if request.can_read_body else {}
+            return self.put_resource(request, account, keys, segments, body)
+        if request.method == "DELETE":
+            existed = self.resources.pop((account, tuple(key.lower() for key in keys)), None) is not None
+            # Deleting a parent deletes its children too (e.g. a live event and its live outputs)
+            prefix = tuple(key.lower() for key in keys)
+            for key in [key for key in self.resources if key[0] == account and key[1][:len(prefix)] == prefix]:
+                del self.resources[key]
+            return web.Response(status=200 if existed else 204)
+        return arm_error(405, "MethodNotAllowed", f"{request.method} is not supported.")
+
+    def get_resource(self, account, keys):
+        if [key.lower() for key in keys] == ["streamingendpoints", "default"]:
+            return self.default_streaming_endpoint(account)
+        resource = self.resources.get((account, tuple(key.lower() for key in keys)))
+        if resource is not None and len(keys) >= 2 and keys[-2] == "jobs":
+            self.advance_job(resource)
+        return resource
+
+    def put_resource(self, request, account, keys, segments, body):
+        key = (account, tuple(key.lower() for key in keys))
+        collection = keys[-2]
+        now = format_arm_time(utc_now())
+        existing = self.resources.get(key)
+        properties = dict(existing["properties"]) if existing else {}
+        properties.update(body.get("properties", {}))
+
+        if existing is None:
+            properties.setdefault("created", now)
+            if collection == "assets":
+                properties.setdefault("assetId", str(uuid.uuid4()))
+                properties.setdefault("container", f"asset-{properties['assetId']}")
+            elif collection == "jobs":
+                properties["state"] = "Queued"
+                for output in properties.get("outputs", []):
+                    output.update({"state": "Queued", "progress": 0})
+            elif collection == "streaminglocators":
+                properties.setdefault("streamingLocatorId", str(uuid.uuid4()))
+            elif collection == "liveevents":
+                auto_start = request.query.get("autoStart", "false").lower() == "true"
+                properties["resourceState"] = "Running" if auto_start else "Stopped"
+                properties.setdefault("input", {})["endpoints"] = [{"protocol": "FragmentedMP4", "url": f"{self.base_url}/ingest/{segments[-1]}"}]
+                properties.setdefault("preview", {})["endpoints"] = [{"protocol": "FragmentedMP4", "url": f"{self.base_url}/preview/{segments[-1]}/preview.ism/manifest"}]
+            elif collection == "liveoutputs":
+                properties["resourceState"] = "Running"
+            elif collection == "streamingendpoints":
+                properties.setdefault("resourceState", "Stopped")
+                properties.setdefault("hostName", self.base_url.split("://", 1)[1])
+        properties["lastModified"] = now
+        properties["provisioningState"] = "Succeeded"
+
+        resource = {
+            "id": f"{account}/{'/'.join(segments)}",
+            "name": segments[-1],
+            "type": resource_types.get(collection, collection),
+            "properties": properties
+        }
+        if "location" in body:
+            resource["location"] = body["location"]
+        if "tags" in body or (existing is not None and "tags" in existing):
+            resource["tags"] = body.get("tags", existing.get("tags") if existing else None)
+        if collection == "jobs" and existing is None:
+            resource["_emulator"] = {"created": asyncio.get_running_loop().time(), "error": self.random.random() < self.config.job_error_rate}
+        elif collection == "liveevents" and existing is None:
+            resource["_emulator"] = {"started": time.time()} if properties["resourceState"] == "Running" else {}
+        elif collection == "liveoutputs" and existing is None:
+            resource["_emulator"] = {"created": time.time()}
+        elif existing is not None and "_emulator" in existing:
+            resource["_emulator"] = existing["_emulator"]
+        self.resources[key] = resource
+        return web.json_response(self.public(resource), status=200 if existing else 201)
+
+    def public(self, resource):
+        return {name: value for name, value in resource.items() if not name.startswith("_")}
+
+    def list_resources(self, request, account, keys):
+        prefix = tuple(key.lower() for key in keys)
+        items = [resource for key, resource in self.resources.items()
+                 if key[0] == account and len(key[1]) == len(prefix) + 1 and key[1][:len(prefix)] == prefix]
+        if prefix == ("streamingendpoints",) and not items:
+            items = [self.default_streaming_endpoint(account)]
+        if prefix[-1] == "jobs":
+            for job in items:
+                self.advance_job(job)
+
+        odata_filter = request.query.get("$filter")
+        if odata_filter:
+            items = [item for item in items if self.matches_filter(item, odata_filter)]
+
+        skip = int(request.query.get("$skiptoken", "0"))
+        page = items[skip:skip + self.config.page_size]
+        body = {"value": [self.public(item) for item in page]}
+        if skip + self.config.page_size < len(items):
+            query = dict(request.query)
+            query["$skiptoken"] = str(skip + self.config.page_size)
+            body["@odata.nextLink"] = str(request.url.with_query(query))
+        return web.json_response(body)
+
+    # Supports the filters the helpers use: "name eq 'x'", "properties/state eq 'Processing'", joined with "or"/"and"
+    def matches_filter(self, item, odata_filter):
+        def matches(clause):
+            match = re.match(r"\s*(\S+)\s+(eq|ne)\s+'((?:[^']|'')*)'\s*$", clause)
+            if match is None:
+                return True
+            field, operator, value = match.group(1), match.group(2), match.group(3).replace("''", "'")
+            actual = item["name"] if field == "name" else item["properties"].get(field.split("/")[-1])
+            return (actual == value) if operator == "eq" else (actual != value)
+
+        return any(all(matches(clause) for clause in re.split(r"\s+and\s+", part)) for part in re.split(r"\s+or\s+", odata_filter))
+
+    def default_streaming_endpoint(self, account):
+        key = (account, ("streamingendpoints", "default"))
+        if key not in self.resources:
+            self.resources[key] = {
+                "id": f"{account}/streamingEndpoints/default",
+                "name": "default",
+                "type": resource_types["streamingendpoints"],
+                "properties": {"resourceState": "Running", "scaleUnits": 0, "hostName": self.base_url.split("://", 1)[1], "provisioningState": "Succeeded"}
+            }
+        return self.resources[key]
+
+    # Moves a job along its simulated timeline. The output asset gets a fake MP4 once the job has finished.
+    def advance_job(self, job):
+        emulator_state = job.get("_emulator")
+        properties = job["properties"]
+        if emulator_state is None or properties["state"] in ("Finished", "Error", "Canceled", "Canceling"):
+            return
+        elapsed = asyncio.get_running_loop().time() - emulator_state["created"]
+        if elapsed < self.config.job_queue_seconds:
+            state, progress = "Scheduled", 0
+        elif elapsed < self.config.job_queue_seconds + self.config.job_duration:
+            state = "Processing"
+            progress = int(100 * (elapsed - self.config.job_queue_seconds) / max(self.config.job_duration, 0.001))
+        else:
+            state, progress = ("Error", 0) if emulator_state["error"] else ("Finished", 100)
+
+        if state == "Processing" and properties["state"] != "Processing":
+            properties["startTime"] = format_arm_time(utc_now())
+        if state in ("Finished", "Error"):
+            properties["endTime"] = format_arm_time(utc_now())
+        properties["state"] = state
+        for output in properties.get("outputs", []):
+            output["state"] = state
+            output["progress"] = progress
+            if state == "Finished":
+                self.write_job_output(job["id"].split("/transforms/")[0], output)
+
+    def write_job_output(self, account, output):
+        asset = self.resources.get((account, ("assets", output.get("assetName", "").lower())))
+        if asset is None:
+            return
+        container = self.containers[asset["properties"]["container"]]
+        data = bytes(self.config.output_blob_size)
+        self.put_blob_data(container, "video_1000000.mp4", data)
+        self.put_blob_data(container, "video.ism", b"<smil />")
+
+    async def handle_action(self, request, account, keys, action):
+        resource = self.get_resource(account, keys)
+        if resource is None:
+            return arm_error(404, "ResourceNotFound", f"{'/'.join(keys)} was not found.")
+        properties = resource["properties"]
+        body = await request.json() if request.can_read_body else {}
+
+        if action == "listcontainersas":
+            container = properties["container"]
+            sas = f"sv={STORAGE_VERSION}&sr=c&sp={quote(body.get('permissions', 'Read'))}&se={quote(body.get('expiryTime', ''))}&sig=emulator"
+            return web.json_response({"assetContainerSasUrls": [f"{self.base_url}/blob/{container}?{sas}"]})
+        if action == "liststreaminglocators":
+            locators = [{"name": item["name"], "assetName": item["properties"].get("assetName"), "streamingLocatorId": item["properties"]["streamingLocatorId"]}
+                        for key, item in self.resources.items()
+                        if key[0] == account and key[1][0] == "streaminglocators" and item["properties"].get("assetName") == resource["name"]]
+            return web.json_response({"streamingLocators": locators})
+        if action == "listpaths":
+            locator_id = properties["streamingLocatorId"]
+            return web.json_response({
+                "streamingPaths": [
+                    {"streamingProtocol": "Hls", "encryptionScheme": "NoEncryption", "paths": [f"/{locator_id}/video.ism/manifest(format=m3u8-cmaf)"]},
+                    {"streamingProtocol": "Dash", "encryptionScheme": "NoEncryption", "paths": [f"/{locator_id}/video.ism/manifest(format=mpd-time-cmaf)"]}
+                ],
+                "downloadPaths": []
+            })
+        if action == "listcontentkeys":
+            return web.json_response({"contentKeys": []})
+        if action == "getpolicypropertieswithsecrets":
+            return web.json_response(properties)
+        if action == "canceljob":
+            properties["state"] = "Canceled"
+            return web.Response(status=200)
+        if action in ("start", "stop", "allocate", "reset", "scale"):
+            new_states = {"start": "Running", "stop": "Stopped", "allocate": "StandBy", "reset": properties.get("resourceState", "Running")}
+            if action == "scale":
+                properties["scaleUnits"] = body.get("scaleUnit", properties.get("scaleUnits", 0))
+            else:
+                properties["resourceState"] = new_states[action]
+            if keys[-2] == "liveevents" and action in ("start", "stop", "allocate"):
+                resource["_emulator"] = {"started": time.time()} if action == "start" else {}
+            properties["lastModified"] = format_arm_time(utc_now())
+            return web.Response(status=200)
+        return arm_error(400, "BadRequest", f"Unknown action {action}.")
+
+    # ---- Live origin ----
+
+    # Returns the wall clock time at which fragment 0 of a running live event starts and the indexes of the fragments
+    # in the manifest window, or None if the live event isn't running. Fragments that start before since are left out.
+    def live_fragments(self, live_event, since=None):
+        started = live_event.get("_emulator", {}).get("started")
+        if live_event["properties"].get("resourceState") != "Running" or started is None:
+            return None
+        first_start = started + self.config.live_first_fragment_delay
+        duration = self.config.live_segment_duration
+        count = max(0, math.floor((time.time() - first_start) / duration))
+        first_index = max(0, count - self.config.live_window_segments)
+        if since is not None:
+            first_index = max(first_index, math.ceil((since - first_start) / duration))
+        return first_start, list(range(first_index, count))
+
+    def find_resources(self, collection, predicate):
+        return [(key, resource) for key, resource in self.resources.items()
+                if len(key[1]) >= 2 and key[1][-2] == collection and predicate(resource)]
+
+    async def handle_preview(self, request):
+        name = request.match_info["live_event"].lower()
+        live_events = self.find_resources("liveevents", lambda resource: resource["name"].lower() == name)
+        fragments = self.live_fragments(live_events[0][1]) if live_events else None
+        return self.manifest_response(request.match_info["manifest"], fragments)
+
+    # The origin serves the live output that records into the asset of the streaming locator
+    async def handle_origin(self, request):
+        locator_id = request.match_info["locator_id"]
+        locators = self.find_resources("streaminglocators", lambda resource: resource["properties"].get("streamingLocatorId") == locator_id)
+        if not locators:
+            return web.Response(status=404)
+        asset_name = locators[0][1]["properties"].get("assetName")
+        live_outputs = self.find_resources("liveoutputs", lambda resource: resource["properties"].get("assetName") == asset_name)
+        if not live_outputs:
+            return web.Response(status=404)
+        key, live_output = live_outputs[0]
+        live_event = self.resources.get((key[0], key[1][:2]))
+        fragments = self.live_fragments(live_event, since=live_output["_emulator"]["created"]) if live_event else None
+        return self.manifest_response(request.match_info["manifest"], fragments)
+
+    # Like the service, returns 404 until the first fragment has arrived
+    def manifest_response(self, manifest, fragments):
+        if fragments is None or not fragments[1]:
+            return web.Response(status=404)
+        first_start, indexes = fragments
+        lower = manifest.lower()
+        if "m3u8" in lower:
+            if lower.startswith("manifest("):
+                return web.Response(text=self.hls_multivariant_playlist(), content_type="application/vnd.apple.mpegurl")
+            return web.Response(text=self.hls_media_playlist(first_start, indexes), content_type="application/vnd.apple.mpegurl")
+        if "mpd" in lower:
+            return web.Response(body=self.dash_manifest(first_start, indexes), content_type="application/dash+xml")
+        return web.Response(body=self.smooth_manifest(indexes), content_type="text/xml")
+
+    def hls_multivariant_playlist(self):
+        return "\n".join([
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+            '#EXT-X-STREAM-INF:BANDWIDTH=2000000,RESOLUTION=1280x720,CODECS="avc1.64001f"',
+            "QualityLevels(2000000)/Manifest(video,format=m3u8-cmaf)",
+            ""])
+
+    def hls_media_playlist(self, first_start, indexes):
+        duration = self.config.live_segment_duration
+        program_date_time = datetime.fromtimestamp(first_start + indexes[0] * duration, timezone.utc)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{math.ceil(duration)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{indexes[0]}",
+            '#EXT-X-MAP:URI="Fragments(video=i,format=m3u8-cmaf)"',
+            f"#EXT-X-PROGRAM-DATE-TIME:{format_arm_time(program_date_time)}"]
+        for index in indexes:
+            lines.append(f"#EXTINF:{duration:.3f},no-desc")
+            lines.append(f"Fragments(video={round(index * duration * 10000000)},format=m3u8-cmaf)")
+        return "\n".join(lines) + "\n"
+
+    def dash_manifest(self, first_start, indexes):
+        duration = round(self.config.live_segment_duration * 10000000)
+        root = ElementTree.Element("MPD", {
+            "xmlns": "urn:mpeg:dash:schema:mpd:2011",
+            "type": "dynamic",
+            "profiles": "urn:mpeg:dash:profile:isoff-live:2011",
+            "availabilityStartTime": format_arm_time(datetime.fromtimestamp(first_start, timezone.utc)),
+            "publishTime": format_arm_time(utc_now()),
+            "minimumUpdatePeriod": f"PT{self.config.live_segment_duration}S",
+            "minBufferTime": f"PT{self.config.live_segment_duration * 2}S"})
+        period = ElementTree.SubElement(root, "Period", id="0", start="PT0S")
+        adaptation_set = ElementTree.SubElement(period, "AdaptationSet", contentType="video", mimeType="video/mp4", segmentAlignment="true")
+        template = ElementTree.SubElement(adaptation_set, "SegmentTemplate", timescale="10000000",
+                                          media="QualityLevels($Bandwidth$)/Fragments(video=$Time$,format=mpd-time-cmaf)",
+                                          initialization="QualityLevels($Bandwidth$)/Fragments(video=i,format=mpd-time-cmaf)")
+        timeline = ElementTree.SubElement(template, "SegmentTimeline")
+        ElementTree.SubElement(timeline, "S", t=str(indexes[0] * duration), d=str(duration), r=str(len(indexes) - 1))
+        ElementTree.SubElement(adaptation_set, "Representation", id="1_V_video_1", bandwidth="2000000", codecs="avc1.64001F", width="1280", height="720")
+        return b'<?xml version="1.0" encoding="utf-8"?>' + ElementTree.tostring(root)
+
+    def smooth_manifest(self, indexes):
+        duration = round(self.config.live_segment_duration * 10000000)
+        root = ElementTree.Element("SmoothStreamingMedia", MajorVersion="2", MinorVersion="2", TimeScale="10000000", Duration="0",
+                                   IsLive="TRUE", LookAheadFragmentCount="2", DVRWindowLength=str(duration * self.config.live_window_segments))
+        stream_index = ElementTree.SubElement(root, "StreamIndex", Type="video", Name="video", Chunks=str(len(indexes)), QualityLevels="1",
+                                              Url="QualityLevels({bitrate})/Fragments(video={start time})")
+        ElementTree.SubElement(stream_index, "QualityLevel", Index="0", Bitrate="2000000", FourCC="H264", MaxWidth="1280", MaxHeight="720")
+        for index in indexes:
+            ElementTree.SubElement(stream_index, "c", t=str(index * duration), d=str(duration))
+        return b'<?xml version="1.0" encoding="utf-8"?>' + ElementTree.tostring(root)
+
+    # ---- Blob storage ----
+
+    def storage_headers(self, blob=None):
+        headers = {
+            "x-ms-request-id": str(uuid.uuid4()),
+            "x-ms-version": STORAGE_VERSION,
+            "Date": format_datetime(utc_now(), usegmt=True)
+        }
+        if blob is not None:
+            headers["ETag"] = blob["etag"]
+            headers["Last-Modified"] = format_datetime(blob["last_modified"], usegmt=True)
+        return headers
+
+    def storage_error(self, status, code):
+        headers = self.storage_headers()
+        headers["x-ms-error-code"] = code
+        body = f'<?xml version="1.0" encoding="utf-8"?><Error><Code>{code}</Code><Message>{code}</Message></Error>'
+        return web.Response(status=status, body=body, content_type="application/xml", headers=headers)
+
+    def put_blob_data(self, container, name, data, metadata=None):
+        blob = container.get(name) or {"uncommitted": {}, "committed": [], "metadata": {}}
+        blob.update({
+            "data": data,
+            "etag": '"0x{}"'.format(hashlib.md5(data).hexdigest()[:16].upper()),
+            "last_modified": utc_now()
+        })
+        if metadata is not None:
+            blob["metadata"] = metadata
+        container[name] = blob
+        return blob
+
+    async def handle_container(self, request):
+        container_name = request.match_info["container"]
+        if request.method == "PUT":
+            self.containers.setdefault(container_name, {})
+            return web.Response(status=201, headers=self.storage_headers())
+        if request.method == "DELETE":
+            self.containers.pop(container_name, None)
+            return web.Response(status=202, headers=self.storage_headers())
+        if request.method == "GET" and request.query.get("comp") == "list":
+            return self.list_blobs(request, container_name)
+        return self.storage_error(400, "UnsupportedHttpVerb")
+
+    def list_blobs(self, request, container_name):
+        container = self.containers.get(container_name, {})
+        prefix = request.query.get("prefix", "")
+        names = sorted(name for name, blob in container.items() if name.startswith(prefix) and "data" in blob)
+        marker = request.query.get("marker")
+        start = names.index(marker) if marker in names else 0
+        max_results = int(request.query.get("maxresults", "5000"))
+        page = names[start:start + max_results]
+        next_marker = names[start + max_results] if start + max_results < len(names) else ""
+
+        root = ElementTree.Element("EnumerationResults", ServiceEndpoint=f"{self.base_url}/blob/", ContainerName=container_name)
+        blobs = ElementTree.SubElement(root, "Blobs")
+        for name in page:
+            blob = container[name]
+            element = ElementTree.SubElement(blobs, "Blob")
+            ElementTree.SubElement(element, "Name").text = name
+            properties = ElementTree.SubElement(element, "Properties")
+            ElementTree.SubElement(properties, "Last-Modified").text = format_datetime(blob["last_modified"], usegmt=True)
+            ElementTree.SubElement(properties, "Etag").text = blob["etag"]
+            ElementTree.SubElement(properties, "Content-Length").text = str(len(blob["data"]))
+            ElementTree.SubElement(properties, "Content-Type").text = "application/octet-stream"
+            ElementTree.SubElement(properties, "BlobType").text = "BlockBlob"
+        ElementTree.SubElement(root, "NextMarker").text = next_marker
+        body = b'<?xml version="1.0" encoding="utf-8"?>' + ElementTree.tostring(root)
+        return web.Response(body=body, content_type="application/xml", headers=self.storage_headers())
+
+    async def handle_blob(self, request):
+        container = self.containers[request.match_info["container"]]
+        name = request.match_info["blob"]
+        comp = request.query.get("comp")
+        blob = container.get(name)
+
+        if request.method == "PUT" and comp == "block":
+            if blob is None:
+                blob = container[name] = {"uncommitted": {}, "committed": [], "metadata": {}}
+            blob["uncommitted"][request.query["blockid"]] = await request.read()
+            return web.Response(status=201, headers=self.storage_headers())
+
+        if request.method == "PUT" and comp == "blocklist":
+            if blob is None:
+                return self.storage_error(400, "InvalidBlockList")
+            committed = dict(zip((block_id for block_id, _ in blob["committed"]), (data for _, data in blob["committed"])))
+            blocks = []
+            for element in ElementTree.fromstring(await request.read()):
+                block_id = element.text
+                data = blob["uncommitted"].get(block_id) if element.tag != "Committed" else None
+                if data is None and element.tag != "Uncommitted":
+                    data = committed.get(block_id)
+                if data is None:
+                    return self.storage_error(400, "InvalidBlockList")
+                blocks.append((block_id, data))
+            blob["committed"] = blocks
+            blob["uncommitted"] = {}
+            self.put_blob_data(container, name, b"".join(data for _, data in blocks), self.read_metadata(request) or None)
+            return web.Response(status=201, headers=self.storage_headers(blob))
+
+        if request.method == "PUT" and comp == "metadata":
+            if blob is None or "data" not in blob:
+                return self.storage_error(404, "BlobNotFound")
+            blob["metadata"] = self.read_metadata(request)
+            return web.Response(status=200, headers=self.storage_headers(blob))
+
+        if request.method == "PUT" and comp is None:
+            blob = self.put_blob_data(container, name, await request.read(), self.read_metadata(request))
+            blob["committed"] = [(base64.b64encode(b"single").decode(), blob["data"])]
+            return web.Response(status=201, headers=self.storage_headers(blob))
+
+        if request.method == "GET" and comp == "blocklist":
+            if blob is None:
+                return self.storage_error(404, "BlobNotFound")
+            return self.get_block_list(blob, request.query.get("blocklisttype", "committed"))
+
+        if request.method == "DELETE":
+            if container.pop(name, None) is None:
+                return self.storage_error(404, "BlobNotFound")
+            return web.Response(status=202, headers=self.storage_headers())
+
+        if request.method in ("GET", "HEAD"):
+            if blob is None or "data" not in blob:
+                return self.storage_error(404, "BlobNotFound")
+            return self.get_blob(request, blob)
+
+        return self.storage_error(400, "UnsupportedHttpVerb")
+
+    def read_metadata(self, request):
+        return {name[len("x-ms-meta-"):]: value for name, value in request.headers.items() if name.lower().startswith("x-ms-meta-")}
+
+    def get_block_list(self, blob, block_list_type):
+        root = ElementTree.Element("BlockList")
+        if block_list_type in ("committed", "all"):
+            committed = ElementTree.SubElement(root, "CommittedBlocks")
+            for block_id, data in blob["committed"]:
+                element = ElementTree.SubElement(committed, "Block")
+                ElementTree.SubElement(element, "Name").text = block_id
+                ElementTree.SubElement(element, "Size").text = str(len(data))
+        if block_list_type in ("uncommitted", "all"):
+            uncommitted = ElementTree.SubElement(root, "UncommittedBlocks")
+            for block_id, data in blob["uncommitted"].items():
+                element = ElementTree.SubElement(uncommitted, "Block")
+                ElementTree.SubElement(element, "Name").text = block_id
+                ElementTree.SubElement(element, "Size").text = str(len(data))
+        body = b'<?xml version="1.0" encoding="utf-8"?>' + ElementTree.tostring(root)
+        headers = self.storage_headers(blob if "data" in blob else None)
+        headers["x-ms-blob-content-length"] = str(len(blob.get("data", b"")))
+        return web.Response(body=body, content_type="application/xml", headers=headers)
+
+    def get_blob(self, request, blob):
+        data = blob["data"]
+        headers = self.storage_headers(blob)
+        headers["x-ms-blob-type"] = "BlockBlob"
+        headers["Accept-Ranges"] = "bytes"
+        headers["x-ms-creation-time"] = format_datetime(blob["last_modified"], usegmt=True)
+        for name, value in blob["metadata"].items():
+            headers[f"x-ms-meta-{name}"] = value
+
+        status = 200
+        range_header = request.headers.get("x-ms-range") or request.headers.get("Range")
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header or "")
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+            if start >= len(data) and len(data) > 0:
+                headers["Content-Range"] = f"bytes */{len(data)}"
+                return self.storage_error(416, "InvalidRange")
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{max(end, start)}/{len(data)}" if data else "bytes */0"
+            data = data[start:end + 1]
+
+        headers["Content-Type"] = "application/octet-stream"
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(data))
+            return web.Response(status=status, headers=headers)
+        return web.Response(status=status, body=data, headers=headers)
+
+
+# A credential that hands out a dummy token, for clients pointed at the emulator
+class EmulatorCredential:
+    async def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+        return AccessToken("emulator", 2 ** 31 - 1)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+# Creates an AMS aio client that talks to the emulator at base_url.
+# The emulator runs on plain HTTP, so the bearer token policy (which insists on HTTPS) is replaced by a no-op policy.
+def create_emulator_client(base_url, subscription_id="00000000-0000-0000-0000-000000000000", **kwargs):
+    from azure.core.pipeline.policies import SansIOHTTPPolicy
+    from azure.mgmt.media.aio import AzureMediaServices
+    return AzureMediaServices(EmulatorCredential(), subscription_id, base_url=base_url, authentication_policy=SansIOHTTPPolicy(), **kwargs)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Local Azure Media Services and Blob Storage emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Random extra latency of up to this many seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests that fail with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests that are throttled with 429")
+    parser.add_argument("--job-duration", type=float, default=10.0, help="Seconds a job spends in Processing")
+    parser.add_argument("--job-error-rate", type=float, default=0.0, help="Fraction of jobs that end in Error")
+    parser.add_argument("--live-first-fragment-delay", type=float, default=5.0, help="Seconds from starting a live event to its first fragment")
+    parser.add_argument("--live-segment-duration", type=float, default=2.0, help="Seconds per live fragment")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = EmulatorConfig(latency=args.latency, latency_jitter=args.latency_jitter, failure_rate=args.failure_rate,
+                            throttle_rate=args.throttle_rate, job_duration=args.job_duration,
+                            job_error_rate=args.job_error_rate, live_first_fragment_delay=args.live_first_fragment_delay,
+                            live_segment_duration=args.live_segment_duration, seed=args.seed)
+    emulator = AmsEmulator(config)
+    base_url = await emulator.start(args.host, args.port)
+    print(f"AMS emulator listening on {base_url}")
+    print(f"ARM endpoint: {base_url}  Stats: {base_url}/_emulator/stats")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await emulator.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
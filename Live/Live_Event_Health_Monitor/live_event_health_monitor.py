@@ -0,0 +1,75 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Azure Media Services live event health monitor sample for Python
+# Checking channels one by one with client.live_events.get costs a request per live event on every check.
+# This sample watches every live event in the account with one paged live_events.list call per interval,
+# and prints only the changes since the previous check: live events that were created, started, stopped or deleted.
+# A live event that leaves Running or StandBy unexpectedly (stopped or deallocated by someone else) is flagged.
+
+import asyncio
+from dotenv import load_dotenv
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.media.aio import AzureMediaServices
+import os
+
+# Import Job Helpers and the live event helpers
+from importlib.machinery import SourceFileLoader
+mymodule = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+live_module = SourceFileLoader("live_event_helpers", "Common/live_event_helpers.py").load_module()
+
+# Get the environment variables
+load_dotenv()
+
+default_credential = DefaultAzureCredential(exclude_shared_token_cache_credential=True)
+
+# Get the environment variables
+subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+resource_group = os.getenv('AZURE_RESOURCE_GROUP')
+account_name = os.getenv('AZURE_MEDIA_SERVICES_ACCOUNT_NAME')
+
+# Seconds between two checks, and how long to keep monitoring
+interval = 30
+monitor_minutes = 60
+
+# The AMS Client
+print("Creating AMS Client")
+client = AzureMediaServices(default_credential, subscription_id)
+
+# Send envs to helper function
+mymodule.set_account_name(account_name)
+mymodule.set_resource_group(resource_group)
+mymodule.set_subscription_id(subscription_id)
+mymodule.create_default_azure_credential(default_credential)
+mymodule.create_azure_media_services(client)
+
+
+def on_transition(transition):
+    if transition.unexpected:
+        print(f"WARNING: {transition}")
+    else:
+        print(transition)
+
+
+async def main():
+    async with client:
+        monitor = live_module.LiveEventHealthMonitor(interval=interval, on_transition=on_transition)
+        # The first check records the current state of every live event
+        await monitor.poll()
+        monitor.print_summary()
+        print(f"Monitoring the live events for {monitor_minutes} minutes...")
+        async with monitor:
+            await asyncio.sleep(monitor_minutes * 60)
+        monitor.print_summary()
+
+    # closing media client
+    print('Closing media client')
+    await client.close()
+
+    # closing credential client
+    print('Closing credential client')
+    await default_credential.close()
+
+if __name__ == "__main__":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Azure Media Services Live Event warm pool sample for Python
+# This sample keeps a pool of allocated but stopped (StandBy) live events, so that a channel can be
+# handed out and started in seconds instead of being created and started from scratch, which takes minutes.
+
+# The workflow for the sample:
+# 1) Create the client for AMS using AAD service principal or managed ID
+# 2) Describe the live event to create for each encoding type that is pooled
+# 3) Start the pool. It adopts the StandBy live events that a previous run left behind and allocates the missing ones.
+# 4) Acquire a live event from the pool and start it. The pool is refilled in the background.
+# 5) Print the age and standby cost of the pool.
+#
+# WARNING: live events in StandBy are billed at the standby rate until they are deleted.
+# Set delete_pool_on_exit to False to keep the pool allocated for the next run.
+
+import asyncio
+from dotenv import load_dotenv
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.media.aio import AzureMediaServices
+from azure.mgmt.media.models import (
+    IPRange,
+    IPAccessControl,
+    LiveEvent,
+    LiveEventInputAccessControl,
+    LiveEventPreviewAccessControl,
+    LiveEventPreview,
+    LiveEventInput,
+    LiveEventEncoding,
+    LiveEventEncodingType,
+    LiveEventInputProtocol,
+    StreamOptionsFlag
+)
+import os
+
+# Import Job and Live Event Helpers
+from importlib.machinery import SourceFileLoader
+mymodule = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+live_module = SourceFileLoader("live_event_helpers", "Common/live_event_helpers.py").load_module()
+
+# Get the environment variables
+load_dotenv()
+
+default_credential = DefaultAzureCredential(exclude_shared_token_cache_credential=True)
+
+# Get the environment variables
+subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+resource_group = os.getenv('AZURE_RESOURCE_GROUP')
+account_name = os.getenv('AZURE_MEDIA_SERVICES_ACCOUNT_NAME')
+
+# The number of StandBy live events to keep per encoding type
+pool_sizes = {
+    LiveEventEncodingType.PASSTHROUGH_STANDARD: 2,
+    LiveEventEncodingType.STANDARD: 1
+}
+
+# The standby price per hour of each encoding type in your region, used to report the cost of the pool.
+# Check the Media Services pricing page for the values that apply to you.
+standby_hourly_costs = {
+    LiveEventEncodingType.PASSTHROUGH_STANDARD: 0.0,
+    LiveEventEncodingType.STANDARD: 0.0
+}
+
+delete_pool_on_exit = True
+
+# The AMS Client
+print("Creating AMS Client")
+client = AzureMediaServices(default_credential, subscription_id)
+
+# Send envs to helper function
+mymodule.set_account_name(account_name)
+mymodule.set_resource_group(resource_group)
+mymodule.set_subscription_id(subscription_id)
+mymodule.create_default_azure_credential(default_credential)
+mymodule.create_azure_media_services(client)
+
+allow_all_input_range = IPRange(name="AllowAll", address="0.0.0.0", subnet_prefix_length=0)
+
+
+# The live event to create for an encoding type. In production, lock the IP ranges down to your encoders and monitoring devices.
+def live_event_template(encoding_type):
+    return LiveEvent(
+        location="West US 2",       # For the sample, we are using location: West US 2
+        description=f"Warm pool {encoding_type} live event from Python SDK sample",
+        input=LiveEventInput(
+            streaming_protocol=LiveEventInputProtocol.RTMP,
+            access_control=LiveEventInputAccessControl(ip=IPAccessControl(allow=[allow_all_input_range]))
+        ),
+        encoding=LiveEventEncoding(encoding_type=encoding_type),
+        preview=LiveEventPreview(access_control=LiveEventPreviewAccessControl(ip=IPAccessControl(allow=[allow_all_input_range]))),
+        stream_options=[StreamOptionsFlag.LOW_LATENCY]
+    )
+
+
+async def main():
+    async with client:
+        templates = {encoding_type: live_event_template(encoding_type) for encoding_type in pool_sizes}
+        pool = live_module.LiveEventPool(templates, pool_sizes, standby_hourly_costs=standby_hourly_costs)
+
+        print("Starting the warm pool and allocating the missing live events. The first fill takes a few minutes.")
+        await pool.start()
+        await pool.wait_until_full()
+        pool.print_stats()
+        print()
+
+        # Hand out a channel. This only has to start the live event, which is much faster than creating it.
+        live_event = await pool.acquire(LiveEventEncodingType.PASSTHROUGH_STANDARD)
+        print(f"Live event {live_event.name} is {live_event.resource_state}")
+        if live_event.input.endpoints:
+            print(f"RTMP ingest: {live_event.input.endpoints[0].url}")
+        print()
+
+        await pool.wait_until_full()
+        pool.print_stats()
+
+        await pool.close(delete_members=delete_pool_on_exit)
+        print(f"WARNING: live event {live_event.name} is running. Stop and delete it when you are done to stop billing.")
+
+    # closing media client
+    print('Closing media client')
+    await client.close()
+
+    # closing credential client
+    print('Closing credential client')
+    await default_credential.close()
+
+if __name__ == "__main__":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Azure Media Services resource reaper sample for Python
+# The live samples create live events, live outputs, assets and streaming locators with a random "uniqueness" suffix.
+# A sample that is stopped half way leaves them behind, and a running live event is billed every hour.
+# This sample finds those leaked resources by name prefix and age, and removes them in dependency order:
+# live outputs and live events first (stopping running live events), then streaming locators, jobs and finally assets.
+#
+# The sample runs as a dry run and only prints what it would remove. Set dry_run to False to remove the resources.
+
+import asyncio
+from datetime import timedelta
+from dotenv import load_dotenv
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.media.aio import AzureMediaServices
+import os
+
+# Import Job Helpers and the reaper
+from importlib.machinery import SourceFileLoader
+mymodule = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+reaper_module = SourceFileLoader("resource_reaper", "Common/resource_reaper.py").load_module()
+
+# Get the environment variables
+load_dotenv()
+
+default_credential = DefaultAzureCredential(exclude_shared_token_cache_credential=True)
+
+# Get the environment variables
+subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+resource_group = os.getenv('AZURE_RESOURCE_GROUP')
+account_name = os.getenv('AZURE_MEDIA_SERVICES_ACCOUNT_NAME')
+
+# Only remove resources that were created more than this long ago, so that running samples are left alone
+minimum_age = timedelta(hours=6)
+
+# The name prefixes that the live samples use
+prefixes = [
+    "1080p-live-event",
+    "720p-live-event",
+    "720p-ll-live-event",
+    "basic-pass-live-event",
+    "standard-pass-live-event",
+    "stan-pass-ehub-live-event"
+]
+
+dry_run = True
+
+# The AMS Client
+print("Creating AMS Client")
+client = AzureMediaServices(default_credential, subscription_id)
+
+# Send envs to helper function
+mymodule.set_account_name(account_name)
+mymodule.set_resource_group(resource_group)
+mymodule.set_subscription_id(subscription_id)
+mymodule.create_default_azure_credential(default_credential)
+mymodule.create_azure_media_services(client)
+
+
+async def main():
+    async with client:
+        rules = [reaper_module.ReaperRule(prefix=prefix, older_than=minimum_age) for prefix in prefixes]
+        reaper = reaper_module.ResourceReaper(rules, dry_run=dry_run, max_concurrency=8)
+        await reaper.run()
+
+    # closing media client
+    print('Closing media client')
+    await client.close()
+
+    # closing credential client
+    print('Closing credential client')
+    await default_credential.close()
+
+if __name__ == "__main__":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
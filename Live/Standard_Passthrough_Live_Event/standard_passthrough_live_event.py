@@ -36,7 +36,6 @@
 
 import asyncio
 from datetime import timedelta
-import time
 from dotenv import load_dotenv
 from azure.identity.aio import DefaultAzureCredential
 from azure.mgmt.media.aio import AzureMediaServices
@@ -60,6 +59,11 @@ from azure.mgmt.media.models import (
 import os
 import random
 
+# Import Job Helpers
+from importlib.machinery import SourceFileLoader
+mymodule = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+live_module = SourceFileLoader("live_event_helpers", "Common/live_event_helpers.py").load_module()
+
 # Get the environment variables
 load_dotenv()
 
@@ -87,6 +91,13 @@ print("Starting the Live Streaming sample for Azure Media Services")
 print("Creating AMS Client")
 client = AzureMediaServices(default_credential, subscription_id)
 
+# Send envs to helper function
+mymodule.set_account_name(account_name)
+mymodule.set_resource_group(resource_group)
+mymodule.set_subscription_id(subscription_id)
+mymodule.create_default_azure_credential(default_credential)
+mymodule.create_azure_media_services(client)
+
 # Creating the LiveEvent - the primary object for live streaming in AMS.
 # See the overview - https://docs.microsoft.com/azure/media-services/latest/live-streaming-overview
 
@@ -214,40 +225,14 @@ print()
 
 async def main():
     async with client:
-        client_live = await client.live_events.begin_create(resource_group_name=resource_group, account_name=account_name, live_event_name=live_event_name, parameters=live_event_create, auto_start=False)
-        time_start = time.perf_counter()
-        time_end = time.perf_counter()
-        execution_time = (time_end - time_start)
-        if client_live:
-            print(f"Live Event Created - long running operation complete! Name: {live_event_name}")
-            print(f"Execution time to create LiveEvent: {execution_time:.2f}seconds")
-            print()
-            poller = client_live
-            print(await poller.result())
-        else:
-            raise ValueError('Live Event creation failed!')
-
         # Create an Asset for the LiveOutput to use. Think of this as the "tape" that will be recorded to.
         # The asset entity points to a folder/container in your Azure Storage account.
-        print(f"Creating an asset named: {asset_name}")
-        print()
-
         out_alternate_id = f'outputALTid-{uniqueness}'
         out_description = f'outputdescription-{uniqueness}'
 
         # Create an output asset object
         out_asset = Asset(alternate_id=out_alternate_id, description=out_description)
 
-        # Create an output asset
-        output_asset = await client.assets.create_or_update(resource_group, account_name, asset_name, out_asset)
-
-        if output_asset:
-            # print output asset name
-            print(f"The output asset name is: {output_asset.name}")
-            print()
-        else:
-            raise ValueError('Output Asset creation failed!')
-
         # Create the Live Output - think of this as the "tape recorder for the live event".
         # Live outputs are optional, but are required if you want to archive the event to storage,
         # use the asset for on-demand playback later, or if you want to enable cloud DVR time-shifting.
@@ -256,40 +241,33 @@ async def main():
 
         # See the REST API for details on each of the settings on Live Output
         # https://docs.microsoft.com/rest/api/media/liveoutputs/create
-
-        print(f"Creating a live output named: {live_output_name}")
-        print()
-
-        if output_asset:
-            time_start = time.perf_counter()
-            live_output_create = LiveOutput(
-                description="Optional description when using more than one live output",
-                asset_name=output_asset.name,
-                manifest_name=manifest_name,      # The HLS and DASH manifest file name. This is recommended to set if you want a deterministic manifest path up front.
-                archive_window_length=timedelta(hours=1),     # Sets an one hour time-shift DVR window. Uses ISO 8601 format string.
-                hls=Hls(
-                    fragments_per_ts_segment=1        # Advanced setting when using HLS TS output only.
-                )
+        live_output_create = LiveOutput(
+            description="Optional description when using more than one live output",
+            asset_name=asset_name,
+            manifest_name=manifest_name,      # The HLS and DASH manifest file name. This is recommended to set if you want a deterministic manifest path up front.
+            archive_window_length=timedelta(hours=1),     # Sets an one hour time-shift DVR window. Uses ISO 8601 format string.
+            hls=Hls(
+                fragments_per_ts_segment=1        # Advanced setting when using HLS TS output only.
             )
+        )
 
-            print(f"live_output_create object is {live_output_create}")
-            print()
+        # Create the Streaming Locator URL for playback of the contents in the Live Output recoding
+        streaming_locator = StreamingLocator(asset_name=asset_name, streaming_policy_name="Predefined_ClearStreamingOnly")
 
-            # Create and await the live output
-            live_output_await = await client.live_outputs.begin_create(resource_group_name=resource_group, account_name=account_name, live_event_name=live_event_name, live_output_name=live_output_name, parameters=live_output_create)
-            if live_output_await:
-                print(f"Live Output created: {live_output_name}")
-                poller = live_output_await
-                print(await poller.result())
-                time_end = time.perf_counter()
-                execution_time = time_end - time_start
-                print(f"Execution time to create LiveEvent: {execution_time:.2f}seconds")
-                print()
-            else:
-                raise Exception("Live Output creation failed!")
-
-        # Refresh the LiveEvent object's settings after starting it...
-        live_event = await client.live_events.get(resource_group, account_name, live_event_name)
+        # Create the live event, the asset, the live output and the streaming locator, and start the streaming endpoint if it is stopped.
+        # The steps that don't depend on each other run at the same time, so the ingest URL is ready as soon as the live event is created.
+        provisioned = await live_module.provision_live_event(live_event_name, live_event_create, asset_name, out_asset, live_output_name, live_output_create,
+                                                             streaming_locator_name, streaming_locator, streaming_endpoint_name, auto_start=False)
+        print(f"Live Event Created - Name: {live_event_name}")
+        print(f"The output asset name is: {asset_name}")
+        print(f"Live Output created: {live_output_name}")
+        print()
+        provisioned.timeline.print_timeline()
+        print()
+
+        live_event = provisioned.live_event
+        locator = provisioned.streaming_locator
+        streaming_endpoint = provisioned.streaming_endpoint
 
         # Get the RTMP ingest URL to configure in OBS Studio
         # The endpoints is a collection of RTMP primary and secondary, and RTMPS primary and secondary URLs.
@@ -317,33 +295,6 @@ async def main():
         print("Start the live stream now, sending the input to the ingest url and verify that it is arriving with the preview url.")
         print("IMPORTANT TIP!: Make CERTAIN that the video is flowing to the Preview URL before continuing!")
 
-        # Create the Streaming Locator URL for playback of the contents in the Live Output recoding
-        print(f"Creating a streaming locator named: {streaming_locator_name}")
-        print()
-        streaming_locator = StreamingLocator(asset_name=asset_name, streaming_policy_name="Predefined_ClearStreamingOnly")
-
-        locator = await client.streaming_locators.create(
-            resource_group_name=resource_group,
-            account_name=account_name,
-            streaming_locator_name=streaming_locator_name,
-            parameters=streaming_locator
-        )
-
-        # Get the default streaming endpoint on the account
-        streaming_endpoint = await client.streaming_endpoints.get(
-            resource_group_name=resource_group,
-            account_name=account_name,
-            streaming_endpoint_name=streaming_endpoint_name
-        )
-
-        if streaming_endpoint.resource_state != "Running":
-            print(f"Streaming endpoint is stopped. Starting the endpoint named {streaming_endpoint_name}...")
-            poller = await client.streaming_endpoints.begin_start(resource_group, account_name, streaming_endpoint_name)
-            client_streaming_begin = await poller.result()
-            print("Streaming Endpoint started.")
-            if not client_streaming_begin:
-                print("Streaming Endpoint was already started.")
-
         # Get the URL to stream the Output
         print("The streaming URLs to stream the live output from a client player")
         print()
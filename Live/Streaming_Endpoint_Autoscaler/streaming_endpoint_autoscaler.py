@@ -0,0 +1,81 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# Azure Media Services streaming endpoint autoscaler sample for Python
+# A streaming endpoint that is scaled for the evening peak all day long pays for streaming units nobody uses.
+# This sample scales the streaming endpoint with begin_scale so that its capacity follows the audience:
+# it scales up when the egress gets close to the capacity of the endpoint and down when most of it is unused,
+# with at least min_seconds_between_scales between two scale operations.
+#
+# The audience comes from a metrics source. This sample replays a day of concurrent viewer counts from viewer_metrics.csv
+# as a dry run, which prints the scale decisions and how many unit hours they would have provisioned.
+# To scale a real endpoint, set dry_run to False and replace the replay with a FunctionMetricsSource that reads
+# the current egress or viewer count from your monitoring system.
+
+import asyncio
+from dotenv import load_dotenv
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.media.aio import AzureMediaServices
+import os
+
+# Import Job Helpers and the autoscaler
+from importlib.machinery import SourceFileLoader
+mymodule = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+autoscaler_module = SourceFileLoader("streaming_endpoint_autoscaler", "Common/streaming_endpoint_autoscaler.py").load_module()
+
+# Get the environment variables
+load_dotenv()
+
+default_credential = DefaultAzureCredential(exclude_shared_token_cache_credential=True)
+
+# Get the environment variables
+subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+resource_group = os.getenv('AZURE_RESOURCE_GROUP')
+account_name = os.getenv('AZURE_MEDIA_SERVICES_ACCOUNT_NAME')
+
+streaming_endpoint_name = 'default'     # Change this to your specific streaming endpoint name if not using "default"
+metrics_file = "Live/Streaming_Endpoint_Autoscaler/viewer_metrics.csv"
+dry_run = True
+
+# The AMS Client
+print("Creating AMS Client")
+client = AzureMediaServices(default_credential, subscription_id)
+
+# Send envs to helper function
+mymodule.set_account_name(account_name)
+mymodule.set_resource_group(resource_group)
+mymodule.set_subscription_id(subscription_id)
+mymodule.create_default_azure_credential(default_credential)
+mymodule.create_azure_media_services(client)
+
+
+async def main():
+    async with client:
+        metrics_source = autoscaler_module.ReplayMetricsSource(metrics_file)
+        autoscaler = autoscaler_module.StreamingEndpointAutoscaler(
+            streaming_endpoint_name,
+            metrics_source,
+            min_units=1,
+            max_units=20,
+            capacity_per_unit_mbps=200,     # Egress that one streaming unit serves
+            viewer_bitrate_mbps=3.0,        # Average bitrate that a viewer plays
+            target_utilization=0.7,         # Scale to the number of units that runs at 70%...
+            scale_up_threshold=0.8,         # ...once the demand is above 80% of the capacity...
+            scale_down_threshold=0.5,       # ...or below 50% of it
+            min_seconds_between_scales=600,
+            dry_run=dry_run)
+        await autoscaler.run()
+        print()
+        autoscaler.print_summary()
+
+    # closing media client
+    print('Closing media client')
+    await client.close()
+
+    # closing credential client
+    print('Closing credential client')
+    await default_credential.close()
+
+if __name__ == "__main__":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
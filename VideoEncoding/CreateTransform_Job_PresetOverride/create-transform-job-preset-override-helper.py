@@ -6,7 +6,6 @@ import asyncio
 from datetime import timedelta
 from dotenv import load_dotenv
 from azure.identity.aio import DefaultAzureCredential
-from azure.mgmt.media.aio import AzureMediaServices
 from azure.mgmt.media.models import (
   Transform,
   TransformOutput,
@@ -27,6 +26,7 @@ import os, random
 # Import Job Helpers
 from importlib.machinery import SourceFileLoader
 mymodule = SourceFileLoader("encoding_job_helpers", "Common/encoding_job_helpers.py").load_module()
+scheduler_module = SourceFileLoader("arm_request_scheduler", "Common/arm_request_scheduler.py").load_module()
 
 # Get environment variables
 load_dotenv()
@@ -40,8 +40,9 @@ resource_group = os.getenv('AZURE_RESOURCE_GROUP')
 account_name = os.getenv('AZURE_MEDIA_SERVICES_ACCOUNT_NAME')
 
 # The AMS Client
+# This sample submits a batch of jobs, so the client paces its ARM requests (job submission first) to stay clear of 429 throttling
 print("Creating AMS Client")
-client = AzureMediaServices(default_credential, subscription_id)
+client = scheduler_module.create_media_services_client(default_credential, subscription_id)
 
 
 # Send envs to helper function
@@ -106,11 +107,7 @@ async def main():
 
     print(f"Creating transform {transform_name}")
     try:
-      await client.transforms.create_or_update(
-        resource_group_name=resource_group,
-        account_name=account_name,
-        transform_name=transform_name,
-        parameters=my_transform)
+      await mymodule.create_or_update_transform(transform_name, my_transform)
       print(f"{transform_name} created (or updated if it existed already). ")
       print()
     except:
@@ -120,13 +117,6 @@ async def main():
     output_asset_name = f"{name_prefix}-output-{uniqueness}"
     job_name = f"{name_prefix}-job-{uniqueness}"
 
-    print(f"Creating the output asset (container) to encode the content into...")
-    output_asset = await client.assets.create_or_update(resource_group, account_name, output_asset_name, {})
-    if output_asset:
-        print("Output Asset created.")
-    else:
-        print("There was a problem creating an output asset.")
-
     print()
     print(f"Creating a new custom preset override and submitting the job to the empty transform {transform_name} job queue...")
 
@@ -159,10 +149,6 @@ async def main():
         ]
     )
 
-    # Submit the H264 encoding custom job, passing in the preset override defined above.
-    # print(f"Submitting the encoding job to the {transform_name} job queue...")
-    job = await mymodule.submit_job(transform_name, job_name, input, output_asset_name, standard_preset_h264)
-
     # Next, we will create another preset override that uses HEVC instead and submit it against the same simple transform
     # Create a new Preset Override to define a custom standard encoding preset
     standard_preset_HEVC = StandardEncoderPreset(
@@ -199,32 +185,31 @@ async def main():
     job_name_HEVC = job_name + '_HEVC'
     out_asset_name_HEVC = output_asset_name + '_HEVC'
 
-    # Create a new output asset
-    print(f"Creating a new output asset (container) to encode the content into...")
-    output_asset2 = await client.assets.create_or_update(resource_group, account_name, out_asset_name_HEVC, {})
-    if output_asset2:
-        print("Output Asset created.")
-    else:
-        print("There was a problem creating an output asset.")
+    # Create both output assets, submit both custom jobs with the preset overrides defined above, and wait for them together.
+    # The jobs are returned in the order in which they complete.
+    preset_overrides = [
+      (job_name, output_asset_name, standard_preset_h264),
+      (job_name_HEVC, out_asset_name_HEVC, standard_preset_HEVC)
+    ]
+    print(f"Waiting for encoding jobs to finish")
+    async for job, job_output_asset_name in mymodule.encode_preset_overrides(transform_name, input, preset_overrides):
+      print(f"Job {job.name} completed with state {job.state}")
 
-    # Submit the next HEVC custom job, passing in the preset override defined above.
-    job2 = await mymodule.submit_job(transform_name, job_name_HEVC, input, out_asset_name_HEVC, standard_preset_HEVC)
+      # Download the output of the H264 job once it has finished
+      if job.state == 'Finished' and job.name == job_name:
+        await mymodule.download_results(job_output_asset_name, output_folder)
+        print("Downloaded results to local folder. Please review the outputs from the encoding job.")
 
-    print(f"Waiting for encoding jobs to finish")
-    job = await mymodule.wait_for_job_to_finish(transform_name, job_name)
-    job2 = await mymodule.wait_for_job_to_finish(transform_name, job_name_HEVC)
-
-    # Wait for the first H264 job to finish and then download the output
-    if job.state == 'Finished':
-      await mymodule.download_results(output_asset_name, output_folder)
-      print("Downloaded results to local folder. Please review the outputs from the encoding job.")
-
-    # Uncomment the below to download the resulting files.
-    """
-    if job2.state == 'Finished':
-      await mymodule.download_results(out_asset_name_HEVC, output_folder)
-      print("Downloaded results to local folder. Please review the outputs from the encoding job.")
+      # Uncomment the below to download the resulting files of the HEVC job.
       """
+      if job.state == 'Finished' and job.name == job_name_HEVC:
+        await mymodule.download_results(job_output_asset_name, output_folder)
+        print("Downloaded results to local folder. Please review the outputs from the encoding job.")
+        """
+
+  # closing the pooled blob clients
+  print('Closing blob clients')
+  await mymodule.close_blob_clients()
 
   # closing media client
   print('Closing media client')
@@ -0,0 +1,78 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+# This sample shows how to export a live event archive (output from the LiveOutput) to MP4 files while the live event is still running.
+# The archive is cut into windows of a few minutes. As soon as a window has ended, a job on the CopyLiveArchiveToMP4 copy codec transform
+# clips it out of the archive into an MP4 asset of its own, so VOD clips of a 24/7 channel are available minutes after they were broadcast.
+#
+# The state of every window is saved to a JSON file in the temp directory, so the sample can be stopped and started again without exporting a window twice.
+
+import asyncio
+from dotenv import load_dotenv
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.media.aio import AzureMediaServices
+import os
+
+# Import Job Helpers
+from importlib.machinery import SourceFileLoader
+mymodule = SourceFileLoader('encoding_job_helpers', 'Common/encoding_job_helpers.py').load_module()
+live_module = SourceFileLoader('live_event_helpers', 'Common/live_event_helpers.py').load_module()
+
+# Get environment variables
+load_dotenv()
+
+
+default_credential = DefaultAzureCredential(exclude_shared_token_cache_credential=True)
+
+# Get the environment variables
+subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID')
+resource_group = os.getenv('AZURE_RESOURCE_GROUP')
+account_name = os.getenv('AZURE_MEDIA_SERVICES_ACCOUNT_NAME')
+
+# The AMS Client
+print("Creating AMS Client")
+client = AzureMediaServices(default_credential, subscription_id)
+
+# Send envs to helper function
+mymodule.set_account_name(account_name)
+mymodule.set_resource_group(resource_group)
+mymodule.set_subscription_id(subscription_id)
+mymodule.create_default_azure_credential(default_credential)
+mymodule.create_azure_media_services(client)
+
+# Set these to the Asset used in your LiveOutput (the archived live event Asset) and to the name of the live event
+live_event_name = "liveEvent-3009"
+live_output_name = "liveOutput-3009"
+input_archive_name = "archiveAsset-3009"
+
+# Length of the MP4 clips, and how long to keep exporting before the sample exports the rest of the archive and exits
+window_minutes = 10
+export_minutes = 60
+
+async def main():
+  async with client:
+    # The windows start when the live output started recording into the archive asset
+    live_output = await client.live_outputs.get(resource_group, account_name, live_event_name, live_output_name)
+    print(f"Live output {live_output_name} is recording into {live_output.asset_name} since {live_output.created}")
+
+    exporter = live_module.RollingArchiveExporter(input_archive_name, window_minutes=window_minutes, start_time=live_output.created)
+    await exporter.start()
+    try:
+      await asyncio.sleep(export_minutes * 60)
+    finally:
+      # Export what is left of the archive after the last full window, and wait for the running jobs
+      await exporter.close(export_remaining=True)
+    exporter.print_summary()
+
+  # closing media client
+  print('Closing media client')
+  await client.close()
+
+  # closing credential client
+  print('Closing credential client')
+  await default_credential.close()
+
+
+if __name__ == "__main__":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -11,6 +11,14 @@
 #      EVENTHUB_CONNECTION_STRING= ""
 #      EVENTHUB_NAME= ""
 #      CONSUMER_GROUP_NAME= "$Default"
+#
+# To get job completion pushed to this sample instead of polling for it, also add an Event Grid subscription with a
+# WebHook endpoint that reaches EVENTGRID_WEBHOOK_PORT on this machine (for example through a tunnel), at the path /api/events.
+# The webhook only listens on 127.0.0.1, so the tunnel has to run on this machine. To listen on another interface, pass
+# host and a secret to JobEventReceiver and add ?code=<secret> to the endpoint URL; without a secret anyone who can reach
+# the port could post fake job events.
+# Filter it on the Microsoft.Media.JobStateChange and Microsoft.Media.JobOutputProgress event types.
+#      EVENTGRID_WEBHOOK_PORT= "7071"
 
 import asyncio
 from datetime import timedelta
@@ -55,6 +63,7 @@ account_name = os.getenv('AZURE_MEDIA_SERVICES_ACCOUNT_NAME')
 # The EventGrid connection information for processing Event Grid subscription events for Media Services
 # TOPIC_KEY = os.getenv('EVENTGRID_TOPIC_KEY')
 endpoint = os.getenv('EVENTGRID_TOPIC_ENDPOINT')
+webhook_port = int(os.getenv('EVENTGRID_WEBHOOK_PORT', '7071'))
 
 # The AMS Client
 print("Creating AMS Client")
@@ -165,11 +174,7 @@ async def main():
 
     print(f"Creating transform {transform_name}")
     try:
-      await client.transforms.create_or_update(
-        resource_group_name=resource_group,
-        account_name=account_name,
-        transform_name=transform_name,
-        parameters=my_transform)
+      await mymodule.create_or_update_transform(transform_name, my_transform)
       print(f"{transform_name} created (or updated if it existed already). ")
       print()
     except:
@@ -191,12 +196,14 @@ async def main():
     print(event)
     eventgrid_client.send(event)
 
-    print()
-    print(f"Submitting the encoding job to the {transform_name} job queue...")
-    job = await mymodule.submit_job(transform_name, job_name, input, output_asset_name)
+    # Listen for the job events of the Event Grid subscription. Polling only happens every 2 minutes, in case an event is lost.
+    async with mymodule.JobEventReceiver(port=webhook_port, fallback_interval=120) as receiver:
+      print()
+      print(f"Submitting the encoding job to the {transform_name} job queue...")
+      job = await mymodule.submit_job(transform_name, job_name, input, output_asset_name)
 
-    print(f"Waiting for encoding job - {job.name} - to finish")
-    job = await mymodule.wait_for_job_to_finish(transform_name, job_name)
+      print(f"Waiting for encoding job - {job.name} - to finish")
+      job = await receiver.watch(transform_name, job_name)
 
     # Uncomment the below to download the results.
     """
@@ -205,6 +212,10 @@ async def main():
       print("Downloaded results to local folder. Please review the outputs from the encoding job.")
     """
 
+  # closing the pooled blob clients
+  print('Closing blob clients')
+  await mymodule.close_blob_clients()
+
   # closing media client
   print('Closing media client')
   await client.close()
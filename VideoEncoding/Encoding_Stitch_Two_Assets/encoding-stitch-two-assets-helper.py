@@ -98,11 +98,7 @@ async def main():
 
     print(f"Creating transform {transform_name}")
     try:
-      await client.transforms.create_or_update(
-        resource_group_name=resource_group,
-        account_name=account_name,
-        transform_name=transform_name,
-        parameters=my_transform)
+      await mymodule.create_or_update_transform(transform_name, my_transform)
       print(f"{transform_name} created (or updated if it existed already). ")
       print()
     except:
@@ -113,11 +109,11 @@ async def main():
     bumper_asset_name = f"bumper-{uniqueness}"
 
     try:
-      # Create a new Asset and upload the 1st specified local video file into it. This is our video "bumper" to stitch to the front.
-      main_input = await mymodule.create_input_asset(main_asset_name, source_file)   # This creates and uploads the main video file
-
-      # Create a second Asset and upload the 2nd specified local video file into it.
-      bumper_input = await mymodule.create_input_asset(bumper_asset_name, bumper_file)     # This creates and uploads the second video file.
+      # Create the two Assets and upload the main video file and the "bumper" video file into them at the same time.
+      main_input, bumper_input = await mymodule.create_input_assets([
+        (main_asset_name, source_file),     # This creates and uploads the main video file
+        (bumper_asset_name, bumper_file)    # This creates and uploads the second video file.
+      ])
     except:
       raise ValueError("Error: Input assets were not created properly.")
 
@@ -192,6 +188,10 @@ async def main():
       print("Downloaded results to local folder. Please review the outputs from the encoding job.")
     """
 
+  # closing the pooled blob clients
+  print('Closing blob clients')
+  await mymodule.close_blob_clients()
+
   # closing media client
   print('Closing media client')
   await client.close()